@@ -11,8 +11,11 @@ class EmailAlerter:
         self.email_from = os.getenv("EMAIL_FROM")
         self.email_to = os.getenv("EMAIL_TO")
 
+    def _configured(self) -> bool:
+        return bool(self.host and self.user and self.password and self.email_from and self.email_to)
+
     def notify(self, transition: dict):
-        if not (self.host and self.user and self.password and self.email_from and self.email_to):
+        if not self._configured():
             return
         msg = EmailMessage()
         msg["Subject"] = f"[CI/CD] {transition.get('provider')} {transition.get('pipeline')} -> {transition.get('status_new')}"
@@ -20,6 +23,20 @@ class EmailAlerter:
         msg["To"] = self.email_to
         body = f"Pipeline: {transition.get('pipeline')}\nProvider: {transition.get('provider')}\nStatus: {transition.get('status_old')} -> {transition.get('status_new')}\nURL: {transition.get('web_url')}\nDuration: {transition.get('duration_seconds')}s\n"
         msg.set_content(body)
+        self._send(msg)
+
+    def notify_anomaly(self, event: dict):
+        if not self._configured():
+            return
+        msg = EmailMessage()
+        msg["Subject"] = f"[CI/CD] {event.get('provider')} {event.get('pipeline')}: {event['kind'].replace('_', ' ')}"
+        msg["From"] = self.email_from
+        msg["To"] = self.email_to
+        body = "\n".join(f"{k}: {v}" for k, v in event.items()) + "\n"
+        msg.set_content(body)
+        self._send(msg)
+
+    def _send(self, msg: EmailMessage):
         with smtplib.SMTP(self.host, self.port) as s:
             s.starttls()
             s.login(self.user, self.password)
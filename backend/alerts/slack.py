@@ -16,6 +16,26 @@ class SlackAlerter:
                 {"type":"context","elements":[{"type":"mrkdwn","text":transition.get("web_url","")}]}
             ]
         }
+        self._post(payload)
+
+    def notify_anomaly(self, event: dict):
+        if not self.webhook:
+            return
+        if event["kind"] == "duration_regression":
+            detail = f"build time {event.get('duration_seconds')}s vs ~{event.get('baseline_seconds')}s baseline"
+        else:
+            detail = f"failure rate {event.get('failure_rate'):.0%} vs {event.get('baseline_failure_rate'):.0%} baseline"
+        text = f"[{event.get('provider')}] {event.get('pipeline')}: {event['kind'].replace('_', ' ')} ({detail})"
+        payload = {
+            "text": text,
+            "blocks": [
+                {"type":"section","text":{"type":"mrkdwn","text":f"*Pipeline Anomaly*\n{text}"}},
+                {"type":"context","elements":[{"type":"mrkdwn","text":event.get("web_url") or ""}]}
+            ]
+        }
+        self._post(payload)
+
+    def _post(self, payload: dict):
         try:
             with httpx.Client(timeout=10) as c:
                 c.post(self.webhook, json=payload)
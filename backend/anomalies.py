@@ -0,0 +1,158 @@
+"""
+Streaming per-pipeline anomaly detection on the ingest path.
+
+Every completed build updates its pipeline's state in O(1):
+- duration: EWMA mean/variance of log(duration) plus a one-sided CUSUM of the
+  standardized values; the CUSUM crossing DETECTOR_CUSUM_H is a regression
+- failures: a fast and a slow EWMA of the failure indicator; the fast one rising
+  DETECTOR_FAILURE_DELTA above the slow baseline is a spike
+
+State lives in detector_states and is advanced inside the ingest transaction,
+which writers enter one at a time, so every worker feeds the same state and each
+build is counted once. Events are stored in anomaly_events by that transaction,
+so /api/anomalies lists those of every worker, and are published by the worker
+that raised them once it commits; historical builds are never scanned.
+"""
+
+import os
+import json
+import math
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, delete, event
+from db import SessionLocal, DetectorState, AnomalyEvent
+from collectors.base import FAILED_STATUSES
+
+DURATION_ALPHA = float(os.getenv("DETECTOR_DURATION_ALPHA", "0.05"))
+CUSUM_K = float(os.getenv("DETECTOR_CUSUM_K", "0.5"))  # slack, in standard deviations
+CUSUM_H = float(os.getenv("DETECTOR_CUSUM_H", "5"))
+FAILURE_FAST_ALPHA = float(os.getenv("DETECTOR_FAILURE_FAST_ALPHA", "0.3"))
+FAILURE_SLOW_ALPHA = float(os.getenv("DETECTOR_FAILURE_SLOW_ALPHA", "0.03"))
+FAILURE_DELTA = float(os.getenv("DETECTOR_FAILURE_DELTA", "0.3"))
+MIN_BUILDS = int(os.getenv("DETECTOR_MIN_BUILDS", "20"))  # warm-up before a pipeline can alert
+RETENTION = timedelta(days=int(os.getenv("DETECTOR_EVENT_RETENTION_DAYS", "90")))
+
+COUNTED_STATUSES = FAILED_STATUSES | {"success"}  # cancelled/skipped runs say nothing about health
+
+class PipelineState:
+    __slots__ = ("n", "mean", "var", "cusum", "fail_n", "fail_fast", "fail_slow", "spiking")
+
+    def __init__(self, n=0, mean=0.0, var=0.0, cusum=0.0, fail_n=0, fail_fast=0.0, fail_slow=0.0, spiking=False):
+        self.n, self.mean, self.var, self.cusum = n, mean, var, cusum
+        self.fail_n, self.fail_fast, self.fail_slow, self.spiking = fail_n, fail_fast, fail_slow, spiking
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def observe_duration(self, seconds: int) -> float | None:
+        """Update with one duration; return the CUSUM score when it signals a regression"""
+        x = math.log1p(max(seconds, 0))
+        alarm = None
+        if self.n == 0:
+            self.mean = x
+        else:
+            if self.n >= MIN_BUILDS and self.var > 0:
+                self.cusum = max(0.0, self.cusum + (x - self.mean) / math.sqrt(self.var) - CUSUM_K)
+                if self.cusum > CUSUM_H:
+                    alarm = self.cusum
+                    self.cusum = 0.0
+            diff = x - self.mean
+            incr = DURATION_ALPHA * diff
+            self.mean += incr
+            self.var = (1 - DURATION_ALPHA) * (self.var + diff * incr)
+        self.n += 1
+        return alarm
+
+    def observe_result(self, failed: bool) -> bool:
+        """Update with one pass/fail; return True when a failure spike starts"""
+        x = 1.0 if failed else 0.0
+        if self.fail_n == 0:
+            self.fail_slow = x
+        self.fail_fast += FAILURE_FAST_ALPHA * (x - self.fail_fast)
+        self.fail_slow += FAILURE_SLOW_ALPHA * (x - self.fail_slow)
+        self.fail_n += 1
+        excess = self.fail_fast - self.fail_slow
+        if self.spiking:
+            if excess < FAILURE_DELTA / 2:
+                self.spiking = False
+            return False
+        if self.fail_n >= MIN_BUILDS and excess >= FAILURE_DELTA:
+            self.spiking = True
+            return True
+        return False
+
+_lock = threading.Lock()
+_pending: deque = deque(maxlen=1000)  # events raised by this worker, not yet published
+
+def _event(kind: str, change, **details) -> dict:
+    r = change.result
+    return {
+        "kind": kind,
+        "pipeline": r.pipeline_name,
+        "provider": r.provider,
+        "external_id": r.external_id,
+        "status": r.status,
+        "duration_seconds": r.duration_seconds,
+        "web_url": r.web_url,
+        "detected_at": datetime.now(timezone.utc).isoformat(),
+        **details,
+    }
+
+def on_transaction(session, changes):
+    """Ingest hook: feed each newly completed build to its pipeline's detectors"""
+    completed = [c for c in changes if c.is_completion() and c.result.status in COUNTED_STATUSES]
+    if not completed:
+        return
+    rows = {
+        row.pipeline_id: row for row in session.execute(
+            select(DetectorState).where(DetectorState.pipeline_id.in_({c.pipeline_id for c in completed})).with_for_update()
+        ).scalars()
+    }
+    states = {pid: PipelineState(**json.loads(row.state)) for pid, row in rows.items()}
+    events = []  # (pipeline_id, event)
+    for change in completed:
+        state = states.setdefault(change.pipeline_id, PipelineState())
+        baseline = math.expm1(state.mean) if state.n else None
+        score = state.observe_duration(change.result.duration_seconds)
+        if score is not None:
+            events.append((change.pipeline_id, _event("duration_regression", change, baseline_seconds=round(baseline, 1), cusum=round(score, 2))))
+        failed = change.result.status in FAILED_STATUSES
+        baseline_rate = state.fail_slow
+        if state.observe_result(failed):
+            events.append((change.pipeline_id, _event(
+                "failure_spike", change,
+                failure_rate=round(state.fail_fast, 3), baseline_failure_rate=round(baseline_rate, 3),
+            )))
+    now = datetime.now(timezone.utc)
+    for pid, state in states.items():
+        row = rows.get(pid)
+        if row is None:
+            session.add(DetectorState(pipeline_id=pid, state=json.dumps(state.to_dict()), updated_at=now))
+        else:
+            row.state, row.updated_at = json.dumps(state.to_dict()), now
+    if events:
+        session.execute(delete(AnomalyEvent).where(AnomalyEvent.detected_at < now - RETENTION))
+        session.add_all(AnomalyEvent(pipeline_id=pid, detected_at=now, event=json.dumps(e)) for pid, e in events)
+        raised = [e for _, e in events]
+        event.listen(session, "after_commit", lambda _: _raise(raised), once=True)
+
+def _raise(events: list[dict]):
+    with _lock:
+        _pending.extend(events)
+
+def recent(session, limit: int) -> list[dict]:
+    """The `limit` latest stored events, newest first"""
+    rows = session.scalars(select(AnomalyEvent.event).order_by(AnomalyEvent.id.desc()).limit(limit))
+    return [json.loads(row) for row in rows]
+
+def drain() -> list[dict]:
+    """Events raised since the last call, for publishing"""
+    with _lock:
+        events = list(_pending)
+        _pending.clear()
+    return events
+
+def stats() -> dict:
+    return {"pending_events": len(_pending)}
@@ -1,27 +1,45 @@
 
 import os
+import time
 import asyncio
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from typing import Optional, List
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Query, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from sqlalchemy import select, func, and_, desc
+from sqlalchemy import select, func, case, and_, desc
 
-from db import get_session, Build, Pipeline, init_db
-from collectors.base import CollectorResult, upsert_builds
-from collectors.github import GitHubCollector
-from collectors.gitlab import GitLabCollector
-from collectors.jenkins import JenkinsCollector
-from alerts.slack import SlackAlerter
-from alerts.emailer import EmailAlerter
-from sample_data import seed_sample_data
+from db import Build, Pipeline, utc_day, init_db, leader_lock, detect_compact_layout, build_web_url, STATUSES
+import ingest
+from plugins import load_collectors, load_alerters
+from responses import json_response, encoded_response, rows_as_dicts
+import data_version
+import pipeline_cache
+import fingerprints
+import sketches
+import anomalies
+import build_events
+import reliability
+import flaky
+import status_matrix
+import export
+import rollups
+import migrations
+from replica import get_read_session, get_analytics_session
+import replica
+from collectors import ratelimit
+from instrumentation import instrumentation_middleware, track_queries, register_gauge, snapshot as instrumentation_snapshot
 
 # Import webhook routes
 from routes import webhooks
 
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
+# Schema setup runs once per deployment (leader only) unless disabled in favour of `seed_db.py --action init`
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true"
+SEED_SAMPLE_DATA = os.getenv("SEED_SAMPLE_DATA", "false").lower() == "true"
+PROCESS_STARTED_AT = time.time()
 
 app = FastAPI(title="CI/CD Pipeline Health Dashboard API")
 
@@ -33,14 +51,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# per-request DB statement counting, slow-query log and opt-in profiling
+app.middleware("http")(instrumentation_middleware)
+# ETag / 304 for read endpoints, answered from the in-memory data version
+app.middleware("http")(data_version.etag_middleware)
+
+# an online layout change (seed_db.py --action compact) bumps the schema version
+data_version.watch(data_version.SCHEMA, detect_compact_layout)
+data_version.watch(data_version.SCHEMA, pipeline_cache.warm)
+data_version.watch(data_version.PURGE, fingerprints.clear)
+# a worker registered or finished backfilling a time zone's local rollups
+data_version.watch(data_version.ROLLUP_ZONES, rollups.reload)
+register_gauge("pipeline_cache", pipeline_cache.stats)
+register_gauge("fingerprints", fingerprints.stats)
+register_gauge("anomalies", anomalies.stats)
+register_gauge("flaky", flaky.stats)
+register_gauge("migrations", migrations.stats)
+register_gauge("replica", replica.stats)
+register_gauge("ratelimit", ratelimit.stats)
+
 # register webhooks router
 app.include_router(webhooks.router)
 
-# DB init
-init_db()
-# Seed with sample data for demo
-seed_sample_data()
-
 class MetricsOverview(BaseModel):
     success_rate: float
     failure_rate: float
@@ -76,7 +108,7 @@ class PipelineMetrics(BaseModel):
     last_build_at: Optional[datetime]
 
 @app.get("/api/metrics/overview", response_model=MetricsOverview)
-def metrics_overview(session=Depends(get_session)):
+def metrics_overview(session=Depends(get_analytics_session)):
     total = session.scalar(select(func.count()).select_from(Build)) or 0
     success = session.scalar(select(func.count()).select_from(Build).where(Build.status=="success")) or 0
     failure = session.scalar(select(func.count()).select_from(Build).where(Build.status=="failed")) or 0
@@ -92,7 +124,7 @@ def metrics_overview(session=Depends(get_session)):
     today = datetime.now().date()
     week_ago = today - timedelta(days=7)
     builds_today = session.scalar(select(func.count()).select_from(Build).where(
-        func.date(Build.started_at) == today
+        utc_day(Build.started_at) == today
     )) or 0
     builds_this_week = session.scalar(select(func.count()).select_from(Build).where(
         Build.started_at >= week_ago
@@ -113,8 +145,9 @@ def metrics_overview(session=Depends(get_session)):
 
 @app.get("/api/metrics/chart-data", response_model=List[ChartDataPoint])
 def get_chart_data(
+    request: Request,
     days: int = Query(default=7, ge=1, le=30),
-    session=Depends(get_session)
+    session=Depends(get_analytics_session)
 ):
     """Get time-series chart data for the specified number of days"""
     end_date = datetime.now()
@@ -122,83 +155,81 @@ def get_chart_data(
     
     # Group builds by day and calculate metrics
     stmt = select(
-        func.date(Build.started_at).label('date'),
+        utc_day(Build.started_at).label('date'),
         func.count().label('total'),
-        func.sum(func.case((Build.status == 'success', 1), else_=0)).label('success'),
-        func.sum(func.case((Build.status == 'failed', 1), else_=0)).label('failed'),
-        func.sum(func.case((Build.status == 'running', 1), else_=0)).label('running'),
+        func.sum(case((Build.status == 'success', 1), else_=0)).label('success'),
+        func.sum(case((Build.status == 'failed', 1), else_=0)).label('failed'),
+        func.sum(case((Build.status == 'running', 1), else_=0)).label('running'),
         func.avg(Build.duration_seconds).label('avg_duration')
     ).where(
         Build.started_at >= start_date
     ).group_by(
-        func.date(Build.started_at)
+        utc_day(Build.started_at)
     ).order_by(
-        func.date(Build.started_at)
+        utc_day(Build.started_at)
     )
     
     results = session.execute(stmt).all()
     
-    chart_data = []
-    for row in results:
-        chart_data.append(ChartDataPoint(
-            time=row.date.strftime('%m/%d'),
-            success=row.success or 0,
-            failed=row.failed or 0,
-            running=row.running or 0,
-            avg_duration=float(row.avg_duration) if row.avg_duration else 0.0
-        ))
+    chart_data = [{
+        "time": row.date.strftime('%m/%d'),
+        "success": row.success or 0,
+        "failed": row.failed or 0,
+        "running": row.running or 0,
+        "avg_duration": float(row.avg_duration) if row.avg_duration else 0.0,
+    } for row in results]
     
-    return chart_data
+    return json_response(request, chart_data)
 
 @app.get("/api/metrics/build-trends", response_model=List[BuildTrendData])
 def get_build_trends(
+    request: Request,
     days: int = Query(default=14, ge=1, le=90),
-    session=Depends(get_session)
+    session=Depends(get_analytics_session)
 ):
     """Get build trend data over time"""
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
     
     stmt = select(
-        func.date(Build.started_at).label('date'),
+        utc_day(Build.started_at).label('date'),
         func.count().label('total_builds'),
-        func.sum(func.case((Build.status == 'success', 1), else_=0)).label('success_count'),
-        func.sum(func.case((Build.status == 'failed', 1), else_=0)).label('failure_count'),
+        func.sum(case((Build.status == 'success', 1), else_=0)).label('success_count'),
+        func.sum(case((Build.status == 'failed', 1), else_=0)).label('failure_count'),
         func.avg(Build.duration_seconds).label('avg_duration')
     ).where(
         Build.started_at >= start_date
     ).group_by(
-        func.date(Build.started_at)
+        utc_day(Build.started_at)
     ).order_by(
-        func.date(Build.started_at)
+        utc_day(Build.started_at)
     )
     
     results = session.execute(stmt).all()
     
-    trend_data = []
-    for row in results:
-        trend_data.append(BuildTrendData(
-            date=row.date.strftime('%Y-%m-%d'),
-            total_builds=row.total_builds or 0,
-            success_count=row.success_count or 0,
-            failure_count=row.failure_count or 0,
-            avg_duration=float(row.avg_duration) if row.avg_duration else 0.0
-        ))
+    trend_data = [{
+        "date": row.date.strftime('%Y-%m-%d'),
+        "total_builds": row.total_builds or 0,
+        "success_count": row.success_count or 0,
+        "failure_count": row.failure_count or 0,
+        "avg_duration": float(row.avg_duration) if row.avg_duration else 0.0,
+    } for row in results]
     
-    return trend_data
+    return json_response(request, trend_data)
 
 @app.get("/api/metrics/pipeline-performance", response_model=List[PipelineMetrics])
 def get_pipeline_performance(
+    request: Request,
     limit: int = Query(default=10, ge=1, le=50),
-    session=Depends(get_session)
+    session=Depends(get_analytics_session)
 ):
     """Get performance metrics for individual pipelines"""
-    stmt = select(
+    top = select(
+        Pipeline.id,
         Pipeline.name,
         func.count(Build.id).label('total_builds'),
-        func.avg(func.case((Build.status == 'success', 1), else_=0)).label('success_rate'),
+        func.avg(case((Build.status == 'success', 1), else_=0)).label('success_rate'),
         func.avg(Build.duration_seconds).label('avg_duration'),
-        func.max(Build.status).label('last_build_status'),
         func.max(Build.started_at).label('last_build_at')
     ).join(
         Build, Pipeline.id == Build.pipeline_id
@@ -206,22 +237,224 @@ def get_pipeline_performance(
         Pipeline.id, Pipeline.name
     ).order_by(
         desc(func.count(Build.id))
-    ).limit(limit)
+    ).limit(limit).subquery()
+    # the status of each pipeline's latest build, not the max over its builds (codes in the compact layout)
+    last_status = select(Build.status).where(Build.pipeline_id == top.c.id).order_by(
+        Build.started_at.desc().nulls_last(), Build.id.desc()
+    ).limit(1).scalar_subquery()
+    stmt = select(top, last_status.label('last_build_status')).order_by(desc(top.c.total_builds))
     
     results = session.execute(stmt).all()
     
-    pipeline_metrics = []
-    for row in results:
-        pipeline_metrics.append(PipelineMetrics(
-            pipeline_name=row.name,
-            total_builds=row.total_builds or 0,
-            success_rate=round((row.success_rate or 0) * 100, 2),
-            avg_duration=float(row.avg_duration) if row.avg_duration else 0.0,
-            last_build_status=row.last_build_status or 'unknown',
-            last_build_at=row.last_build_at
-        ))
+    pipeline_metrics = [{
+        "pipeline_name": row.name,
+        "total_builds": row.total_builds or 0,
+        "success_rate": round(float(row.success_rate or 0) * 100, 2),
+        "avg_duration": float(row.avg_duration) if row.avg_duration else 0.0,
+        "last_build_status": row.last_build_status or 'unknown',
+        "last_build_at": row.last_build_at,
+    } for row in results]
     
-    return pipeline_metrics
+    return json_response(request, pipeline_metrics)
+
+@app.get("/api/metrics/timeseries")
+def get_timeseries(
+    request: Request,
+    from_: Optional[datetime] = Query(default=None, alias="from", description="Defaults to 7 days before 'to'"),
+    to: Optional[datetime] = Query(default=None, description="Defaults to now"),
+    step: Optional[str] = Query(default=None, description="e.g. 15m, 1h, 1d, 1w; widened to fit max_points"),
+    tz: str = Query(default="UTC", description="IANA time zone the steps align to"),
+    max_points: int = Query(default=rollups.MAX_POINTS, ge=2, le=2000),
+    provider: Optional[str] = None,
+    session=Depends(get_read_session),
+):
+    """Build counts and average duration per step over any range, read from pre-aggregated rollups"""
+    to = to or datetime.now(timezone.utc)
+    from_ = from_ or to - timedelta(days=7)
+    try:
+        body = rollups.series(session, from_, to, tz, step, max_points, provider)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json_response(request, body)
+
+@app.get("/api/metrics/duration-percentiles")
+def get_duration_percentiles(
+    request: Request,
+    days: int = Query(default=30, ge=1, le=3650),
+    until: Optional[date] = Query(default=None),
+    provider: Optional[str] = Query(default=None),
+    pipeline: Optional[str] = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=1000),
+    session=Depends(get_read_session)
+):
+    """p50/p95/p99 build duration per pipeline over the last `days` days, merged from daily sketches"""
+    until = until or datetime.utcnow().date()
+    since = until - timedelta(days=days - 1)
+    ids = _matching_pipeline_ids(session, provider, pipeline) if provider or pipeline else None
+    merged = sketches.load(session, since, until, ids)
+    pipelines = pipeline_cache.resolve(session, list(merged))
+    overall = sketches.Sketch()
+
+    def summary(sketch):
+        return {
+            "builds": sketch.count,
+            "p50": _round(sketch.quantile(0.50)),
+            "p95": _round(sketch.quantile(0.95)),
+            "p99": _round(sketch.quantile(0.99)),
+        }
+
+    rows = []
+    for pipeline_id, sketch in sorted(merged.items(), key=lambda kv: -kv[1].count)[:limit]:
+        info = pipelines.get(pipeline_id)
+        if info is None:
+            continue
+        rows.append({"pipeline": info.name, "provider": info.provider, **summary(sketch)})
+    for sketch in merged.values():
+        overall.merge(sketch)
+    return json_response(request, {
+        "since": since,
+        "until": until,
+        "relative_accuracy": sketches.ACCURACY,
+        "overall": summary(overall),
+        "pipelines": rows,
+    })
+
+@app.get("/api/metrics/reliability")
+def get_reliability(
+    request: Request,
+    days: int = Query(default=30, ge=1, le=3650),
+    until: Optional[date] = Query(default=None),
+    provider: Optional[str] = Query(default=None),
+    pipeline: Optional[str] = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=1000),
+    session=Depends(get_read_session)
+):
+    """MTTR, failure and failure-onset rates and streaks per pipeline over the last `days` days"""
+    until = until or datetime.utcnow().date()
+    since = until - timedelta(days=days - 1)
+    ids = _matching_pipeline_ids(session, provider, pipeline) if provider or pipeline else None
+    counters = reliability.window(session, since, until, ids)
+    states = reliability.current(session, list(counters))
+    pipelines = pipeline_cache.resolve(session, list(counters))
+
+    def summary(c):
+        return {
+            "builds": c["builds"],
+            "failures": c["failures"],
+            "failure_rate": round(c["failures"] / c["builds"] * 100, 2) if c["builds"] else 0.0,
+            # share of builds that turned a green pipeline red; builds are not deployments, so not DORA's CFR
+            "failure_onset_rate": round(c["failure_onsets"] / c["builds"] * 100, 2) if c["builds"] else 0.0,
+            "recoveries": c["recoveries"],
+            "mttr_seconds": round(c["recovery_seconds"] / c["recoveries"], 1) if c["recoveries"] else None,
+            "longest_failure_streak": c["longest_failure_streak"],
+        }
+
+    rows = []
+    totals = dict.fromkeys(("builds", "failures", "failure_onsets", "recoveries", "recovery_seconds", "longest_failure_streak"), 0)
+    for pipeline_id, c in counters.items():
+        for k in totals:
+            totals[k] = max(totals[k], c[k]) if k == "longest_failure_streak" else totals[k] + c[k]
+        info = pipelines.get(pipeline_id)
+        if info is None:
+            continue
+        state = states.get(pipeline_id)
+        rows.append({
+            "pipeline": info.name,
+            "provider": info.provider,
+            **summary(c),
+            "current_streak": {"status": state.streak_status, "length": state.streak_length} if state else None,
+            "failing_since": state.failing_since if state else None,
+        })
+    rows.sort(key=lambda r: (-r["failure_rate"], r["pipeline"]))
+    return json_response(request, {
+        "since": since,
+        "until": until,
+        "overall": summary(totals),
+        "pipelines": rows[:limit],
+    })
+
+@app.get("/api/metrics/flaky")
+def get_flaky(
+    request: Request,
+    provider: Optional[str] = Query(default=None),
+    min_builds: int = Query(default=flaky.MIN_BUILDS, ge=2),
+    limit: int = Query(default=20, ge=1, le=500),
+    session=Depends(get_read_session)
+):
+    """Pipelines ranked by flakiness over their last FLAKY_HISTORY completed builds"""
+    ranked = flaky.ranking(provider, min_builds)[:limit]
+    pipelines = pipeline_cache.resolve(session, [pid for pid, _ in ranked])
+    return json_response(request, [
+        {"pipeline": pipelines[pid].name, "provider": pipelines[pid].provider, **s}
+        for pid, s in ranked if pid in pipelines
+    ])
+
+@app.get("/api/metrics/sparklines")
+def get_sparklines(
+    request: Request,
+    n: int = Query(default=20, ge=1, le=flaky.HISTORY),
+    provider: Optional[str] = Query(default=None),
+    session=Depends(get_read_session)
+):
+    """Last `n` completed build statuses of every pipeline as codes into `statuses`, oldest first"""
+    lines = flaky.sparklines(n, provider)
+    pipelines = pipeline_cache.resolve(session, list(lines))
+    return json_response(request, {
+        "statuses": STATUSES,
+        "pipelines": [
+            {"pipeline": pipelines[pid].name, "provider": pipelines[pid].provider, "codes": codes}
+            for pid, codes in lines.items() if pid in pipelines
+        ],
+    })
+
+@app.get("/api/metrics/status-matrix")
+def get_status_matrix(
+    request: Request,
+    n: int = Query(default=20, ge=1, le=100),
+    provider: Optional[str] = Query(default=None),
+    q: Optional[str] = Query(default=None),
+    format: str = Query(default="json", pattern="^(json|binary)$"),
+    session=Depends(get_read_session)
+):
+    """Last `n` builds (status code + duration) of every pipeline in one response, oldest first.
+
+    `format=binary` (or Accept: application/octet-stream) returns the packed
+    layout documented in status_matrix.py instead of JSON arrays.
+    """
+    ids = _matching_pipeline_ids(session, provider, q) if provider or q else None
+    matrix = status_matrix.get(session, n, ids, key=(provider, q))
+    info = pipeline_cache.resolve(session, matrix.pipeline_ids)
+    pipelines = [
+        {"pipeline": info[pid].name, "provider": info[pid].provider} if pid in info else {"pipeline": None, "provider": None}
+        for pid in matrix.pipeline_ids
+    ]
+    if format == "binary" or "application/octet-stream" in request.headers.get("accept", ""):
+        return encoded_response(request, status_matrix.encode_binary(matrix, pipelines), "application/octet-stream")
+    codes, durations = [], []
+    for i in range(len(pipelines)):
+        row_codes, row_durations = matrix.row(i)
+        codes.append([None if c == status_matrix.NO_BUILD else c for c in row_codes])
+        durations.append([None if d == status_matrix.NO_DURATION else d for d in row_durations])
+    return json_response(request, {
+        "n": n,
+        "statuses": STATUSES,
+        "pipelines": pipelines,
+        "codes": codes,
+        "durations": durations,
+    })
+
+def _matching_pipeline_ids(session, provider, q):
+    if pipeline_cache.is_warm():
+        return pipeline_cache.ids_matching(provider, q)
+    stmt = select(Pipeline.id)
+    if provider:
+        stmt = stmt.where(Pipeline.provider==provider)
+    if q:
+        stmt = stmt.where(Pipeline.name.ilike(f"%{q}%"))
+    return session.scalars(stmt).all()
+
+def _round(value):
+    return round(value, 1) if value is not None else None
 
 class BuildOut(BaseModel):
     id: int
@@ -234,13 +467,24 @@ class BuildOut(BaseModel):
 
 @app.get("/api/builds", response_model=List[BuildOut])
 def list_builds(
+    request: Request,
     provider: Optional[str] = Query(default=None),
     status: Optional[str] = Query(default=None),
     limit: int = Query(default=50, ge=1, le=500),
     q: Optional[str] = Query(default=None),
-    session=Depends(get_session),
+    session=Depends(get_read_session),
 ):
-    stmt = select(Build, Pipeline).join(Pipeline, Build.pipeline_id==Pipeline.id).order_by(Build.started_at.desc()).limit(limit)
+    if pipeline_cache.is_warm():
+        return json_response(request, _list_builds_cached(session, provider, status, limit, q))
+    stmt = select(
+        Build.id,
+        Pipeline.provider,
+        Pipeline.name.label("pipeline"),
+        Build.status,
+        Build.duration_seconds,
+        Build.started_at,
+        func.coalesce(Build.web_url, func.replace(Pipeline.build_url_template, "{external_id}", Build.external_id)).label("web_url"),
+    ).join(Pipeline, Build.pipeline_id==Pipeline.id).order_by(Build.started_at.desc()).limit(limit)
     if provider:
         stmt = stmt.where(Pipeline.provider==provider)
     if status:
@@ -248,22 +492,34 @@ def list_builds(
     if q:
         like = f"%{q}%"
         stmt = stmt.where(Pipeline.name.ilike(like))
+    return json_response(request, rows_as_dicts(session.execute(stmt)))
+
+def _list_builds_cached(session, provider, status, limit, q):
+    """list_builds without the pipelines join: filters and names come from the pipeline registry"""
+    stmt = select(
+        Build.id, Build.pipeline_id, Build.status, Build.duration_seconds, Build.started_at, Build.web_url, Build.external_id,
+    ).order_by(Build.started_at.desc()).limit(limit)
+    if provider or q:
+        ids = pipeline_cache.ids_matching(provider, q)
+        if not ids:
+            return []
+        stmt = stmt.where(Build.pipeline_id.in_(ids))
+    if status:
+        stmt = stmt.where(Build.status==status)
     rows = session.execute(stmt).all()
-    results = []
-    for b, p in rows:
-        results.append(BuildOut(
-            id=b.id,
-            provider=p.provider,
-            pipeline=p.name,
-            status=b.status,
-            duration_seconds=b.duration_seconds,
-            started_at=b.started_at,
-            web_url=b.web_url,
-        ))
-    return results
+    pipelines = pipeline_cache.resolve(session, [r.pipeline_id for r in rows])
+    return [{
+        "id": r.id,
+        "provider": pipelines[r.pipeline_id].provider,
+        "pipeline": pipelines[r.pipeline_id].name,
+        "status": r.status,
+        "duration_seconds": r.duration_seconds,
+        "started_at": r.started_at,
+        "web_url": build_web_url(r.web_url, pipelines[r.pipeline_id].url_template, r.external_id),
+    } for r in rows if r.pipeline_id in pipelines]
 
 @app.get("/api/builds/{build_id}")
-def get_build(build_id: int, session=Depends(get_session)):
+def get_build(build_id: int, session=Depends(get_read_session)):
     row = session.execute(select(Build, Pipeline).join(Pipeline, Build.pipeline_id==Pipeline.id).where(Build.id==build_id)).first()
     if not row:
         return {"error": "not found"}
@@ -271,18 +527,74 @@ def get_build(build_id: int, session=Depends(get_session)):
     return {
         "id": b.id, "provider": p.provider, "pipeline": p.name, "status": b.status,
         "duration_seconds": b.duration_seconds, "started_at": b.started_at, "finished_at": b.finished_at,
-        "web_url": b.web_url, "external_id": b.external_id, "logs": b.logs
+        "web_url": build_web_url(b.web_url, p.build_url_template, b.external_id), "external_id": b.external_id, "logs": b.logs
     }
 
 @app.get("/api/logs/{provider}/{external_id}")
-def get_logs(provider: str, external_id: str):
+def get_logs(provider: str, external_id: str, session=Depends(get_read_session)):
     # For demo, we do not persist full logs. Return logs column if available or instruct to fetch from provider.
-    with next(get_session()) as session:
-        row = session.execute(select(Build).where(Build.external_id==external_id)).scalar_one_or_none()
-        if row and getattr(row, "logs", None):
-            return {"provider": provider, "external_id": external_id, "logs": row.logs}
+    row = session.execute(select(Build).where(Build.external_id==external_id)).scalar_one_or_none()
+    if row and getattr(row, "logs", None):
+        return {"provider": provider, "external_id": external_id, "logs": row.logs}
     return {"provider": provider, "external_id": external_id, "logs": "Log retrieval not implemented in demo. Use provider UI."}
 
+@app.get("/api/health")
+def health():
+    """Liveness probe; never touches the database"""
+    return {"ok": True, "uptime_seconds": round(time.time() - PROCESS_STARTED_AT, 3)}
+
+@app.get("/api/snapshot")
+def get_snapshot(
+    request: Request,
+    at: Optional[datetime] = Query(default=None, description="Point in time (ISO 8601); defaults to now"),
+    provider: Optional[str] = Query(default=None),
+    session=Depends(get_read_session),
+):
+    """Every pipeline's latest build as of `at`, rebuilt from the build event log"""
+    at = at or datetime.now(timezone.utc)
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    checkpoint_at, replayed, state = build_events.snapshot(session, at)
+    pipelines = pipeline_cache.resolve(session, list(state))
+    rows = [{
+        "pipeline": pipelines[pid].name,
+        "provider": pipelines[pid].provider,
+        "external_id": s["external_id"],
+        "status": s["status"],
+        "started_at": s["started_at"],
+        "updated_at": s["occurred_at"],
+    } for pid, s in state.items() if pid in pipelines and (provider is None or pipelines[pid].provider == provider)]
+    rows.sort(key=lambda r: r["pipeline"])
+    return json_response(request, {
+        "at": at,
+        "checkpoint_at": checkpoint_at,
+        "events_replayed": replayed,
+        "pipelines": rows,
+    })
+
+@app.get("/api/export/builds.arrow")
+def export_builds_arrow(
+    since: Optional[datetime] = Query(default=None, description="Only builds created or changed since this time"),
+    provider: Optional[str] = None,
+):
+    """Build history as an Arrow IPC stream, in record batches straight from a server-side cursor"""
+    if not export.available():
+        raise HTTPException(status_code=501, detail="Arrow export requires the pyarrow package")
+    return StreamingResponse(
+        export.arrow_stream(since, provider), media_type=export.MEDIA_TYPE,
+        headers={"Content-Disposition": 'attachment; filename="builds.arrow"'},
+    )
+
+@app.get("/api/anomalies")
+def list_anomalies(limit: int = Query(default=50, ge=1, le=100), session=Depends(get_read_session)):
+    """Most recent duration-regression / failure-spike events, raised by any worker"""
+    return anomalies.recent(session, limit)
+
+@app.get("/api/instrumentation")
+def get_instrumentation():
+    """Process-wide DB statement totals, recent slow queries and published gauges"""
+    return instrumentation_snapshot()
+
 @app.post("/api/collect/trigger")
 async def trigger_collect():
     asyncio.create_task(run_collectors_once())
@@ -313,21 +625,9 @@ async def notify_clients(event: dict):
             clients.remove(ws)
 
 # Background collectors
-async def run_collectors_once():
-    providers = os.getenv("PROVIDERS", "github,gitlab,jenkins").split(",")
-    alerters = [SlackAlerter(), EmailAlerter()]
-    results: list[CollectorResult] = []
-
-    if "github" in providers:
-        results += await GitHubCollector().list_recent_builds()
-    if "gitlab" in providers:
-        results += await GitLabCollector().list_recent_builds()
-    if "jenkins" in providers:
-        results += await JenkinsCollector().list_recent_builds()
-
-    # persist and detect transitions
-    transitions = upsert_builds(results)
-    # alerts and websocket
+async def publish_transitions(transitions: list[dict]):
+    """Push committed transitions to WebSocket clients and alert channels"""
+    alerters = load_alerters()
     for t in transitions:
         event = {"type": "build_updated", "build": t}
         await notify_clients(event)
@@ -337,8 +637,63 @@ async def run_collectors_once():
             except Exception as e:
                 print("Alert error:", e)
 
+async def publish_anomalies():
+    """Push detector events raised by any ingest path (poll or webhook) to clients and alerters"""
+    alerters = load_alerters()
+    while True:
+        await asyncio.sleep(1)
+        for e in anomalies.drain():
+            await notify_clients({"type": "anomaly", "anomaly": e})
+            for a in alerters:
+                if hasattr(a, "notify_anomaly"):
+                    try:
+                        await asyncio.to_thread(a.notify_anomaly, e)
+                    except Exception as err:
+                        print("Alert error:", err)
+
+async def run_collectors_once():
+    # results stream through ingest in batches; each committed batch is published immediately
+    stats = track_queries()
+    summary = await ingest.run(load_collectors(), publish_transitions)
+    print(f"Collector cycle: {summary['results']} results, {summary['written']} written in {summary['batches']} batches, "
+          f"{summary['transitions']} transitions, {stats.count} statements in {stats.total_ms:.1f} ms")
+
+def prepare_database():
+    """Apply migrations and optional demo data in a single leader process"""
+    with leader_lock("cicd-dashboard-startup") as leader:
+        if not leader:
+            return
+        if MIGRATE_ON_STARTUP:
+            init_db(background_migrations=False)
+        if SEED_SAMPLE_DATA:
+            from sample_data import seed_sample_data
+            seed_sample_data()
+
+def background_migrations():
+    migrations.run_background()
+    try:
+        rollups.sync_zones()
+    except Exception as e:
+        print("Local rollup backfill failed, will retry on next startup:", e)
+
 @app.on_event("startup")
 async def startup_event():
+    if MIGRATE_ON_STARTUP or SEED_SAMPLE_DATA:
+        await asyncio.to_thread(prepare_database)
+    try:
+        await asyncio.to_thread(detect_compact_layout)
+        await asyncio.to_thread(data_version.refresh)
+        await asyncio.to_thread(pipeline_cache.warm)
+        await asyncio.to_thread(fingerprints.warm)
+        await asyncio.to_thread(flaky.warm)
+        await asyncio.to_thread(rollups.reload)
+    except Exception as e:
+        print("Cache warm-up failed, falling back to DB lookups:", e)
+    if MIGRATE_ON_STARTUP:
+        asyncio.create_task(asyncio.to_thread(background_migrations))
+    asyncio.create_task(data_version.refresh_loop())
+    asyncio.create_task(build_events.checkpoint_loop())
+    asyncio.create_task(publish_anomalies())
     poll = int(os.getenv("COLLECTOR_POLL_SECONDS", "30"))
     async def loop():
         while True:
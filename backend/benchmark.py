@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the CI/CD Dashboard backend.
+Each scenario prints its own timings; run `python benchmark.py --help` for the list.
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+import httpx
+
+# Add the current directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def bench_startup(args):
+    """Time from process start until the first request is served"""
+    samples = []
+    for i in range(args.runs):
+        port = args.port + i
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        try:
+            while True:
+                if proc.poll() is not None:
+                    raise SystemExit(f"uvicorn exited with code {proc.returncode}")
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+        finally:
+            proc.terminate()
+            proc.wait()
+        samples.append(elapsed)
+        print(f"run {i + 1}: first request served after {elapsed * 1000:.0f} ms")
+    print(f"startup: min {min(samples) * 1000:.0f} ms, avg {sum(samples) / len(samples) * 1000:.0f} ms over {len(samples)} runs")
+
+def _build_rows(n):
+    from datetime import datetime, timedelta, timezone
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": 100000 + i,
+        "provider": ("github", "gitlab", "jenkins")[i % 3],
+        "pipeline": f"company/service-{i % 40}",
+        "status": ("success", "failed", "running")[i % 3],
+        "duration_seconds": 60 + i,
+        "started_at": now - timedelta(minutes=i),
+        "web_url": f"https://github.com/company/service-{i % 40}/actions/runs/{100000 + i}",
+    } for i in range(n)]
+
+def bench_serialize(args):
+    """CPU time to encode one 500-row /api/builds response: Pydantic models vs orjson rows"""
+    import json
+    from typing import List
+    from pydantic import TypeAdapter
+    from app import BuildOut
+    from responses import dumps
+
+    rows = _build_rows(500)
+    adapter = TypeAdapter(List[BuildOut])
+
+    def model_path():
+        # what the route did before: one model per row, then response_model validation + JSONResponse
+        models = [BuildOut(**row) for row in rows]
+        content = adapter.dump_python(adapter.validate_python(models, from_attributes=True), mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+    def fast_path():
+        return dumps([dict(row) for row in rows])
+
+    assert json.loads(model_path()) == json.loads(fast_path())
+    iterations = args.runs * 100
+    for name, fn in (("pydantic", model_path), ("orjson", fast_path)):
+        start = time.process_time()
+        for _ in range(iterations):
+            fn()
+        cpu = (time.process_time() - start) / iterations
+        print(f"{name:>8}: {cpu * 1e6:8.0f} us CPU per 500-row response ({len(fn())} bytes)")
+
+def _workflow_run_payload(repo, run_id, now):
+    from datetime import timedelta
+    started = now - timedelta(minutes=10)
+    return {
+        "repository": {"full_name": repo},
+        "workflow_run": {
+            "id": run_id,
+            "status": "completed",
+            "conclusion": "success" if run_id % 5 else "failure",
+            "run_started_at": started.isoformat().replace("+00:00", "Z"),
+            "updated_at": now.isoformat().replace("+00:00", "Z"),
+            "html_url": f"https://github.com/{repo}/actions/runs/{run_id}",
+        },
+    }
+
+def bench_webhooks(args):
+    """Webhook ingestion throughput: one event per request vs NDJSON batches (needs a database)"""
+    import json
+    from datetime import datetime, timezone
+    from fastapi.testclient import TestClient
+    from app import app
+    from replay_events import cleanup
+
+    client = TestClient(app)
+    now = datetime.now(timezone.utc)
+    events = args.runs * 200
+    stamp = int(time.time())
+    try:
+        repo = f"bench/webhooks-single-{stamp}"
+        start = time.perf_counter()
+        for i in range(events):
+            r = client.post("/api/webhooks/github", json=_workflow_run_payload(repo, i + 1, now), headers={"X-GitHub-Delivery": f"{repo}-{i}"})
+            assert r.status_code == 200, r.text
+        single = events / (time.perf_counter() - start)
+        print(f"  single: {single:8.0f} events/s ({events} requests)")
+
+        repo = f"bench/webhooks-batch-{stamp}"
+        start = time.perf_counter()
+        for offset in range(0, events, args.batch):
+            body = "\n".join(
+                json.dumps({"delivery_id": f"{repo}-{i}", "payload": _workflow_run_payload(repo, i + 1, now)})
+                for i in range(offset, min(offset + args.batch, events))
+            )
+            r = client.post("/api/webhooks/github/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+            assert r.status_code == 200 and r.json()["accepted"] == min(args.batch, events - offset), r.text
+        batched = events / (time.perf_counter() - start)
+        print(f"  batch:  {batched:8.0f} events/s ({args.batch} events per request)")
+        print(f"speedup: {batched / single:.1f}x")
+    finally:
+        cleanup(f"bench/webhooks-single-{stamp}")
+        cleanup(f"bench/webhooks-batch-{stamp}")
+
+def _github_mock(repos, latency, counters):
+    """httpx transport serving REST runs and GraphQL batches for `repos` from the same fake history.
+
+    Each repository has a default branch, feature branches pushed at different
+    times (some long stale) and open pull requests, with a push run on every
+    commit and a pull_request run on every pull request commit. REST lists the
+    newest 10 runs whatever their branch; GraphQL answers RUNS_FRAGMENT with
+    its first/last limits applied, so the two only agree as far as GraphQL's
+    branch and pull request scope really covers REST's runs.
+    """
+    import asyncio
+    import json
+    import random
+    from datetime import datetime, timedelta, timezone
+    from collectors.github import GRAPHQL_COMMITS, GRAPHQL_BRANCHES, GRAPHQL_PULLS, SUITES_PER_COMMIT, estimate_cost
+
+    now = datetime.now(timezone.utc)
+    iso = lambda t: t.isoformat().replace("+00:00", "Z")
+
+    def history(repo):
+        """({branch: [(sha, committed)] newest first}, open pull request branches, {sha: [run]})"""
+        j = repos.index(repo)
+        rng = random.Random(j)
+        branches = {"main": [(f"{j:08x}{0:08x}{c:024x}", now - timedelta(minutes=40 * c + 3)) for c in range(15)]}
+        for b in range(1, 8):
+            tip = now - timedelta(minutes=rng.choice((5, 25, 90, 300, 2000, 9000)))
+            branches[f"feature-{b}"] = [
+                (f"{j:08x}{b:08x}{c:024x}", tip - timedelta(minutes=20 * c)) for c in range(rng.randint(1, 8))
+            ]
+        pulls = [b for b in branches if b != "main" and rng.random() < 0.5]
+        runs, run_id = {}, j * 10000
+        for branch, commits in branches.items():
+            for sha, committed in commits:
+                for event in ("push", "pull_request") if branch in pulls else ("push",):
+                    run_id += 1
+                    created = committed + timedelta(minutes=1)
+                    done = created + timedelta(minutes=6) <= now
+                    runs.setdefault(sha, []).append({
+                        "id": run_id, "status": "completed" if done else "in_progress",
+                        "conclusion": ("failure" if rng.random() < 0.2 else "success") if done else None,
+                        "created": iso(created), "updated": iso(min(created + timedelta(minutes=6), now)),
+                        "url": f"https://github.com/{repo}/actions/runs/{run_id}", "event": event,
+                    })
+        return branches, pulls, runs
+
+    def rest(repo):
+        _, _, runs = history(repo)
+        newest = sorted(((sha, r) for sha, rs in runs.items() for r in rs), key=lambda x: x[1]["created"], reverse=True)
+        return {"workflow_runs": [{
+            "id": r["id"], "status": r["status"], "conclusion": r["conclusion"], "run_started_at": r["created"],
+            "updated_at": r["updated"], "html_url": r["url"], "head_sha": sha, "event": r["event"],
+        } for sha, r in newest[:10]]}
+
+    def repository(repo):
+        branches, pulls, runs = history(repo)
+        def commit(sha):
+            return {"oid": sha, "checkSuites": {"nodes": [{
+                "status": r["status"].upper(), "conclusion": (r["conclusion"] or "").upper() or None, "updatedAt": r["updated"],
+                "workflowRun": {"databaseId": r["id"], "url": r["url"], "createdAt": r["created"]},
+            } for r in runs.get(sha, [])][:SUITES_PER_COMMIT]}}
+        def target(branch):
+            return {"history": {"nodes": [commit(sha) for sha, _ in branches[branch][:GRAPHQL_COMMITS]]}}
+        by_tip = sorted(branches, key=lambda b: branches[b][0][1], reverse=True)
+        return {
+            "nameWithOwner": repo,
+            "refs": {"nodes": [{"target": target(b)} for b in by_tip[:GRAPHQL_BRANCHES]]},
+            "pullRequests": {"nodes": [
+                # commits(last: n) lists a pull request's newest n commits oldest first
+                {"commits": {"nodes": [{"commit": commit(sha)} for sha, _ in reversed(branches[b][:GRAPHQL_COMMITS])]}}
+                for b in [b for b in by_tip if b in pulls][:GRAPHQL_PULLS]
+            ]},
+        }
+
+    def quota(used):
+        return {"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": str(5000 - used), "X-RateLimit-Reset": str(int(now.timestamp()) + 3600)}
+
+    async def handler(request):
+        await asyncio.sleep(latency)
+        counters["requests"] += 1
+        if request.url.path.endswith("/graphql"):
+            variables = json.loads(request.content)["variables"]
+            size = len(variables) // 2
+            counters["points"] += estimate_cost(size)
+            data = {f"r{i}": repository(f"{variables[f'o{i}']}/{variables[f'n{i}']}") for i in range(size)}
+            return httpx.Response(200, json={"data": data}, headers=quota(counters["points"]))
+        counters["rest"] += 1  # one REST request is one unit of the hourly limit
+        body = rest(request.url.path.split("/repos/")[1].rsplit("/actions", 1)[0])
+        return httpx.Response(200, json=body, headers=quota(counters["rest"]))
+
+    return httpx.MockTransport(handler)
+
+def bench_github(args):
+    """GitHub collection over a mock API with per-request latency: REST (call per repo) vs GraphQL batches"""
+    import asyncio
+    from collectors.github import GitHubCollector, GRAPHQL_BATCH
+
+    repos = [f"bench/service-{i}" for i in range(args.repos)]
+    os.environ.update(GITHUB_TOKEN="bench", GITHUB_REPOS=",".join(repos), GITHUB_ORGS="")
+    seen = {}
+    for mode in ("rest", "graphql"):
+        counters = {"requests": 0, "points": 0, "rest": 0}
+        collector = GitHubCollector(mode=mode, transport=_github_mock(repos, args.latency / 1000, counters))
+        start = time.perf_counter()
+        results = asyncio.run(collector.list_recent_builds())
+        elapsed = time.perf_counter() - start
+        seen[mode] = {(r.pipeline_name, r.external_id, r.status, r.duration_seconds) for r in results}
+        print(f"{mode:>8}: {elapsed * 1000:7.0f} ms, {counters['requests']:4} requests, "
+              f"{counters['points'] + counters['rest']:4} rate-limit points, {len(results)} runs")
+    missing = seen["rest"] - seen["graphql"]
+    assert not missing, f"GraphQL mode misses {len(missing)} runs REST mode reports, e.g. {sorted(missing)[:3]}"
+    print(f"GraphQL covers all {len(seen['rest'])} REST runs, plus {len(seen['graphql'] - seen['rest'])} older ones")
+    print(f"{args.repos} repositories, {args.latency} ms per request, {GRAPHQL_BATCH} repositories per GraphQL query")
+
+SCENARIOS = {
+    "startup": bench_startup,
+    "serialize": bench_serialize,
+    "webhooks": bench_webhooks,
+    "github": bench_github,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='CI/CD Dashboard backend benchmarks')
+    parser.add_argument('scenario', choices=sorted(SCENARIOS), help='Benchmark to run')
+    parser.add_argument('--runs', type=int, default=5, help='Number of repetitions (default: 5)')
+    parser.add_argument('--port', type=int, default=8765, help='First port used for spawned servers')
+    parser.add_argument('--batch', type=int, default=100, help='Events per batch request (default: 100)')
+    parser.add_argument('--repos', type=int, default=200, help='Repositories served by the mock GitHub API (default: 200)')
+    parser.add_argument('--latency', type=float, default=50, help='Mock API latency per request in ms (default: 50)')
+    args = parser.parse_args()
+    SCENARIOS[args.scenario](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Append-only build event log.
+
+Every status change written by upsert_builds is also appended to build_events
+in the same transaction, with one bulk insert per ingest batch. Derived tables
+can be rebuilt by streaming the log with `replay()`, and `snapshot(at)`
+reconstructs every pipeline's latest build as of any past time from the newest
+checkpoint at or before `at` plus the events that follow it.
+"""
+
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from db import SessionLocal, Build, BuildEvent, PipelineCheckpoint, ensure_event_partitions
+
+CHECKPOINT_HOURS = float(os.getenv("EVENT_CHECKPOINT_HOURS", "6"))
+# Checkpoints are only taken this far in the past, so events that arrive late
+# (delayed webhooks, slow polls) are already in the log when it is folded
+CHECKPOINT_LAG_MINUTES = float(os.getenv("EVENT_CHECKPOINT_LAG_MINUTES", "60"))
+
+def _insert_ignoring_duplicates(session, model, rows):
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(model).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(model).on_conflict_do_nothing()
+    else:
+        stmt = insert(model)
+    session.execute(stmt, rows)
+
+def _event_row(change, now) -> dict:
+    r = change.result
+    return {
+        "pipeline_id": change.pipeline_id,
+        "external_id": r.external_id,
+        "occurred_at": r.updated_at or now,
+        "status_new": r.status,
+        "status_old": change.status_old,
+        "source": r.source,
+        "started_at": r.started_at,
+        "duration_seconds": r.duration_seconds,
+    }
+
+def on_transaction(session, changes):
+    """Ingest hook: append the batch's transitions to the log"""
+    now = datetime.now(timezone.utc)
+    _insert_ignoring_duplicates(session, BuildEvent, [_event_row(c, now) for c in changes])
+
+def rebuild(batch_size: int = 5000):
+    """Log one 'backfill' event for every build that has none (e.g. seeded or pre-log data)"""
+    with SessionLocal() as session:
+        logged = select(BuildEvent.pipeline_id).where(
+            BuildEvent.pipeline_id == Build.pipeline_id, BuildEvent.external_id == Build.external_id
+        ).exists()
+        rows = session.execute(
+            select(Build.pipeline_id, Build.external_id, Build.status, Build.started_at,
+                   Build.finished_at, Build.duration_seconds, Build.provider_updated_at, Build.created_at)
+            .where(~logged)
+            .execution_options(yield_per=batch_size)
+        )
+        batch, total = [], 0
+        for b in rows:
+            batch.append({
+                "pipeline_id": b.pipeline_id,
+                "external_id": b.external_id,
+                "occurred_at": b.provider_updated_at or b.finished_at or b.started_at or b.created_at,
+                "status_new": b.status,
+                "status_old": None,
+                "source": "backfill",
+                "started_at": b.started_at,
+                "duration_seconds": b.duration_seconds,
+            })
+            if len(batch) >= batch_size:
+                _insert_ignoring_duplicates(session, BuildEvent, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            _insert_ignoring_duplicates(session, BuildEvent, batch)
+            total += len(batch)
+        session.commit()
+    print(f"Logged {total} backfill build events")
+
+def replay(session, since: datetime | None = None, until: datetime | None = None, batch_size: int = 5000,
+           pipeline_ids=None):
+    """Stream events in occurred_at order without loading the log into memory"""
+    stmt = select(BuildEvent).order_by(BuildEvent.occurred_at, BuildEvent.pipeline_id, BuildEvent.external_id)
+    if pipeline_ids is not None:
+        stmt = stmt.where(BuildEvent.pipeline_id.in_(pipeline_ids))
+    if since is not None:
+        stmt = stmt.where(BuildEvent.occurred_at > since)
+    if until is not None:
+        stmt = stmt.where(BuildEvent.occurred_at <= until)
+    yield from session.execute(stmt.execution_options(yield_per=batch_size)).scalars()
+
+def _aware(dt):
+    return dt.replace(tzinfo=timezone.utc) if dt is not None and dt.tzinfo is None else dt
+
+def apply(state: dict, e):
+    """Fold one event into {pipeline_id: latest build}; a pipeline's latest build is the one started last"""
+    cur = state.get(e.pipeline_id)
+    started = _aware(e.started_at) or _aware(e.occurred_at)
+    if cur is None or cur["external_id"] == e.external_id or started >= cur["started_at"]:
+        state[e.pipeline_id] = {
+            "external_id": e.external_id,
+            "status": e.status_new,
+            "started_at": started,
+            "occurred_at": _aware(e.occurred_at),
+        }
+
+def snapshot(session, at: datetime) -> tuple[datetime | None, int, dict]:
+    """(checkpoint used, events replayed, {pipeline_id: latest build}) as of `at`"""
+    checkpoint_at = session.scalar(select(func.max(PipelineCheckpoint.at)).where(PipelineCheckpoint.at <= at))
+    state = {}
+    if checkpoint_at is not None:
+        for c in session.execute(select(PipelineCheckpoint).where(PipelineCheckpoint.at == checkpoint_at)).scalars():
+            state[c.pipeline_id] = {
+                "external_id": c.external_id,
+                "status": c.status,
+                "started_at": _aware(c.started_at) or _aware(c.occurred_at),
+                "occurred_at": _aware(c.occurred_at),
+            }
+    replayed = 0
+    for e in replay(session, since=checkpoint_at, until=at):
+        apply(state, e)
+        replayed += 1
+    return checkpoint_at, replayed, state
+
+def checkpoint(now: datetime | None = None) -> datetime | None:
+    """Fold the log into a checkpoint at the last CHECKPOINT_HOURS boundary older than the lag.
+
+    Checkpoint times are aligned, so workers racing to write the same one
+    produce identical rows and the loser's insert is simply dropped.
+    """
+    now = now or datetime.now(timezone.utc)
+    step = CHECKPOINT_HOURS * 3600
+    cutoff = (now - timedelta(minutes=CHECKPOINT_LAG_MINUTES)).timestamp()
+    at = datetime.fromtimestamp(cutoff - cutoff % step, tz=timezone.utc)
+    with SessionLocal() as session:
+        if session.scalar(select(func.count()).select_from(PipelineCheckpoint).where(PipelineCheckpoint.at == at)):
+            return None
+        _, replayed, state = snapshot(session, at)
+        if not state:
+            return None
+        _insert_ignoring_duplicates(session, PipelineCheckpoint, [
+            {"at": at, "pipeline_id": pid, **s} for pid, s in state.items()
+        ])
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return None
+    print(f"Checkpointed {len(state)} pipelines at {at.isoformat()} ({replayed} events folded)")
+    return at
+
+async def checkpoint_loop():
+    while True:
+        try:
+            await asyncio.to_thread(ensure_event_partitions)
+            await asyncio.to_thread(checkpoint)
+        except Exception as e:
+            print("Build event checkpoint failed:", e)
+        await asyncio.sleep(min(CHECKPOINT_HOURS * 3600, 3600))
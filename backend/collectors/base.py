@@ -1,9 +1,13 @@
 
 from dataclasses import dataclass
-from typing import List, Optional
-from datetime import datetime
-from sqlalchemy import select
-from db import SessionLocal, Pipeline, Build
+from typing import AsyncIterator, List, NamedTuple, Optional
+from datetime import datetime, timezone
+from sqlalchemy import select, tuple_
+from db import SessionLocal, Pipeline, Build, BUILD_STATUS, COMPACT_SCHEMA, infer_url_template, build_web_url
+import data_version
+import pipeline_cache
+import fingerprints
+from plugins import load_ingest_hooks
 
 @dataclass
 class CollectorResult:
@@ -15,64 +19,201 @@ class CollectorResult:
     finished_at: Optional[datetime]
     duration_seconds: Optional[int]
     web_url: Optional[str]
+    source: str = "poll"  # poll | webhook
+    updated_at: Optional[datetime] = None  # provider's last-modified time for the run, used for ordering
+    commit_sha: Optional[str] = None
 
 class BaseCollector:
     provider: str
+
+    async def iter_recent_builds(self) -> AsyncIterator[CollectorResult]:
+        """Yield results as provider pages arrive"""
+        return
+        yield
+
     async def list_recent_builds(self) -> List[CollectorResult]:
-        return []
+        return [r async for r in self.iter_recent_builds()]
+
+    def commit(self):
+        """Called once everything the last iter_recent_builds() yielded has been written.
+
+        Collectors that poll incrementally advance their watermarks here, so
+        updates from a cycle whose write failed are fetched again.
+        """
+
+class BuildChange(NamedTuple):
+    """A written build change, as handed to the plugins.INGEST_HOOKS modules"""
+    pipeline_id: int
+    status_old: Optional[str]
+    result: CollectorResult
+    started_old: Optional[datetime] = None  # the stored build's values before this write
+    duration_old: Optional[int] = None
+
+    def is_completion(self) -> bool:
+        """True the first time a build is written as finished with a duration"""
+        r = self.result
+        return (
+            r.duration_seconds is not None
+            and r.status not in ACTIVE_STATUSES
+            and (self.status_old is None or self.status_old in ACTIVE_STATUSES)
+        )
+
+# Statuses a build can still leave; moving from any other status back into one
+# of these is only accepted when the provider timestamp proves it is newer (a rerun)
+ACTIVE_STATUSES = {"running", "pending", "queued", "in_progress", "created", "waiting_for_resource", "preparing", "scheduled", "requested", "waiting"}
+
+# Terminal statuses that count as a failed build in health metrics
+FAILED_STATUSES = {"failed", "failure", "error", "timed_out"}
+
+# Existing builds are loaded with one IN query per this many (pipeline_id, external_id) keys
+LOOKUP_CHUNK = 500
 
 def upsert_builds(results: List[CollectorResult]):
+    for r in results:
+        r.status = BUILD_STATUS.stored(r.status)
+    # unchanged polled builds are dropped here, before any DB work
+    results = fingerprints.filter_changed(results)
+    if not results:
+        return []
+    return write_builds(results)
+
+def _transition(r: CollectorResult, old: Optional[str]) -> dict:
+    return {
+        "pipeline": r.pipeline_name,
+        "provider": r.provider,
+        "external_id": r.external_id,
+        "status_old": old,
+        "status_new": r.status,
+        "web_url": r.web_url,
+        "duration_seconds": r.duration_seconds,
+        "started_at": r.started_at.isoformat() if r.started_at else None,
+        "source": r.source,
+    }
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    # backends without timezone support hand back naive UTC timestamps
+    return dt.replace(tzinfo=timezone.utc) if dt and dt.tzinfo is None else dt
+
+def is_stale(build: Build, r: CollectorResult) -> bool:
+    """True when `r` is older than what is stored: an out-of-order or replayed delivery."""
+    stored, incoming = _aware(build.provider_updated_at), _aware(r.updated_at)
+    if stored and incoming:
+        return incoming < stored or (
+            incoming == stored and build.status not in ACTIVE_STATUSES and r.status in ACTIVE_STATUSES
+        )
+    return build.status not in ACTIVE_STATUSES and r.status in ACTIVE_STATUSES
+
+def write_builds(results: List[CollectorResult]):
+    """Insert or update `results` (already deduplicated) in one transaction and return the transitions."""
     transitions = []
+    changes = []
+    created = []
+    stale = []
+    written = []
     with SessionLocal() as session:
+        data_version.lock(session)
+        data_version.sync_schema(session)
+        keyed = []
         for r in results:
-            pipeline = session.execute(
-                select(Pipeline).where(Pipeline.provider==r.provider, Pipeline.name==r.pipeline_name)
-            ).scalar_one_or_none()
-            if not pipeline:
-                pipeline = Pipeline(provider=r.provider, name=r.pipeline_name, url=r.web_url)
-                session.add(pipeline)
-                session.flush()
-            build = session.execute(
-                select(Build).where(Build.pipeline_id==pipeline.id, Build.external_id==r.external_id)
-            ).scalar_one_or_none()
+            # an unlisted status reads back as "unknown" once compact; compare what will be stored
+            r.status = BUILD_STATUS.stored(r.status)
+            pipeline_id = pipeline_cache.lookup(r.provider, r.pipeline_name)
+            if pipeline_id is None:
+                pipeline_id = _get_or_create_pipeline(session, r, created)
+            keyed.append(((pipeline_id, r.external_id), r))
+        existing = _load_builds(session, [key for key, _ in keyed])
+        for (pipeline_id, external_id), r in keyed:
+            build = existing.get((pipeline_id, external_id))
             if not build:
                 build = Build(
-                    pipeline_id=pipeline.id,
+                    pipeline_id=pipeline_id,
                     external_id=r.external_id,
                     status=r.status,
                     started_at=r.started_at,
                     finished_at=r.finished_at,
                     duration_seconds=r.duration_seconds,
-                    web_url=r.web_url,
+                    web_url=_stored_url(r, pipeline_id, created),
+                    event_source=r.source,
+                    provider_updated_at=r.updated_at,
+                    commit_sha=r.commit_sha,
                 )
                 session.add(build)
-                transitions.append({
-                    "pipeline": r.pipeline_name,
-                    "provider": r.provider,
-                    "external_id": r.external_id,
-                    "status_old": None,
-                    "status_new": r.status,
-                    "web_url": r.web_url,
-                    "duration_seconds": r.duration_seconds,
-                    "started_at": r.started_at.isoformat() if r.started_at else None,
-                })
+                existing[(pipeline_id, external_id)] = build
+                written.append(build)
+                transitions.append(_transition(r, None))
+                changes.append(BuildChange(pipeline_id, None, r))
+            elif is_stale(build, r):
+                stale.append(r)
             else:
+                if r.updated_at and (not build.provider_updated_at or _aware(r.updated_at) > _aware(build.provider_updated_at)):
+                    build.provider_updated_at = r.updated_at
                 if build.status != r.status or build.duration_seconds != r.duration_seconds:
-                    old = build.status
+                    old, started_old, duration_old = build.status, build.started_at, build.duration_seconds
+                    build.event_source = r.source
                     build.status = r.status
                     build.started_at = r.started_at
                     build.finished_at = r.finished_at
                     build.duration_seconds = r.duration_seconds
-                    build.web_url = r.web_url or build.web_url
-                    transitions.append({
-                        "pipeline": r.pipeline_name,
-                        "provider": r.provider,
-                        "external_id": r.external_id,
-                        "status_old": old,
-                        "status_new": r.status,
-                        "web_url": r.web_url,
-                        "duration_seconds": r.duration_seconds,
-                        "started_at": r.started_at.isoformat() if r.started_at else None,
-                    })
+                    build.web_url = _stored_url(r, pipeline_id, created) if r.web_url else build.web_url
+                    build.commit_sha = r.commit_sha or build.commit_sha
+                    written.append(build)
+                    transitions.append(_transition(r, old))
+                    changes.append(BuildChange(pipeline_id, old, r, started_old, duration_old))
+        # under the lock taken above, so hooks below run one writer at a time
+        versions = data_version.bump(session, transitions, [data_version.PIPELINES] if created else ())
+        for build in written:
+            build.data_version = versions[data_version.GLOBAL]
+        transaction_hooks, commit_hooks = load_ingest_hooks()
+        for hook in transaction_hooks if changes else ():
+            hook(session, changes)
         session.commit()
+    for p in created:
+        pipeline_cache.add(*p)
+    skipped = {id(r) for r in stale}
+    fingerprints.remember([r for r in results if id(r) not in skipped])
+    data_version.publish(versions)
+    for hook in commit_hooks if changes else ():
+        try:
+            hook(changes)
+        except Exception as e:
+            print(f"Commit hook {hook.__module__}.{hook.__name__} failed:", e)
+    if stale:
+        print(f"Ignored {len(stale)} stale build updates")
     return transitions
+
+def _stored_url(r: CollectorResult, pipeline_id: int, created: list) -> Optional[str]:
+    """The web_url to store: NULL in the compact layout when the pipeline's template yields it"""
+    if not COMPACT_SCHEMA or not r.web_url:
+        return r.web_url
+    info = pipeline_cache.get(pipeline_id) or next((p for p in created if p.id == pipeline_id), None)
+    template = info.url_template if info else None
+    return None if build_web_url(None, template, r.external_id) == r.web_url else r.web_url
+
+def _load_builds(session, keys) -> dict:
+    found = {}
+    for i in range(0, len(keys), LOOKUP_CHUNK):
+        chunk = keys[i:i + LOOKUP_CHUNK]
+        for b in session.execute(select(Build).where(tuple_(Build.pipeline_id, Build.external_id).in_(chunk))).scalars():
+            found[(b.pipeline_id, b.external_id)] = b
+    return found
+
+def _get_or_create_pipeline(session, r: CollectorResult, created: list) -> int:
+    for p in created:
+        if p.provider == r.provider and p.name == r.pipeline_name:
+            return p.id
+    pipeline = session.execute(
+        select(Pipeline).where(Pipeline.provider==r.provider, Pipeline.name==r.pipeline_name)
+    ).scalar_one_or_none()
+    if pipeline:
+        pipeline_cache.add(pipeline.id, pipeline.provider, pipeline.name, pipeline.url, pipeline.build_url_template)
+        return pipeline.id
+    pipeline = Pipeline(
+        provider=r.provider, name=r.pipeline_name, url=r.web_url,
+        build_url_template=infer_url_template(r.web_url, r.external_id),
+    )
+    session.add(pipeline)
+    session.flush()
+    created.append(pipeline_cache.PipelineInfo(
+        pipeline.id, pipeline.provider, pipeline.name, pipeline.url, pipeline.build_url_template,
+    ))
+    return pipeline.id
@@ -1,45 +1,205 @@
 
-import os, httpx
+import os, time, httpx
 from datetime import datetime
 from .base import BaseCollector, CollectorResult
+from . import ratelimit
+
+API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GRAPHQL_URL = os.getenv("GITHUB_GRAPHQL_URL", f"{API_URL}/graphql")
+MODE = os.getenv("GITHUB_MODE", "rest")  # rest: one call per repo | graphql: many repos per query
+GRAPHQL_BATCH = int(os.getenv("GITHUB_GRAPHQL_BATCH", "50"))
+# REST lists a repository's newest 10 runs, which lie on at most its 10 most
+# recently committed branches and within their newest 10 commits each
+GRAPHQL_BRANCHES = int(os.getenv("GITHUB_GRAPHQL_BRANCHES", "10"))
+GRAPHQL_COMMITS = int(os.getenv("GITHUB_GRAPHQL_COMMITS", "10"))
+GRAPHQL_PULLS = int(os.getenv("GITHUB_GRAPHQL_PULLS", "5"))  # pull requests from forks have no branch here
+DISCOVERY_TTL = float(os.getenv("GITHUB_DISCOVERY_TTL_SECONDS", "3600"))
+ACTIONS_APP_ID = 15368  # check suites created by GitHub Actions, i.e. workflow runs
+SUITES_PER_COMMIT = 10
+
+# Latest workflow runs of a repository: the check suites GitHub Actions created
+# for the newest commits of its most recently committed branches (the default
+# branch among them whenever it has recent runs) and of its most recently
+# updated open pull requests, i.e. every run REST's /actions/runs lists first
+RUNS_FRAGMENT = """
+fragment suites on Commit {
+  oid
+  checkSuites(first: %(suites)d, filterBy: {appId: %(app)d}) { nodes {
+    status conclusion updatedAt
+    workflowRun { databaseId url createdAt }
+  } }
+}
+fragment runs on Repository {
+  nameWithOwner
+  refs(refPrefix: "refs/heads/", first: %(branches)d, orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) { nodes {
+    target { ... on Commit { history(first: %(commits)d) { nodes { ...suites } } } }
+  } }
+  pullRequests(states: OPEN, first: %(pulls)d, orderBy: {field: UPDATED_AT, direction: DESC}) { nodes {
+    commits(last: %(commits)d) { nodes { commit { ...suites } } }
+  } }
+}
+""" % {"suites": SUITES_PER_COMMIT, "app": ACTIONS_APP_ID, "commits": GRAPHQL_COMMITS,
+       "branches": GRAPHQL_BRANCHES, "pulls": GRAPHQL_PULLS}
+
+DISCOVERY_QUERY = """
+query($org: String!, $after: String) {
+  organization(login: $org) {
+    repositories(first: 100, after: $after, orderBy: {field: PUSHED_AT, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes { nameWithOwner isArchived }
+    }
+  }
+}
+"""
+
+_discovery = {"repos": [], "expires": 0.0}
+
+def batch_query(size: int) -> str:
+    """One query fetching `size` repositories' latest runs through aliased fields r0..rN"""
+    variables = ", ".join(f"$o{i}: String!, $n{i}: String!" for i in range(size))
+    fields = "\n".join(f"  r{i}: repository(owner: $o{i}, name: $n{i}) {{ ...runs }}" for i in range(size))
+    return f"query({variables}) {{\n{fields}\n}}\n{RUNS_FRAGMENT}"
+
+def estimate_cost(size: int) -> int:
+    """GitHub's point cost of batch_query(size): connection requests / 100, at least 1"""
+    # per repo: refs and a history per ref, pull requests and commits per pull request,
+    # then checkSuites per commit of each of those
+    connections = 2 + GRAPHQL_BRANCHES + GRAPHQL_PULLS
+    commits = GRAPHQL_COMMITS * (GRAPHQL_BRANCHES + GRAPHQL_PULLS)
+    return max(1, round(size * (connections + commits) / 100))
 
 class GitHubCollector(BaseCollector):
     provider = "github"
 
-    async def list_recent_builds(self):
+    def __init__(self, mode: str | None = None, transport: httpx.AsyncBaseTransport | None = None):
+        self.mode = mode or MODE
+        self.transport = transport  # benchmark.py swaps in a mock server
+
+    async def iter_recent_builds(self):
         token = os.getenv("GITHUB_TOKEN")
-        repos = os.getenv("GITHUB_REPOS", "")
         headers = {"Authorization": f"Bearer {token}"} if token else {}
-        out = []
-        if not token or not repos:
-            return out
-        async with httpx.AsyncClient(timeout=20) as client:
-            for repo in repos.split(","):
-                repo = repo.strip()
-                if not repo:
-                    continue
-                url = f"https://api.github.com/repos/{repo}/actions/runs?per_page=10"
-                r = await client.get(url, headers=headers)
-                r.raise_for_status()
-                data = r.json()
-                for run in data.get("workflow_runs", []):
-                    status = "running" if run.get("status") in ("in_progress","queued") else (
-                        "success" if run.get("conclusion")=="success" else (
-                        "failed" if run.get("conclusion")=="failure" else (run.get("conclusion") or run.get("status"))
-                    ))
-                    started = run.get("run_started_at")
-                    updated = run.get("updated_at")
-                    s = datetime.fromisoformat(started.replace("Z","+00:00")) if started else None
-                    f = datetime.fromisoformat(updated.replace("Z","+00:00")) if updated and status in ("success","failed","cancelled","skipped") else None
-                    dur = int((f - s).total_seconds()) if s and f else None
-                    out.append(CollectorResult(
-                        provider=self.provider,
-                        pipeline_name=repo,
-                        external_id=str(run.get("id")),
-                        status=str(status),
-                        started_at=s,
-                        finished_at=f,
-                        duration_seconds=dur,
-                        web_url=run.get("html_url"),
-                    ))
-        return out
+        if not token:
+            return
+        self.rest = ratelimit.limiter(self.provider, token)
+        self.graphql = ratelimit.limiter(self.provider, token, "graphql")  # points, a separate quota
+        async with httpx.AsyncClient(timeout=20, transport=self.transport) as client:
+            repos = ratelimit.prioritize(self.provider, await self._repos(client, headers))
+            pages = self._graphql_runs(client, headers, repos) if self.mode == "graphql" else self._rest_runs(client, headers, repos)
+            async for result in pages:
+                yield result
+
+    async def _repos(self, client, headers) -> list[str]:
+        """GITHUB_REPOS plus the active repositories of GITHUB_ORGS, discovered at most every DISCOVERY_TTL"""
+        repos = [r.strip() for r in os.getenv("GITHUB_REPOS", "").split(",") if r.strip()]
+        orgs = [o.strip() for o in os.getenv("GITHUB_ORGS", "").split(",") if o.strip()]
+        if orgs and time.monotonic() >= _discovery["expires"]:
+            discovered = []
+            for org in orgs:
+                after = None
+                while True:
+                    data = await self._graphql(client, headers, DISCOVERY_QUERY, {"org": org, "after": after})
+                    page = ((data.get("organization") or {}).get("repositories")) or {}
+                    discovered += [n["nameWithOwner"] for n in page.get("nodes") or [] if not n["isArchived"]]
+                    if not (page.get("pageInfo") or {}).get("hasNextPage"):
+                        break
+                    after = page["pageInfo"]["endCursor"]
+            _discovery.update(repos=discovered, expires=time.monotonic() + DISCOVERY_TTL)
+            print(f"GitHub: discovered {len(discovered)} repositories in {', '.join(orgs)}")
+        return list(dict.fromkeys(repos + (_discovery["repos"] if orgs else [])))
+
+    async def _rest_runs(self, client, headers, repos):
+        for repo in repos:
+            url = f"{API_URL}/repos/{repo}/actions/runs?per_page=10"
+            r = await self.rest.request(client, "GET", url, priority=ratelimit.is_running(self.provider, repo), headers=headers)
+            if r.is_error:
+                print(f"GitHub: {repo}: HTTP {r.status_code}")
+                continue
+            data = r.json()
+            for run in data.get("workflow_runs", []):
+                yield parse_workflow_run(run, repo)
+
+    async def _graphql_runs(self, client, headers, repos):
+        for offset in range(0, len(repos), GRAPHQL_BATCH):
+            batch = repos[offset:offset + GRAPHQL_BATCH]
+            variables = {}
+            for i, repo in enumerate(batch):
+                variables[f"o{i}"], _, variables[f"n{i}"] = repo.partition("/")
+            priority = any(ratelimit.is_running(self.provider, repo) for repo in batch)
+            try:
+                data = await self._graphql(client, headers, batch_query(len(batch)), variables, priority, estimate_cost(len(batch)))
+            except httpx.HTTPStatusError as e:
+                print(f"GitHub: GraphQL batch of {len(batch)} repositories: HTTP {e.response.status_code}")
+                continue
+            for i, repo in enumerate(batch):
+                for run in graphql_runs(data.get(f"r{i}")):
+                    yield parse_workflow_run(run, repo)
+
+    async def _graphql(self, client, headers, query: str, variables: dict, priority: bool = False, cost: int = 1) -> dict:
+        r = await self.graphql.request(
+            client, "POST", GRAPHQL_URL, priority=priority, cost=cost,
+            json={"query": query, "variables": variables}, headers=headers,
+        )
+        r.raise_for_status()
+        body = r.json()
+        for error in body.get("errors") or []:
+            # e.g. one aliased repository not found; the other aliases still have data
+            print("GitHub GraphQL error:", error.get("message"))
+        data = body.get("data")
+        if data is None:
+            raise RuntimeError("GitHub GraphQL query returned no data")
+        return data
+
+def _commits(repository: dict) -> list[dict]:
+    """Every commit node RUNS_FRAGMENT returned for a repository"""
+    nodes = lambda connection: (connection or {}).get("nodes") or []
+    commits = [c for ref in nodes(repository.get("refs")) for c in nodes((ref.get("target") or {}).get("history"))]
+    for pull in nodes(repository.get("pullRequests")):
+        commits += [c.get("commit") or {} for c in nodes(pull.get("commits"))]
+    return commits
+
+def graphql_runs(repository: dict | None) -> list[dict]:
+    """A repository's check suites from RUNS_FRAGMENT as REST-shaped workflow_run objects"""
+    runs = {}
+    for commit in _commits(repository or {}):
+        for suite in (commit.get("checkSuites") or {}).get("nodes") or []:
+            run = suite.get("workflowRun")
+            # a commit can be the head of several branches and pull requests
+            if not run or run["databaseId"] in runs:
+                continue
+            runs[run["databaseId"]] = {
+                "id": run["databaseId"],
+                "status": (suite.get("status") or "").lower(),
+                "conclusion": (suite.get("conclusion") or "").lower() or None,
+                # GraphQL has no run_started_at; a run starts when its check suite is created
+                "run_started_at": run.get("createdAt"),
+                "updated_at": suite.get("updatedAt"),
+                "html_url": run.get("url"),
+                "head_sha": commit.get("oid"),
+            }
+    return list(runs.values())
+
+def parse_workflow_run(run: dict, repo: str, source: str = "poll") -> CollectorResult:
+    """Normalize a workflow_run object from the REST API or a webhook payload"""
+    status = "running" if run.get("status") in ("in_progress","queued") else (
+        "success" if run.get("conclusion")=="success" else (
+        "failed" if run.get("conclusion")=="failure" else (run.get("conclusion") or run.get("status"))
+    ))
+    started = run.get("run_started_at")
+    updated = run.get("updated_at")
+    s = datetime.fromisoformat(started.replace("Z","+00:00")) if started else None
+    u = datetime.fromisoformat(updated.replace("Z","+00:00")) if updated else None
+    f = u if status in ("success","failed","cancelled","skipped") else None
+    dur = int((f - s).total_seconds()) if s and f else None
+    return CollectorResult(
+        provider="github",
+        pipeline_name=repo,
+        external_id=str(run.get("id")),
+        status=str(status),
+        started_at=s,
+        finished_at=f,
+        duration_seconds=dur,
+        web_url=run.get("html_url"),
+        source=source,
+        updated_at=u,
+        commit_sha=run.get("head_sha"),
+    )
@@ -1,41 +1,152 @@
 
-import os, httpx
-from datetime import datetime
-from .base import BaseCollector, CollectorResult
+import os, time, httpx
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+from .base import BaseCollector, CollectorResult, ACTIVE_STATUSES
+from . import ratelimit
+
+API_URL = os.getenv("GITLAB_URL", "https://gitlab.com").rstrip("/") + "/api/v4"
+DISCOVERY_TTL = float(os.getenv("GITLAB_DISCOVERY_TTL_SECONDS", "3600"))
+# GitLab refreshes a project's last_activity_at at most about once an hour,
+# so the window must be longer than that for running pipelines to stay polled
+ACTIVE_WINDOW = timedelta(seconds=float(os.getenv("GITLAB_ACTIVE_WINDOW_SECONDS", "7200")))
+SLACK = timedelta(seconds=60)  # overlap between consecutive updated_after / activity cutoffs
+
+# Group projects by id: {"path", "last_activity_at"}; fully relisted every DISCOVERY_TTL,
+# in between only the projects active since the previous cycle are read
+_membership = {"projects": {}, "expires": 0.0, "scanned": None}
+_polled: dict = {}  # project -> start of its last pipelines poll whose results were written
+_running: dict = {}  # project -> ids of pipelines last seen running
+_staged: dict = {}  # project -> (poll start, running ids) of this cycle, applied by commit()
+
+def _time(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
 
 class GitLabCollector(BaseCollector):
     provider = "gitlab"
 
-    async def list_recent_builds(self):
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None):
+        self.transport = transport
+
+    async def iter_recent_builds(self):
         token = os.getenv("GITLAB_TOKEN")
-        projects = os.getenv("GITLAB_PROJECTS", "")
+        projects = [p.strip() for p in os.getenv("GITLAB_PROJECTS", "").split(",") if p.strip()]
+        groups = [g.strip() for g in os.getenv("GITLAB_GROUPS", "").split(",") if g.strip()]
         headers = {"PRIVATE-TOKEN": token} if token else {}
-        out = []
-        if not token or not projects:
-            return out
-        async with httpx.AsyncClient(timeout=20) as client:
-            for proj in projects.split(","):
-                proj = proj.strip()
-                if not proj:
+        if not token or not (projects or groups):
+            return
+        self.limiter = ratelimit.limiter(self.provider, token)
+        _staged.clear()  # a cycle that was never committed is polled again from the old watermarks
+        async with httpx.AsyncClient(timeout=20, headers=headers, transport=self.transport) as client:
+            targets = [(proj, proj, False) for proj in projects]
+            if groups:
+                configured = set(projects)
+                targets += [
+                    (pid, path, True) for pid, path in await self._active_projects(client, groups)
+                    if str(pid) not in configured and path not in configured
+                ]
+            # projects with running pipelines first, and allowed into the reserved budget
+            running = {name for proj, name, _ in targets if _running.get(proj) or ratelimit.is_running(self.provider, name)}
+            targets.sort(key=lambda t: t[1] not in running)
+            for proj, name, discovered in targets:
+                try:
+                    results = await self._pipelines(client, proj, name, discovered, name in running)
+                except httpx.HTTPStatusError as e:
+                    print(f"GitLab: {name}: HTTP {e.response.status_code}")
                     continue
-                url = f"https://gitlab.com/api/v4/projects/{proj}/pipelines?per_page=10"
-                r = await client.get(url, headers=headers)
+                for result in results:
+                    yield result
+
+    async def _active_projects(self, client, groups: list[str]) -> list[tuple[int, str]]:
+        """Group projects active within ACTIVE_WINDOW, or with pipelines still running"""
+        now = datetime.now(timezone.utc)
+        full = time.monotonic() >= _membership["expires"] or _membership["scanned"] is None
+        cutoff = None if full else _membership["scanned"] - SLACK
+        seen = {}
+        for group in groups:
+            params = {
+                "include_subgroups": "true", "archived": "false", "simple": "true",
+                "order_by": "last_activity_at", "sort": "desc", "per_page": 100, "page": 1,
+            }
+            while params["page"]:
+                r = await self.limiter.request(client, "GET", f"{API_URL}/groups/{quote(group, safe='')}/projects", params=params)
                 r.raise_for_status()
-                for pipe in r.json():
-                    status = pipe.get("status")
-                    started_at = pipe.get("created_at")
-                    finished_at = pipe.get("updated_at") if status in ("success","failed","canceled","skipped") else None
-                    s = datetime.fromisoformat(started_at.replace("Z","+00:00")) if started_at else None
-                    f = datetime.fromisoformat(finished_at.replace("Z","+00:00")) if finished_at else None
-                    dur = int((f - s).total_seconds()) if s and f else None
-                    out.append(CollectorResult(
-                        provider=self.provider,
-                        pipeline_name=str(proj),
-                        external_id=str(pipe.get("id")),
-                        status=status,
-                        started_at=s,
-                        finished_at=f,
-                        duration_seconds=dur,
-                        web_url=pipe.get("web_url"),
-                    ))
-        return out
+                for p in r.json():
+                    active = _time(p.get("last_activity_at"))
+                    if cutoff and active and active < cutoff:
+                        params["page"] = None  # sorted by activity: the rest is older
+                        break
+                    seen[p["id"]] = {"path": p["path_with_namespace"], "last_activity_at": active}
+                else:
+                    params["page"] = r.headers.get("X-Next-Page") or None
+        if full:
+            _membership.update(projects=seen, expires=time.monotonic() + DISCOVERY_TTL)
+            print(f"GitLab: discovered {len(seen)} projects in {', '.join(groups)}")
+        else:
+            _membership["projects"].update(seen)
+        _membership["scanned"] = now
+        return [
+            (pid, p["path"]) for pid, p in _membership["projects"].items()
+            if (p["last_activity_at"] and p["last_activity_at"] >= now - ACTIVE_WINDOW) or _running.get(pid)
+        ]
+
+    def commit(self):
+        for proj, (started, running) in _staged.items():
+            _polled[proj] = started
+            _running[proj] = running
+        _staged.clear()
+
+    async def _pipelines(self, client, proj, name: str, discovered: bool = False, priority: bool = False) -> list[CollectorResult]:
+        """Pipelines of `proj` updated since its previous written poll, oldest update first (the latest 10 on the first one)"""
+        params = {"per_page": 10}
+        if proj in _polled:
+            params = {
+                "updated_after": (_polled[proj] - SLACK).isoformat(),
+                "order_by": "updated_at", "sort": "asc", "per_page": 100, "page": 1,
+            }
+        url = f"{API_URL}/projects/{quote(str(proj), safe='')}/pipelines"
+        started = datetime.now(timezone.utc)
+        pipes = []
+        while True:
+            r = await self.limiter.request(client, "GET", url, priority, params=params)
+            if r.status_code == 404 and discovered:
+                print(f"GitLab: project {name} no longer exists")
+                _membership["projects"].pop(proj, None)
+                _running.pop(proj, None)
+                return []
+            r.raise_for_status()
+            pipes += r.json()
+            next_page = r.headers.get("X-Next-Page") if "page" in params else None
+            if not next_page:
+                break
+            params["page"] = next_page
+        running = set(_running.get(proj, ()))
+        for pipe in pipes:
+            if pipe.get("status") in ACTIVE_STATUSES:
+                running.add(pipe.get("id"))
+            else:
+                running.discard(pipe.get("id"))
+        _staged[proj] = (started, running)
+        return [parse_pipeline(pipe, name) for pipe in pipes]
+
+def parse_pipeline(pipe: dict, project: str) -> CollectorResult:
+    status = pipe.get("status")
+    started_at = pipe.get("created_at")
+    finished_at = pipe.get("updated_at") if status in ("success","failed","canceled","skipped") else None
+    updated_at = pipe.get("updated_at")
+    s = datetime.fromisoformat(started_at.replace("Z","+00:00")) if started_at else None
+    f = datetime.fromisoformat(finished_at.replace("Z","+00:00")) if finished_at else None
+    u = datetime.fromisoformat(updated_at.replace("Z","+00:00")) if updated_at else None
+    dur = int((f - s).total_seconds()) if s and f else None
+    return CollectorResult(
+        provider="gitlab",
+        pipeline_name=str(project),
+        external_id=str(pipe.get("id")),
+        status=status,
+        started_at=s,
+        finished_at=f,
+        duration_seconds=dur,
+        web_url=pipe.get("web_url"),
+        updated_at=u,
+        commit_sha=pipe.get("sha"),
+    )
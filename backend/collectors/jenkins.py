@@ -1,44 +1,232 @@
 
-import os, httpx
+import os, re, json, time, asyncio, httpx
 from datetime import datetime, timezone
+from urllib.parse import urlparse
 from .base import BaseCollector, CollectorResult
+from . import ratelimit
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:  # in requirements.txt; without it tree responses are buffered and parsed whole
+    ijson = None
+
+MODE = os.getenv("JENKINS_MODE", "jobs")  # jobs: one request per JENKINS_JOBS entry | tree: a deep query per folder
+TREE_DEPTH = int(os.getenv("JENKINS_TREE_DEPTH", "3"))
+BUILDS_PER_JOB = int(os.getenv("JENKINS_BUILDS_PER_JOB", "10"))
+TOPOLOGY_TTL = float(os.getenv("JENKINS_TOPOLOGY_TTL_SECONDS", "3600"))
+CONCURRENCY = int(os.getenv("JENKINS_CONCURRENCY", "4"))
+
+BUILD_FIELDS = "number,result,timestamp,duration,url,actions[lastBuiltRevision[SHA1]]"
+# Folders, organization folders and multibranch projects hold jobs rather than builds
+FOLDER_CLASSES = ("Folder", "OrganizationFolder", "MultiBranchProject")
+BUILD_PREFIX = re.compile(r"(jobs\.item\.)+builds\.item")
+
+# Folders queried separately because they sit deeper than TREE_DEPTH below a queried one
+_topology = {"roots": [], "expires": 0.0}
+
+def tree_query(depth: int = TREE_DEPTH, builds: int = BUILDS_PER_JOB) -> str:
+    """Jobs with their latest builds, `depth` levels of folders down; folders on the last level are not expanded"""
+    job = f"name,url,_class,builds[{BUILD_FIELDS}]{{0,{builds}}}"
+    inner = job
+    for _ in range(depth):
+        inner = f"{job},jobs[{inner}]"
+    return f"jobs[{inner}]"
+
+def job_path(url: str) -> str:
+    """Full name of the job at `url`, e.g. .../job/team/job/app/job/main/ -> team/app/main"""
+    return "/".join(p.strip("/") for p in urlparse(url).path.split("/job/")[1:])
+
+def _is_folder(job: dict) -> bool:
+    return (job.get("_class") or "").endswith(FOLDER_CLASSES)
 
 class JenkinsCollector(BaseCollector):
     provider = "jenkins"
 
-    async def list_recent_builds(self):
+    def __init__(self, mode: str | None = None, transport: httpx.AsyncBaseTransport | None = None):
+        self.mode = mode or MODE
+        self.transport = transport
+
+    async def iter_recent_builds(self):
         base = os.getenv("JENKINS_BASE_URL")
         user = os.getenv("JENKINS_USER")
         token = os.getenv("JENKINS_API_TOKEN")
         jobs = os.getenv("JENKINS_JOBS","")
-        out = []
-        if not base or not user or not token or not jobs:
-            return out
+        if not base or not user or not token or (self.mode != "tree" and not jobs):
+            return
         auth = (user, token)
-        async with httpx.AsyncClient(timeout=20, auth=auth) as client:
-            for job in jobs.split(","):
-                job = job.strip().strip("/")
-                if not job:
+        self.limiter = ratelimit.limiter(self.provider, f"{base} {user}")
+        async with httpx.AsyncClient(timeout=20, auth=auth, transport=self.transport) as client:
+            if self.mode == "tree":
+                async for result in self._tree_builds(client, base.rstrip("/")):
+                    yield result
+                return
+            jobs = [job.strip().strip("/") for job in jobs.split(",") if job.strip().strip("/")]
+            for job in ratelimit.prioritize(self.provider, jobs):
+                url = f"{base}/job/{job}/api/json?tree=builds[{BUILD_FIELDS}]{{0,10}}"
+                r = await self.limiter.request(client, "GET", url, ratelimit.is_running(self.provider, job))
+                if r.is_error:
+                    print(f"Jenkins: {job}: HTTP {r.status_code}")
                     continue
-                url = f"{base}/job/{job}/api/json?tree=builds[number,result,timestamp,duration,url]{{0,10}}"
-                r = await client.get(url)
-                r.raise_for_status()
                 data = r.json()
                 for b in data.get("builds", []):
-                    ts = b.get("timestamp")
-                    dur = b.get("duration")
-                    s = datetime.fromtimestamp(ts/1000, tz=timezone.utc) if ts else None
-                    f = datetime.fromtimestamp((ts+dur)/1000, tz=timezone.utc) if ts and dur else None
-                    result = b.get("result")
-                    status = "running" if result is None else ("success" if result=="SUCCESS" else ("failed" if result=="FAILURE" else str(result).lower()))
-                    out.append(CollectorResult(
-                        provider=self.provider,
-                        pipeline_name=job,
-                        external_id=str(b.get("number")),
-                        status=status,
-                        started_at=s,
-                        finished_at=f,
-                        duration_seconds=int(dur/1000) if dur else None,
-                        web_url=b.get("url"),
-                    ))
-        return out
+                    yield parse_build(b, job)
+
+    async def _tree_builds(self, client, base: str):
+        """Builds of every job under JENKINS_FOLDERS (default: the whole controller), one deep query per root.
+
+        Folders found below TREE_DEPTH become roots of their own; the roots are
+        cached for JENKINS_TOPOLOGY_TTL_SECONDS so later cycles query them all
+        at once instead of discovering them level by level.
+        """
+        if time.monotonic() < _topology["expires"]:
+            roots = list(_topology["roots"])
+        else:
+            roots = [f.strip().strip("/") for f in os.getenv("JENKINS_FOLDERS", "").split(",")]
+            roots = list(dict.fromkeys(roots)) or [""]
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+        tasks = []
+
+        async def fetch(folder: str):
+            try:
+                async with semaphore:
+                    async for kind, item in self._walk(client, base, folder):
+                        if kind == "folder":
+                            if item not in roots:
+                                roots.append(item)
+                                tasks.append(asyncio.create_task(fetch(item)))
+                        else:
+                            await queue.put(item)
+                await queue.put(None)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 404 and folder:
+                    print(f"Jenkins: folder {folder} no longer exists")
+                    roots.remove(folder)
+                else:
+                    print(f"Jenkins: folder {folder or '/'}: HTTP {e.response.status_code}")
+                await queue.put(None)
+            except httpx.HTTPError as e:
+                # like a failing job in jobs mode: skipped this cycle, the other folders still count
+                print(f"Jenkins: folder {folder or '/'}: {type(e).__name__}: {e}")
+                await queue.put(None)
+            except Exception as e:
+                await queue.put(e)
+
+        tasks += [asyncio.create_task(fetch(folder)) for folder in roots]
+        finished = 0
+        try:
+            while finished < len(tasks):
+                item = await queue.get()
+                if item is None:
+                    finished += 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield parse_build(item, job_path(item["url"].rstrip("/").rsplit("/", 1)[0]))
+        finally:
+            for task in tasks:
+                task.cancel()
+        _topology.update(roots=roots, expires=time.monotonic() + TOPOLOGY_TTL)
+
+    async def _walk(self, client, base: str, folder: str):
+        """("build", build) and ("folder", full name) items of one tree query, streamed when ijson is installed
+
+        Rate limits, 5xx and connection errors are retried as Limiter.request()
+        does, as long as no item of the failed attempt has been yielded yet.
+        """
+        url = base + "".join(f"/job/{part}" for part in folder.split("/") if part) + "/api/json"
+        for attempt in range(ratelimit.RETRIES + 1):
+            probe = await self.limiter.acquire()
+            yielded = False
+            try:
+                async with client.stream("GET", url, params={"tree": tree_query()}) as r:
+                    if not self.limiter.observe(r) or attempt == ratelimit.RETRIES:
+                        r.raise_for_status()
+                        async for item in _items(r):
+                            yielded = True
+                            yield item
+                        return
+            except httpx.TransportError:
+                self.limiter.failed()
+                if yielded or attempt == ratelimit.RETRIES:
+                    raise
+            finally:
+                self.limiter.settle(probe)
+            await self.limiter.backoff(attempt)
+
+async def _items(r: httpx.Response):
+    """Items of a tree query response, parsed as the bytes arrive when ijson is installed"""
+    if ijson is None:
+        for item in walk_tree(json.loads(await r.aread())):
+            yield item
+        return
+    last = ".".join(["jobs.item"] * (TREE_DEPTH + 1))  # jobs on the unexpanded level
+    builder = job = prefix_open = None
+    async for prefix, event, value in ijson.parse_async(_ByteReader(r.aiter_bytes())):
+        if builder is not None:
+            builder.event(event, value)
+            if event == "end_map" and prefix == prefix_open:
+                yield "build", builder.value
+                builder = None
+        elif event == "start_map" and BUILD_PREFIX.fullmatch(prefix):
+            builder, prefix_open = ObjectBuilder(), prefix
+            builder.event(event, value)
+        elif prefix == last and event in ("start_map", "end_map"):
+            if event == "end_map" and _is_folder(job):
+                yield "folder", job_path(job["url"])
+            job = {}
+        elif prefix in (f"{last}._class", f"{last}.url"):
+            job[prefix.rsplit(".", 1)[1]] = value
+
+class _ByteReader:
+    """File-like view of an httpx byte stream for ijson.parse_async"""
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            return b""  # ijson probes the stream type with read(0)
+        async for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b""
+
+def walk_tree(node: dict, level: int = 0):
+    """Same items as the streaming walk, from an already parsed tree_query() response"""
+    for job in node.get("jobs") or []:
+        for b in job.get("builds") or []:
+            yield "build", b
+        if level < TREE_DEPTH:
+            yield from walk_tree(job, level + 1)
+        elif _is_folder(job):
+            yield "folder", job_path(job["url"])
+
+def parse_build(b: dict, job: str) -> CollectorResult:
+    ts = b.get("timestamp")
+    dur = b.get("duration")
+    s = datetime.fromtimestamp(ts/1000, tz=timezone.utc) if ts else None
+    f = datetime.fromtimestamp((ts+dur)/1000, tz=timezone.utc) if ts and dur else None
+    result = b.get("result")
+    status = "running" if result is None else ("success" if result=="SUCCESS" else ("failed" if result=="FAILURE" else str(result).lower()))
+    return CollectorResult(
+        provider="jenkins",
+        pipeline_name=job,
+        external_id=str(b.get("number")),
+        status=status,
+        started_at=s,
+        finished_at=f,
+        duration_seconds=int(dur/1000) if dur else None,
+        web_url=b.get("url"),
+        # Jenkins has no last-modified time; a finished build is newer than any running state
+        updated_at=f,
+        commit_sha=built_revision(b),
+    )
+
+def built_revision(build: dict) -> str | None:
+    """SHA1 of the git revision a build checked out, from its BuildData action"""
+    for action in build.get("actions") or []:
+        sha = ((action or {}).get("lastBuiltRevision") or {}).get("SHA1")
+        if sha:
+            return sha
+    return None
@@ -0,0 +1,211 @@
+"""
+Request budgets and circuit breakers shared by the collectors.
+
+There is one Limiter per provider, credential and rate-limit resource (e.g. GitHub REST and
+GraphQL points are separate quotas). It reads the quota headers providers
+return (X-RateLimit-* on GitHub, RateLimit-* on GitLab) and:
+- spaces requests evenly until the reset once less than RATELIMIT_PACE_BELOW of
+  the quota is left, and keeps RATELIMIT_RESERVE of it for pipelines with
+  running builds, which collectors poll first and which are never paced
+- waits out 429s and secondary limits (Retry-After), and retries 5xx and
+  connection errors with jittered exponential backoff
+- after CIRCUIT_BREAKER_THRESHOLD consecutive failures stops calling the
+  provider for a jittered, doubling interval, then lets one probe through
+A wait longer than RATELIMIT_MAX_WAIT_SECONDS raises RateLimited instead, which
+ends that provider's cycle; the next cycle tries again.
+"""
+
+import os
+import time
+import random
+import asyncio
+import hashlib
+from collections import Counter
+
+import httpx
+from .base import ACTIVE_STATUSES
+
+RESERVE = float(os.getenv("RATELIMIT_RESERVE", "0.1"))
+PACE_BELOW = float(os.getenv("RATELIMIT_PACE_BELOW", "0.5"))
+MAX_WAIT = float(os.getenv("RATELIMIT_MAX_WAIT_SECONDS", "30"))
+RETRIES = int(os.getenv("RATELIMIT_RETRIES", "3"))
+RETRY_BASE = 1.0
+BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5"))
+BREAKER_BASE = float(os.getenv("CIRCUIT_BREAKER_BASE_SECONDS", "30"))
+BREAKER_MAX = float(os.getenv("CIRCUIT_BREAKER_MAX_SECONDS", "900"))
+
+class RateLimited(Exception):
+    """The provider must not be called now; the rest of the cycle is skipped"""
+
+class BudgetExhausted(RateLimited):
+    pass
+
+class CircuitOpen(RateLimited):
+    pass
+
+def _jitter(seconds: float) -> float:
+    return seconds * random.uniform(0.5, 1.5)
+
+def _header_int(headers, *names) -> int | None:
+    for name in names:
+        value = headers.get(name)
+        if value is not None and value.strip().isdigit():
+            return int(value)
+    return None
+
+class Limiter:
+    def __init__(self, key: str):
+        self.key = key
+        self.limit = self.remaining = None
+        self.reset_at = 0.0  # epoch seconds, from the provider
+        self.blocked_until = 0.0  # after a 429 / secondary rate limit
+        self.last = 0.0
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.counts = Counter()
+
+    def state(self) -> str:
+        if time.time() < self.open_until:
+            return "open"
+        return "half-open" if self.failures >= BREAKER_THRESHOLD else "closed"
+
+    async def acquire(self, priority: bool = False, cost: int = 1) -> bool:
+        """Wait until a request of `cost` fits the budget; raise RateLimited if that is too far off.
+
+        Returns True when the request is the half-open circuit's single probe:
+        the caller must then call settle(True) once it is done with it.
+        """
+        now = time.time()
+        state = self.state()
+        if state == "open" or (state == "half-open" and self.probing):
+            self.counts["rejected"] += 1
+            raise CircuitOpen(f"{self.key}: circuit open for {max(self.open_until - now, 0):.0f}s after {self.failures} failures")
+        probe = state == "half-open"
+        if probe:
+            self.probing = True
+        try:
+            wait = self.blocked_until - now
+            if self.remaining is not None and self.reset_at > now:
+                available = self.remaining - (0 if priority else int(self.limit * RESERVE))
+                if available < cost:
+                    wait = max(wait, self.reset_at - now)
+                elif not priority and self.remaining < self.limit * PACE_BELOW:
+                    wait = max(wait, self.last + (self.reset_at - now) / available * cost - now)
+            if wait > MAX_WAIT:
+                self.counts["rejected"] += 1
+                raise BudgetExhausted(f"{self.key}: {self.remaining} of {self.limit} left, next request allowed in {wait:.0f}s")
+            if wait > 0:
+                self.counts["paced"] += 1
+                await asyncio.sleep(wait)
+        except BaseException:  # including cancellation while paced
+            self.settle(probe)
+            raise
+        self.last = time.time()
+        if self.remaining is not None:
+            self.remaining -= cost  # until the response headers say otherwise
+        self.counts["requests"] += 1
+        return probe
+
+    def settle(self, probe: bool):
+        """End a probe, also one that observe() and failed() never saw (cancelled, or an unexpected error)"""
+        if probe:
+            self.probing = False
+
+    def observe(self, response: httpx.Response) -> bool:
+        """Record a response's quota headers and outcome; True if it should be retried"""
+        h = response.headers
+        remaining = _header_int(h, "x-ratelimit-remaining", "ratelimit-remaining")
+        if remaining is not None:
+            self.remaining = remaining
+            self.limit = _header_int(h, "x-ratelimit-limit", "ratelimit-limit") or self.limit or remaining
+            self.reset_at = float(_header_int(h, "x-ratelimit-reset", "ratelimit-reset") or self.reset_at)
+        status = response.status_code
+        if status == 429 or (status == 403 and ("retry-after" in h or remaining == 0)):
+            retry_after = _header_int(h, "retry-after")
+            self.blocked_until = time.time() + (retry_after if retry_after is not None else max(self.reset_at - time.time(), 60))
+            self.counts["limited"] += 1
+            self.probing = False
+            return True
+        if status >= 500:
+            self.failed()
+            return True
+        self.failures = self.trips = 0
+        self.probing = False
+        return False
+
+    def failed(self):
+        """Count a server error or connection failure towards the circuit breaker"""
+        self.failures += 1
+        self.probing = False
+        self.counts["errors"] += 1
+        if self.failures >= BREAKER_THRESHOLD:
+            self.trips += 1
+            backoff = min(BREAKER_MAX, _jitter(BREAKER_BASE * 2 ** (self.trips - 1)))
+            self.open_until = time.time() + backoff
+            print(f"{self.key}: {self.failures} consecutive failures, circuit open for {backoff:.0f}s")
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, priority: bool = False, cost: int = 1, **kwargs) -> httpx.Response:
+        """client.request() within the budget, retrying rate limits, 5xx and connection errors"""
+        for attempt in range(RETRIES + 1):
+            probe = await self.acquire(priority, cost)
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                self.failed()
+                if attempt == RETRIES:
+                    raise
+            else:
+                if not self.observe(response) or attempt == RETRIES:
+                    return response
+            finally:
+                self.settle(probe)
+            await self.backoff(attempt)
+
+    async def backoff(self, attempt: int):
+        """Pause before retrying a failed `attempt` (counted from 0)"""
+        self.counts["retries"] += 1
+        if self.blocked_until <= time.time():  # rate limits are waited out in acquire()
+            await asyncio.sleep(_jitter(RETRY_BASE * 2 ** attempt))
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "reset_in": round(self.reset_at - now) if self.reset_at > now else None,
+            "circuit": self.state(),
+            "open_for": round(self.open_until - now) if self.open_until > now else None,
+            "failures": self.failures,
+            **self.counts,
+        }
+
+_limiters: dict[str, Limiter] = {}
+_running: dict[str, set] = {}  # provider -> pipelines last seen with an active build
+
+def limiter(provider: str, credential: str | None = None, resource: str | None = None) -> Limiter:
+    """The shared Limiter of a provider's credential (identified by a hash, never stored) and resource"""
+    key = provider
+    if credential:
+        key += ":" + hashlib.sha256(credential.encode()).hexdigest()[:8]
+    if resource:
+        key += ":" + resource
+    return _limiters.setdefault(key, Limiter(key))
+
+def note_cycle(provider: str, active: set, finished: set) -> None:
+    """Track which pipelines have running builds from one cycle's pipelines with and without active results"""
+    _running[provider] = (_running.get(provider, set()) - (finished - active)) | active
+
+def is_running(provider: str, pipeline: str) -> bool:
+    return pipeline in _running.get(provider, ())
+
+def prioritize(provider: str, pipelines: list) -> list:
+    """`pipelines` with those that have running builds first"""
+    return sorted(pipelines, key=lambda p: not is_running(provider, str(p)))
+
+def stats() -> dict:
+    return {
+        "limiters": {key: l.stats() for key, l in _limiters.items()},
+        "running_pipelines": {provider: len(names) for provider, names in _running.items()},
+    }
@@ -0,0 +1,132 @@
+"""
+Online conversion of an existing Postgres database to the compact layout.
+
+For builds.status and pipelines.provider:
+  1. add a SMALLINT shadow column, kept in sync by a trigger for rows written meanwhile
+  2. fill it in id-range batches, one short transaction each
+  3. prove it complete with a NOT VALID check constraint validated without blocking writes
+  4. swap it in under a brief ACCESS EXCLUSIVE lock (lock_timeout bounded, retried)
+Then pipelines get a build URL template and matching builds.web_url values are
+cleared, again in id-range batches. Each swap bumps the "schema" data version in
+its own transaction, so ingest writers (which check it under the same lock)
+switch over before their next write and API workers on their next refresh; old
+values remain readable throughout.
+Batches and lock handling are migrations.Migrator's.
+"""
+
+from sqlalchemy import text, select, func
+from db import engine, SessionLocal, Pipeline, Build, STATUSES, PROVIDERS, detect_compact_layout, infer_url_template, leader_lock
+from migrations import Migrator, BATCH_SIZE
+import data_version
+
+# (table, column, values) converted in this order; pipelines is small, builds is not
+COLUMNS = (
+    ("pipelines", "provider", PROVIDERS),
+    ("builds", "status", STATUSES),
+)
+
+def _code_function(table: str, column: str, values: tuple) -> str:
+    cases = " ".join(f"WHEN '{v}' THEN {i}" for i, v in enumerate(values) if i)
+    return (
+        f"CREATE OR REPLACE FUNCTION cicd_{table}_{column}_code(v text) RETURNS smallint "
+        f"LANGUAGE sql IMMUTABLE AS $$ SELECT (CASE v {cases} ELSE 0 END)::smallint $$"
+    )
+
+def _is_integer(table: str, column: str) -> bool:
+    with engine.connect() as conn:
+        data_type = conn.execute(text(
+            "SELECT data_type FROM information_schema.columns WHERE table_name = :t AND column_name = :c"
+        ), {"t": table, "c": column}).scalar()
+    return data_type in ("smallint", "integer", "bigint")
+
+def convert_column(table: str, column: str, values: tuple, batch_size: int = BATCH_SIZE):
+    if _is_integer(table, column):
+        print(f"{table}.{column} is already compact")
+        return
+    m = Migrator()
+    shadow = f"{column}_code"
+    fn = f"cicd_{table}_{column}_code"
+    print(f"Converting {table}.{column} to SMALLINT codes...")
+    m.execute([
+        _code_function(table, column, values),
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {shadow} SMALLINT",
+        f"CREATE OR REPLACE FUNCTION {fn}_sync() RETURNS trigger LANGUAGE plpgsql AS "
+        f"$$ BEGIN NEW.{shadow} := {fn}(NEW.{column}); RETURN NEW; END $$",
+        f"DROP TRIGGER IF EXISTS {fn}_sync ON {table}",
+        f"CREATE TRIGGER {fn}_sync BEFORE INSERT OR UPDATE OF {column} ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION {fn}_sync()",
+    ])
+    m.backfill(table, f"{shadow} = {fn}({column})", f"{shadow} IS NULL", batch_size=batch_size)
+    check = f"{table}_{shadow}_not_null"
+    m.execute([
+        f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}",
+        f"ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({shadow} IS NOT NULL) NOT VALID",
+    ])
+    # SHARE UPDATE EXCLUSIVE: reads and writes continue while the table is scanned
+    m.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}")
+    # the global data version row first, in the order writers take their locks: a writer
+    # either finishes before the swap or enters after it and sees the schema version move
+    m.execute([
+        "INSERT INTO data_versions (scope, version) VALUES ('global', 0) ON CONFLICT DO NOTHING",
+        "SELECT version FROM data_versions WHERE scope = 'global' FOR UPDATE",
+        f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE",
+        f"DROP TRIGGER {fn}_sync ON {table}",
+        f"ALTER TABLE {table} DROP COLUMN {column}",
+        f"ALTER TABLE {table} RENAME COLUMN {shadow} TO {column}",
+        # the validated check constraint lets SET NOT NULL skip its table scan
+        f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL",
+        f"ALTER TABLE {table} DROP CONSTRAINT {check}",
+        f"DROP FUNCTION {fn}_sync()",
+        "UPDATE data_versions SET version = version + 1 WHERE scope = 'global'",
+        "INSERT INTO data_versions (scope, version) SELECT 'schema', version FROM data_versions WHERE scope = 'global' "
+        "ON CONFLICT (scope) DO UPDATE SET version = EXCLUDED.version",
+    ])
+    data_version.refresh()
+    print(f"✅ {table}.{column} swapped to SMALLINT")
+
+def assign_url_templates() -> int:
+    """Give pipelines without a template one inferred from their latest build URL"""
+    assigned = 0
+    with SessionLocal() as session:
+        latest = select(Build.pipeline_id, func.max(Build.id).label("id")).where(Build.web_url.is_not(None)).group_by(Build.pipeline_id).subquery()
+        rows = session.execute(
+            select(Pipeline, Build.web_url, Build.external_id)
+            .join(latest, latest.c.pipeline_id == Pipeline.id)
+            .join(Build, Build.id == latest.c.id)
+            .where(Pipeline.build_url_template.is_(None))
+        ).all()
+        for pipeline, web_url, external_id in rows:
+            template = infer_url_template(web_url, external_id)
+            if template:
+                pipeline.build_url_template = template
+                assigned += 1
+        session.commit()
+    return assigned
+
+def dedupe_urls(batch_size: int = BATCH_SIZE) -> int:
+    """Clear builds.web_url wherever the pipeline template reproduces it exactly"""
+    return Migrator().backfill(
+        "builds", "web_url = NULL",
+        "web_url IS NOT NULL AND web_url = (SELECT replace(p.build_url_template, '{external_id}', builds.external_id) "
+        "FROM pipelines p WHERE p.id = builds.pipeline_id)",
+        batch_size=batch_size,
+    )
+
+def migrate(batch_size: int = BATCH_SIZE):
+    if engine.dialect.name != "postgresql":
+        print("Online compaction requires PostgreSQL; start new databases with COMPACT_SCHEMA=true instead")
+        return
+    with leader_lock("cicd-dashboard-compact") as leader:
+        if not leader:
+            print("Another process ran the compaction")
+            return
+        for table, column, values in COLUMNS:
+            convert_column(table, column, values, batch_size)
+        print(f"Assigned URL templates to {assign_url_templates()} pipelines")
+        print(f"Cleared {dedupe_urls(batch_size)} derivable build URLs (VACUUM builds to reuse the space)")
+        with SessionLocal() as session:
+            versions = data_version.bump(session, [], [data_version.SCHEMA])
+            session.commit()
+    data_version.publish(versions)
+    detect_compact_layout()
+    print("✅ Compact layout active; set COMPACT_SCHEMA=true so new URLs are stored deduplicated")
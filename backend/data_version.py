@@ -0,0 +1,180 @@
+import os
+import time
+import asyncio
+
+from fastapi import Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql
+
+from db import SessionLocal, DataVersion, Pipeline, detect_compact_layout
+
+GLOBAL = "global"
+PIPELINES = "pipelines"  # bumped when pipelines are created or deleted
+SCHEMA = "schema"  # bumped by online schema changes workers must adapt to
+PURGE = "purge"  # bumped when builds are deleted outside ingestion, e.g. clearing sample data
+ROLLUP_ZONES = "rollup_zones"  # bumped when a time zone gets local rollups, or their backfill completes
+REFRESH_SECONDS = float(os.getenv("DATA_VERSION_REFRESH_SECONDS", "2"))
+# Read endpoints answered with an ETag and 304 on a matching If-None-Match
+CONDITIONAL_PATH_PREFIXES = ("/api/metrics", "/api/builds", "/api/logs")
+# Without an explicit end ("to", "until") a window ends at "now" and moves without
+# new data, so those tags also carry the current NOW_BUCKET_SECONDS time bucket
+WINDOW_END_PARAMS = ("to", "until")
+# Endpoints whose `pipeline` parameter names exactly one pipeline, so its scope covers
+# the response. The metrics endpoints match it as a substring of many pipeline names
+# and are tagged with the provider's scope instead.
+EXACT_PIPELINE_PATHS: tuple[str, ...] = ()
+NOW_BUCKET_SECONDS = int(os.getenv("ETAG_NOW_BUCKET_SECONDS", "60"))
+
+# scope -> version, as last seen by this process; requests are answered from here only
+_versions: dict[str, int] = {}
+# scope -> callbacks run when this process sees that scope's version move
+_watchers: dict[str, list] = {}
+
+def watch(scope: str, fn):
+    _watchers.setdefault(scope, []).append(fn)
+
+def provider_scope(provider: str) -> str:
+    return f"provider:{provider}"
+
+def pipeline_scope(provider: str, name: str) -> str:
+    return f"pipeline:{provider}/{name}"
+
+def scopes_of(pipelines) -> set[str]:
+    """Provider and pipeline scopes of (provider, name) pairs, e.g. pipelines being seeded or deleted"""
+    scopes = set()
+    for provider, name in pipelines:
+        scopes.add(provider_scope(provider))
+        scopes.add(pipeline_scope(provider, name))
+    return scopes
+
+def scopes_of_ids(session, pipeline_ids) -> set[str]:
+    """scopes_of() for pipelines given by id"""
+    return scopes_of(session.execute(select(Pipeline.provider, Pipeline.name).where(Pipeline.id.in_(pipeline_ids))).all())
+
+def current(scope: str = GLOBAL, fallback: bool = True) -> int | None:
+    """Version of `scope`, falling back to the global version for scopes never written."""
+    if not fallback:
+        return _versions.get(scope)
+    return _versions.get(scope, _versions.get(GLOBAL))
+
+def lock(session):
+    """Take the global version row lock that serializes ingest writers, held until the transaction ends.
+
+    Writers take it before reading the rows they are about to change, so two
+    batches carrying the same build cannot both insert it or overwrite each other.
+    """
+    if session.get_bind().dialect.name == "sqlite":
+        # no row locks: any write takes the database's single write lock
+        session.execute(update(DataVersion).where(DataVersion.scope==GLOBAL).values(version=DataVersion.version))
+        return
+    query = select(DataVersion.version).where(DataVersion.scope==GLOBAL).with_for_update()
+    if session.execute(query).first() is None:
+        session.execute(postgresql.insert(DataVersion).values(scope=GLOBAL, version=0).on_conflict_do_nothing())
+        session.execute(query)
+
+def sync_schema(session):
+    """Adopt a schema change committed before `session` took lock(), ahead of writing in the old layout.
+
+    The online compaction swaps a column and bumps SCHEMA in one transaction
+    under the same lock, so a writer holding it always sees the current layout.
+    """
+    version = session.execute(select(DataVersion.version).where(DataVersion.scope==SCHEMA)).scalar()
+    if version is not None and version != _versions.get(SCHEMA):
+        detect_compact_layout()
+        publish({SCHEMA: version})
+
+def bump(session, transitions: list[dict], scopes=()) -> dict[str, int]:
+    """Advance the global data version and those of everything in `transitions` plus `scopes`.
+
+    Runs inside the ingest transaction; the global row is locked so versions
+    are assigned in commit order across workers. Call `publish()` with the
+    result once the transaction has committed.
+    """
+    scopes = set(scopes) - {GLOBAL}
+    for t in transitions:
+        scopes.add(provider_scope(t["provider"]))
+        scopes.add(pipeline_scope(t["provider"], t["pipeline"]))
+    if not scopes:
+        return {}
+    row = session.execute(select(DataVersion).where(DataVersion.scope==GLOBAL).with_for_update()).scalar_one_or_none()
+    if row is None:
+        row = DataVersion(scope=GLOBAL, version=0)
+        session.add(row)
+    row.version += 1
+    version = row.version
+    existing = {
+        v.scope: v for v in session.execute(select(DataVersion).where(DataVersion.scope.in_(scopes))).scalars()
+    }
+    for scope in scopes:
+        if scope in existing:
+            existing[scope].version = version
+        else:
+            session.add(DataVersion(scope=scope, version=version))
+    scopes.add(GLOBAL)
+    return dict.fromkeys(scopes, version)
+
+def publish(versions: dict[str, int]):
+    # the first versions a process loads are its baseline, not changes
+    loaded = bool(_versions)
+    changed = []
+    for scope, version in versions.items():
+        if version > _versions.get(scope, -1):
+            if loaded and scope in _watchers:
+                changed.append(scope)
+            _versions[scope] = version
+    for scope in changed:
+        for fn in _watchers[scope]:
+            try:
+                fn()
+            except Exception as e:
+                print(f"Data version watcher for {scope} failed:", e)
+
+def refresh():
+    """Pick up versions written by other workers since the last refresh."""
+    seen = max(_versions.values(), default=-1)
+    with SessionLocal() as session:
+        rows = session.execute(select(DataVersion.scope, DataVersion.version).where(DataVersion.version > seen)).all()
+    publish(dict(rows))
+
+async def refresh_loop():
+    while True:
+        try:
+            await asyncio.to_thread(refresh)
+        except Exception as e:
+            print("Data version refresh error:", e)
+        await asyncio.sleep(REFRESH_SECONDS)
+
+def _etag(request: Request) -> str | None:
+    params = request.query_params
+    if params.get("provider") and params.get("pipeline") and request.url.path in EXACT_PIPELINE_PATHS:
+        scope = pipeline_scope(params["provider"], params["pipeline"])
+    elif params.get("provider"):
+        scope = provider_scope(params["provider"])
+    else:
+        scope = GLOBAL
+    version = current(scope)
+    if version is None:
+        return None
+    if any(params.get(p) for p in WINDOW_END_PARAMS):
+        return f'W/"{scope}-{version}"'
+    # "today", "last 7 days" and default time-series ranges roll over without new data
+    return f'W/"{scope}-{version}-{int(time.time() // NOW_BUCKET_SECONDS)}"'
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag.removeprefix("W/") for tag in if_none_match.split(","))
+
+async def etag_middleware(request: Request, call_next):
+    if request.method != "GET" or not request.url.path.startswith(CONDITIONAL_PATH_PREFIXES):
+        return await call_next(request)
+    etag = _etag(request)
+    if etag is None:
+        return await call_next(request)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers["ETag"] = etag
+    return response
@@ -1,64 +1,383 @@
 
 import os
-from datetime import datetime
-from sqlalchemy import create_engine, Integer, String, Text, TIMESTAMP, BigInteger, ForeignKey, Boolean, inspect
+import zlib
+import fcntl
+from contextlib import contextmanager
+from datetime import date, datetime
+from sqlalchemy import create_engine, event, Index, Integer, SmallInteger, String, Text, TIMESTAMP, BigInteger, ForeignKey, Boolean, Date, inspect, text
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import declarative_base, mapped_column, Mapped, sessionmaker
 from sqlalchemy.sql import func
 
-DB_URL = f"postgresql+psycopg2://{os.getenv('POSTGRES_USER','cicd_user')}:{os.getenv('POSTGRES_PASSWORD','supersecret')}@{os.getenv('POSTGRES_HOST','postgres')}:{os.getenv('POSTGRES_PORT','5432')}/{os.getenv('POSTGRES_DB','cicd_health')}"
+# postgres (default) or sqlite: an embedded single-file database for single-box and test deployments
+DB_BACKEND = os.getenv("DB_BACKEND", "postgres").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cicd_health.db"))
 
-engine = create_engine(DB_URL, echo=False, future=True, pool_pre_ping=True)
+if DB_BACKEND == "sqlite":
+    DB_URL = f"sqlite:///{SQLITE_PATH}"
+    engine = create_engine(DB_URL, echo=False, future=True, connect_args={"check_same_thread": False, "timeout": 30})
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        # WAL lets API reads proceed while ingestion writes; foreign_keys enables ON DELETE CASCADE
+        for pragma in ("journal_mode=WAL", "synchronous=NORMAL", "foreign_keys=ON", "busy_timeout=30000"):
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+else:
+    DB_URL = f"postgresql+psycopg2://{os.getenv('POSTGRES_USER','cicd_user')}:{os.getenv('POSTGRES_PASSWORD','supersecret')}@{os.getenv('POSTGRES_HOST','postgres')}:{os.getenv('POSTGRES_PORT','5432')}/{os.getenv('POSTGRES_DB','cicd_health')}"
+    engine = create_engine(DB_URL, echo=False, future=True, pool_pre_ping=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+
+# Optional streaming replica for read-only endpoints (see replica.py); same credentials as the primary
+READ_HOST = os.getenv("POSTGRES_READ_HOST")
+read_engine = None
+ReadSessionLocal = None
+if READ_HOST and DB_BACKEND != "sqlite":
+    READ_DB_URL = f"postgresql+psycopg2://{os.getenv('POSTGRES_USER','cicd_user')}:{os.getenv('POSTGRES_PASSWORD','supersecret')}@{READ_HOST}:{os.getenv('POSTGRES_READ_PORT', os.getenv('POSTGRES_PORT','5432'))}/{os.getenv('POSTGRES_DB','cicd_health')}"
+    read_engine = create_engine(
+        READ_DB_URL, echo=False, future=True, pool_pre_ping=True,
+        pool_size=int(os.getenv("READ_POOL_SIZE", "10")), max_overflow=int(os.getenv("READ_POOL_OVERFLOW", "20")),
+    )
+    ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False, future=True)
+
+# Optional DuckDB engine answering the aggregate endpoints straight from the SQLite
+# file (see replica.get_analytics_session). Its sqlite extension is looked up in
+# DUCKDB_EXTENSION_DIRECTORY, where the image pre-installs it; elsewhere DuckDB
+# downloads it on first use
+DUCKDB_ANALYTICS = DB_BACKEND == "sqlite" and os.getenv("DUCKDB_ANALYTICS", "false").lower() == "true"
+DUCKDB_EXTENSION_DIRECTORY = os.getenv("DUCKDB_EXTENSION_DIRECTORY")
+analytics_engine = None
+AnalyticsSessionLocal = None
+if DUCKDB_ANALYTICS:
+    try:
+        analytics_engine = create_engine("duckdb:///:memory:", future=True)
+    except Exception as e:  # duckdb / duckdb_engine not installed
+        print("DuckDB analytics unavailable, aggregating in SQLite:", e)
+    else:
+        @event.listens_for(analytics_engine, "connect")
+        def _attach_sqlite(dbapi_conn, _record):
+            if DUCKDB_EXTENSION_DIRECTORY:
+                dbapi_conn.execute(f"SET extension_directory = '{DUCKDB_EXTENSION_DIRECTORY}'")
+            dbapi_conn.execute(f"ATTACH '{SQLITE_PATH}' AS app (TYPE sqlite, READ_ONLY)")
+            dbapi_conn.execute("USE app")
+        AnalyticsSessionLocal = sessionmaker(bind=analytics_engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
+# Compact layout: builds.status and pipelines.provider stored as SMALLINT codes
+# and build URLs derived from a per-pipeline template. Decides the DDL of new
+# databases; existing ones are converted with `seed_db.py --action compact`.
+COMPACT_SCHEMA = os.getenv("COMPACT_SCHEMA", "false").lower() == "true"
+
+# Stable small-integer codes for build statuses. Append only: codes are stored
+# in the compact layout and sent to clients alongside this table.
+STATUSES = (
+    "unknown", "success", "failed", "running", "cancelled", "skipped", "pending", "queued",
+    "in_progress", "created", "manual", "scheduled", "waiting_for_resource", "preparing",
+    "requested", "waiting", "canceled", "error", "timed_out", "aborted", "unstable", "not_built",
+    "failure", "neutral", "action_required", "stale", "startup_failure",
+)
+STATUS_CODES = {s: i for i, s in enumerate(STATUSES)}
+
+def status_code(status: str | None) -> int:
+    return STATUS_CODES.get(status, 0)
+
+PROVIDERS = ("unknown", "github", "gitlab", "jenkins")  # append only, like STATUSES
+
+# "<table>.<column>" of coded columns currently stored as integers, see detect_compact_layout()
+compact_columns: set[str] = set()
+
+class CodedString(TypeDecorator):
+    """A string column that is stored as an index into `values` once its column is compact.
+
+    Python code always sees strings, so queries, filters and API output are the
+    same in both layouts; values outside `values` are stored as 0 ("unknown"),
+    so writers compare against `stored(value)` rather than the raw value.
+    """
+    impl = String(16)
+    cache_ok = True
+
+    def __init__(self, column: str, values: tuple):
+        super().__init__()
+        self.column = column
+        self.values = values
+        self._codes = {v: i for i, v in enumerate(values)}
+
+    def stored(self, value):
+        """`value` as it reads back from the column in its current layout"""
+        if value is None or self.column not in compact_columns or value in self._codes:
+            return value
+        return self.values[0]
+
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(SmallInteger() if COMPACT_SCHEMA else String(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or self.column not in compact_columns:
+            return value
+        return self._codes.get(value, 0)
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, int):
+            return self.values[value] if 0 <= value < len(self.values) else self.values[0]
+        return value
+
+BUILD_STATUS = CodedString("builds.status", STATUSES)
+
+def infer_url_template(web_url: str | None, external_id: str | None) -> str | None:
+    """'https://ci/x/runs/{external_id}' when the build URL embeds its external id"""
+    if not web_url or not external_id or "{external_id}" in web_url:
+        return None
+    i = web_url.rfind(external_id)
+    if i < 0:
+        return None
+    return web_url[:i] + "{external_id}" + web_url[i + len(external_id):]
+
+def build_web_url(stored: str | None, template: str | None, external_id: str) -> str | None:
+    """A build's URL: stored in full, or derived from its pipeline's template"""
+    if stored or not template:
+        return stored
+    return template.replace("{external_id}", external_id)
+
+class utc_day(FunctionElement):
+    """Calendar day of a timestamp column, as a Date on every backend"""
+    type = Date()
+    name = "utc_day"
+    inherit_cache = True
+
+@compiles(utc_day)
+def _utc_day(element, compiler, **kw):
+    return f"CAST({compiler.process(element.clauses, **kw)} AS DATE)"
+
+@compiles(utc_day, "sqlite")
+def _utc_day_sqlite(element, compiler, **kw):
+    # SQLite has no DATE type; date() yields 'YYYY-MM-DD', which Date parses back
+    return f"date({compiler.process(element.clauses, **kw)})"
+
 class Pipeline(Base):
     __tablename__ = "pipelines"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    provider: Mapped[str] = mapped_column(String(16), nullable=False)
+    provider: Mapped[str] = mapped_column(CodedString("pipelines.provider", PROVIDERS), nullable=False)
     name: Mapped[str] = mapped_column(Text, nullable=False)
     external_id: Mapped[str | None] = mapped_column(Text, nullable=True)
     url: Mapped[str | None] = mapped_column(Text, nullable=True)
+    build_url_template: Mapped[str | None] = mapped_column(Text, nullable=True)  # see infer_url_template()
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
 
 class Build(Base):
     __tablename__ = "builds"
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # existing databases get these through migrations.py (CREATE INDEX CONCURRENTLY)
+    __table_args__ = (
+        Index("ix_builds_pipeline_external", "pipeline_id", "external_id"),
+        Index("ix_builds_pipeline_started", "pipeline_id", "started_at", "id"),
+        Index("ix_builds_started_at", "started_at"),
+    )
+    # SQLite only auto-assigns ids to an INTEGER PRIMARY KEY (its 64-bit rowid)
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
     pipeline_id: Mapped[int] = mapped_column(Integer, ForeignKey("pipelines.id", ondelete="CASCADE"))
     external_id: Mapped[str] = mapped_column(Text, nullable=False)
-    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    status: Mapped[str] = mapped_column(BUILD_STATUS, nullable=False)
     started_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
     finished_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
     duration_seconds: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    web_url: Mapped[str | None] = mapped_column(Text, nullable=True)
+    web_url: Mapped[str | None] = mapped_column(Text, nullable=True)  # NULL when the pipeline's template yields it
     event_source: Mapped[str | None] = mapped_column(String(32), nullable=True)  # webhook | poll
+    provider_updated_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    commit_sha: Mapped[str | None] = mapped_column(String(64), nullable=True)
     logs: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
+    # global data version of the write that last created or changed the row; versions are
+    # assigned in commit order, so exports pick up every change after the one they last saw
+    data_version: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
 
-def run_migrations():
-    """Run database migrations to handle schema updates"""
-    inspector = inspect(engine)
-    
-    # Check if pipelines table exists
-    if not inspector.has_table("pipelines"):
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    scope: Mapped[str] = mapped_column(Text, primary_key=True)  # global | provider:<p> | pipeline:<p>/<name>
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+class SchemaMigration(Base):
+    """One row per applied migrations.py version"""
+    __tablename__ = "schema_migrations"
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(Text, nullable=False)
+    applied_at = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+    duration_ms: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class DurationSketch(Base):
+    __tablename__ = "duration_sketches"
+    pipeline_id: Mapped[int] = mapped_column(Integer, ForeignKey("pipelines.id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # UTC day the builds finished
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    buckets: Mapped[str] = mapped_column(Text, nullable=False, default="{}")  # JSON {bucket index: count}
+
+class DetectorState(Base):
+    __tablename__ = "detector_states"
+    pipeline_id: Mapped[int] = mapped_column(Integer, ForeignKey("pipelines.id", ondelete="CASCADE"), primary_key=True)
+    state: Mapped[str] = mapped_column(Text, nullable=False)  # JSON of anomalies.PipelineState
+    updated_at = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+class AnomalyEvent(Base):
+    """Anomalies raised by the detectors, written in the ingest transaction that raised them"""
+    __tablename__ = "anomaly_events"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    pipeline_id: Mapped[int] = mapped_column(Integer, ForeignKey("pipelines.id", ondelete="CASCADE"))
+    detected_at = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+    event: Mapped[str] = mapped_column(Text, nullable=False)  # JSON, as published to clients and alerters
+
+class ReliabilityState(Base):
+    """Per-pipeline streak/recovery state, advanced as builds complete"""
+    __tablename__ = "reliability_states"
+    pipeline_id: Mapped[int] = mapped_column(Integer, ForeignKey("pipelines.id", ondelete="CASCADE"), primary_key=True)
+    last_finished_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    streak_status: Mapped[str | None] = mapped_column(String(16), nullable=True)  # success | failed
+    streak_length: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failing_since: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    longest_failure_streak: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class ReliabilityDaily(Base):
+    """Per-pipeline daily reliability counters; any window sums O(days) rows"""
+    __tablename__ = "reliability_daily"
+    pipeline_id: Mapped[int] = mapped_column(Integer, ForeignKey("pipelines.id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    builds: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failures: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failure_onsets: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # success -> failed changes
+    recoveries: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    recovery_seconds: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    max_failure_streak: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class BuildRollup(Base):
+    """Build counts and durations per provider and time bucket, at each rollups.RESOLUTIONS and RollupZone"""
+    __tablename__ = "build_rollups"
+    resolution: Mapped[str] = mapped_column(String(64), primary_key=True)  # 5m | 1h | 1d | 1w | 1d@<zone> | 1w@<zone>
+    provider: Mapped[str] = mapped_column(String(16), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)  # UTC, by build start
+    builds: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    success: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    running: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    duration_sum: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)  # finished builds only
+    duration_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class RollupZone(Base):
+    """A time zone with local-day and local-week rollups: from ROLLUP_TIMEZONES, or registered by a timeseries query"""
+    __tablename__ = "rollup_zones"
+    name: Mapped[str] = mapped_column(String(61), primary_key=True)  # IANA name; fits "1w@<name>" in a resolution
+    configured: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)  # listed in ROLLUP_TIMEZONES
+    ready_at = mapped_column(TIMESTAMP(timezone=True), nullable=True)  # backfilled; queries read the zone from then on
+
+class BuildEvent(Base):
+    """Append-only log of build status transitions; on Postgres partitioned by month of occurred_at"""
+    __tablename__ = "build_events"
+    __table_args__ = {"postgresql_partition_by": "RANGE (occurred_at)"}
+    pipeline_id: Mapped[int] = mapped_column(Integer, ForeignKey("pipelines.id", ondelete="CASCADE"), primary_key=True)
+    external_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    occurred_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)  # provider time of the change
+    status_new: Mapped[str] = mapped_column(String(16), primary_key=True)
+    status_old: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    source: Mapped[str | None] = mapped_column(String(32), nullable=True)  # webhook | poll | backfill
+    started_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    duration_seconds: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    recorded_at = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
+
+class PipelineCheckpoint(Base):
+    """State of every pipeline at `at`, folded from build_events so snapshots replay only what follows"""
+    __tablename__ = "pipeline_checkpoints"
+    at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
+    pipeline_id: Mapped[int] = mapped_column(Integer, ForeignKey("pipelines.id", ondelete="CASCADE"), primary_key=True)
+    external_id: Mapped[str] = mapped_column(Text, nullable=False)  # latest build as of `at`
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    started_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    occurred_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+def ensure_event_partitions(months_ahead: int = 2):
+    """Create monthly build_events partitions up to `months_ahead` months out, plus a default one"""
+    if engine.dialect.name != "postgresql":
         return
-    
-    # Check if is_active column exists in pipelines table
-    columns = [col['name'] for col in inspector.get_columns("pipelines")]
-    
-    if "is_active" not in columns:
-        print("Adding is_active column to pipelines table...")
-        with engine.connect() as conn:
-            conn.execute("ALTER TABLE pipelines ADD COLUMN is_active BOOLEAN DEFAULT TRUE NOT NULL")
-            conn.commit()
-        print("✅ Added is_active column successfully")
+    today = datetime.utcnow().date().replace(day=1)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS build_events_default PARTITION OF build_events DEFAULT"))
+    for i in range(months_ahead + 1):
+        year, month = divmod(today.month - 1 + i, 12)
+        start = date(today.year + year, month + 1, 1)
+        year, month = divmod(start.month, 12)
+        end = date(start.year + year, month + 1, 1)
+        name = f"build_events_{start:%Y_%m}"
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF build_events FOR VALUES FROM ('{start}') TO ('{end}')"
+                ))
+        except Exception as e:
+            # fails when the default partition already holds rows for that month
+            print(f"Could not create partition {name}:", e)
+
+def init_db(background_migrations: bool = True):
+    """Initialize database with tables and run migrations.
 
-def init_db():
-    """Initialize database with tables and run migrations"""
+    With background_migrations=False, index builds and backfills are left for
+    migrations.run_background() so the caller can start serving first.
+    """
+    import migrations
     # Create tables
     Base.metadata.create_all(engine)
     
     # Run migrations
-    run_migrations()
+    migrations.run(background=None if background_migrations else False)
+    ensure_event_partitions()
+    detect_compact_layout()
+
+def detect_compact_layout():
+    """Record which coded columns the database actually stores as integers"""
+    inspector = inspect(engine)
+    found = set()
+    for table in ("builds", "pipelines"):
+        if not inspector.has_table(table):
+            continue
+        for col in inspector.get_columns(table):
+            key = f"{table}.{col['name']}"
+            if key in ("builds.status", "pipelines.provider") and isinstance(col["type"], Integer):
+                found.add(key)
+    compact_columns.clear()
+    compact_columns.update(found)
+    return found
+
+@contextmanager
+def leader_lock(name: str):
+    """Yield True in exactly one process holding a Postgres advisory lock for `name`.
+
+    Other processes block until the leader releases the lock and then get False,
+    so they never run ahead of e.g. migrations the leader is applying. With the
+    SQLite backend a file lock next to the database plays the advisory lock.
+    """
+    if engine.dialect.name == "sqlite":
+        with open(f"{SQLITE_PATH}.{name}.lock", "w") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                leader = True
+            except BlockingIOError:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                leader = False
+            try:
+                yield leader
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    key = zlib.crc32(name.encode())
+    with engine.connect() as conn:
+        leader = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": key}).scalar()
+        if not leader:
+            conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": key})
+        try:
+            yield bool(leader)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": key})
+            conn.commit()
 
 def get_session():
     db = SessionLocal()
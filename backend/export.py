@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Columnar export of build history (builds joined with pipelines) for offline analysis.
+
+Rows are streamed from the database with a server-side cursor (yield_per) in
+record batches of EXPORT_BATCH_ROWS and never held in memory all at once.
+
+`snapshot()` writes Hive-partitioned Parquet under EXPORT_DIR:
+
+    builds/provider=<provider>/month=<YYYY-MM>/snapshot-<id>.parquet
+    builds/_snapshots.json     manifest, written last
+
+The first snapshot is full; later ones hold only builds created or changed
+since the previous one, so a build can appear in several snapshots: keep the
+row with the highest snapshot_id per id. Snapshots read the primary and record
+the global data version they started from; every build written after it
+carries a higher builds.data_version (versions follow commit order), so the
+next snapshot misses nothing however long a write transaction ran. Tools such
+as DuckDB, pandas or pyarrow.dataset read the directory directly, without the
+production DB or the API.
+
+`arrow_stream()` yields the same columns as an Arrow IPC stream for the API,
+from the replica when one is configured. Requires pyarrow.
+"""
+
+import os
+import sys
+import json
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: exports are unavailable without pyarrow
+    pa = pq = None
+
+# Add the current directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import select, or_, tuple_
+from db import SessionLocal, Build, Pipeline, BuildEvent, DataVersion, build_web_url
+from replica import get_read_session
+import data_version
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports"))
+BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+COMPRESSION = os.getenv("EXPORT_COMPRESSION", "zstd")
+# build_events are partitioned by provider time; changes recorded since the last
+# snapshot are looked for among events that occurred at most this long before it
+EVENT_SLACK = timedelta(days=int(os.getenv("EXPORT_EVENT_SLACK_DAYS", "7")))
+MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+COLUMNS = (
+    ("id", "int64"), ("provider", "string"), ("pipeline", "string"), ("external_id", "string"),
+    ("status", "string"), ("started_at", "timestamp"), ("finished_at", "timestamp"),
+    ("duration_seconds", "int32"), ("commit_sha", "string"), ("event_source", "string"),
+    ("web_url", "string"), ("created_at", "timestamp"),
+)
+
+def available() -> bool:
+    return pa is not None
+
+def schema(snapshot_id: bool = False):
+    types = {"int64": pa.int64(), "int32": pa.int32(), "string": pa.string(), "timestamp": pa.timestamp("us", tz="UTC")}
+    fields = [pa.field(name, types[kind]) for name, kind in COLUMNS]
+    if snapshot_id:
+        fields.append(pa.field("snapshot_id", pa.int32()))
+    return pa.schema(fields)
+
+read_session = contextmanager(get_read_session)
+
+def _query(since: datetime | None = None, provider: str | None = None, since_version: int | None = None):
+    stmt = select(
+        Build.id, Pipeline.provider, Pipeline.name.label("pipeline"), Build.external_id, Build.status,
+        Build.started_at, Build.finished_at, Build.duration_seconds, Build.commit_sha, Build.event_source,
+        Build.web_url, Pipeline.build_url_template, Build.created_at,
+    ).join(Pipeline, Pipeline.id == Build.pipeline_id)
+    if since is not None:
+        # SQLite stores server timestamps as text without fractional seconds, so a build written in
+        # the same second as `since` compares as older; the one-second overlap only repeats rows
+        since = since - timedelta(seconds=1)
+        changed = select(BuildEvent.pipeline_id, BuildEvent.external_id).where(
+            BuildEvent.occurred_at >= since - EVENT_SLACK, BuildEvent.recorded_at >= since,
+        )
+        stmt = stmt.where(or_(Build.created_at >= since, tuple_(Build.pipeline_id, Build.external_id).in_(changed)))
+    if since_version is not None:
+        stmt = stmt.where(Build.data_version > since_version)
+    if provider:
+        stmt = stmt.where(Pipeline.provider == provider)
+    return stmt.order_by(Build.id).execution_options(yield_per=BATCH_ROWS)
+
+def _columns(rows) -> dict[str, list]:
+    data = {name: [] for name, _ in COLUMNS}
+    for r in rows:
+        for name, _ in COLUMNS:
+            data[name].append(build_web_url(r.web_url, r.build_url_template, r.external_id) if name == "web_url" else getattr(r, name))
+    return data
+
+def _batches(session, stmt):
+    target = schema()
+    for rows in session.execute(stmt).partitions():
+        yield pa.RecordBatch.from_pydict(_columns(rows), schema=target)
+
+def batches(since: datetime | None = None, provider: str | None = None):
+    """Record batches of at most BATCH_ROWS builds, streamed from a server-side cursor"""
+    with read_session() as session:
+        yield from _batches(session, _query(since, provider))
+
+def arrow_stream(since: datetime | None = None, provider: str | None = None):
+    """Arrow IPC stream bytes: schema message, one message per record batch, end-of-stream marker"""
+    yield schema().serialize().to_pybytes()
+    for batch in batches(since, provider):
+        yield batch.serialize().to_pybytes()
+    yield b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+def _manifest_path() -> str:
+    return os.path.join(EXPORT_DIR, "builds", "_snapshots.json")
+
+def snapshots() -> list[dict]:
+    try:
+        with open(_manifest_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def _partition(provider: str, started_at) -> str:
+    month = started_at.strftime("%Y-%m") if started_at else "unknown"
+    return os.path.join(EXPORT_DIR, "builds", f"provider={provider}", f"month={month}")
+
+def snapshot(full: bool = False) -> dict:
+    """Write the builds changed since the last snapshot (all of them if `full` or none exists)"""
+    previous = snapshots()
+    # manifests written before builds.data_version have no version to continue from
+    since = None if full or not previous else previous[-1].get("data_version")
+    snapshot_id = previous[-1]["id"] + 1 if previous else 1
+    taken_at = datetime.now(timezone.utc)
+    target = schema(snapshot_id=True)
+    writers: dict[str, "pq.ParquetWriter"] = {}
+    files: list[str] = []
+    rows = 0
+    # the primary, as a replica may lag behind the version read here
+    with SessionLocal() as session:
+        # read before the builds: a write committed in between is exported now and again next time
+        version = session.execute(select(DataVersion.version).where(DataVersion.scope==data_version.GLOBAL)).scalar() or 0
+        try:
+            for batch in _batches(session, _query(since_version=since)):
+                parts: dict[str, list[int]] = {}
+                providers, started = batch.column("provider").to_pylist(), batch.column("started_at").to_pylist()
+                for i, (p, s) in enumerate(zip(providers, started)):
+                    parts.setdefault(_partition(p, s), []).append(i)
+                for directory, indices in parts.items():
+                    writer = writers.get(directory)
+                    if writer is None:
+                        os.makedirs(directory, exist_ok=True)
+                        path = os.path.join(directory, f"snapshot-{snapshot_id:05d}.parquet")
+                        writer = writers[directory] = pq.ParquetWriter(path + ".tmp", target, compression=COMPRESSION)
+                        files.append(path)
+                    part = batch.take(pa.array(indices, pa.int32()))
+                    writer.write_batch(part.append_column("snapshot_id", pa.array([snapshot_id] * len(part), pa.int32())))
+                rows += batch.num_rows
+        finally:
+            for writer in writers.values():
+                writer.close()
+    for path in files:
+        os.replace(path + ".tmp", path)
+    entry = {
+        "id": snapshot_id, "taken_at": taken_at.isoformat(), "data_version": version, "since_version": since,
+        "rows": rows, "files": [os.path.relpath(p, os.path.join(EXPORT_DIR, "builds")) for p in files],
+    }
+    os.makedirs(os.path.dirname(_manifest_path()), exist_ok=True)
+    with open(_manifest_path() + ".tmp", "w") as f:
+        json.dump(previous + [entry], f, indent=2)
+    os.replace(_manifest_path() + ".tmp", _manifest_path())
+    return entry
+
+def main():
+    parser = argparse.ArgumentParser(description='Export build history to partitioned Parquet')
+    parser.add_argument('action', choices=['snapshot', 'list'], help='Write a snapshot, or list existing ones')
+    parser.add_argument('--full', action='store_true', help='Export all builds instead of changes since the last snapshot')
+    args = parser.parse_args()
+    if args.action == 'list':
+        for s in snapshots():
+            since = s.get("since_version", s.get("since"))  # a timestamp in manifests from before data versions
+            print(f"{s['id']:>5}  {s['taken_at']}  {s['rows']:>9} rows  {len(s['files'])} files  since {'(full)' if since is None else since}")
+        return
+    if not available():
+        print("Parquet export requires the pyarrow package: pip install pyarrow")
+        sys.exit(1)
+    entry = snapshot(full=args.full)
+    print(f"✅ Snapshot {entry['id']}: {entry['rows']} builds in {len(entry['files'])} files under {EXPORT_DIR}")
+
+if __name__ == "__main__":
+    main()
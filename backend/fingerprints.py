@@ -0,0 +1,94 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import timezone
+
+from sqlalchemy import select
+
+from db import SessionLocal, Pipeline, Build
+
+CACHE_SIZE = int(os.getenv("FINGERPRINT_CACHE_SIZE", "100000"))
+WARM_BUILDS = int(os.getenv("FINGERPRINT_WARM_BUILDS", "20000"))
+
+# (provider, pipeline, external_id) -> fingerprint of the last state written for that build, LRU ordered
+_cache: OrderedDict = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_lock = threading.Lock()
+
+def _utc(dt):
+    return dt.replace(tzinfo=timezone.utc) if dt is not None and dt.tzinfo is None else dt
+
+def _key(provider, pipeline_name, external_id):
+    return (provider, pipeline_name, external_id)
+
+def _fingerprint(status, duration_seconds, started_at, finished_at) -> int:
+    # SQLite hands back naive UTC timestamps; normalize so they hash like the collectors' aware ones
+    return hash((status, duration_seconds, _utc(started_at), _utc(finished_at)))
+
+def fingerprint(r) -> int:
+    return _fingerprint(r.status, r.duration_seconds, r.started_at, r.finished_at)
+
+def _store(key, fp):
+    _cache[key] = fp
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+        _stats["evictions"] += 1
+
+def filter_changed(results: list) -> list:
+    """Drop results identical to what was last written.
+
+    Several results for one build collapse to the one with the newest provider
+    timestamp, or the last occurrence when timestamps are missing.
+    """
+    latest = {}
+    for r in results:
+        key = _key(r.provider, r.pipeline_name, r.external_id)
+        prev = latest.get(key)
+        if prev is not None and prev.updated_at and r.updated_at and _utc(r.updated_at) < _utc(prev.updated_at):
+            continue
+        latest[key] = r
+    changed = []
+    with _lock:
+        for key, r in latest.items():
+            if _cache.get(key) == fingerprint(r):
+                _cache.move_to_end(key)
+                _stats["hits"] += 1
+            else:
+                _stats["misses"] += 1
+                changed.append(r)
+    return changed
+
+def remember(results: list):
+    """Record results whose state is now committed."""
+    with _lock:
+        for r in results:
+            _store(_key(r.provider, r.pipeline_name, r.external_id), fingerprint(r))
+
+def warm(limit: int = WARM_BUILDS):
+    """Seed the cache from the most recent builds so a cold start doesn't re-read every polled build."""
+    with SessionLocal() as session:
+        rows = session.execute(
+            select(
+                Pipeline.provider, Pipeline.name, Build.external_id, Build.status,
+                Build.duration_seconds, Build.started_at, Build.finished_at,
+            ).join(Pipeline, Build.pipeline_id==Pipeline.id).order_by(Build.started_at.desc()).limit(min(limit, CACHE_SIZE))
+        ).all()
+    # oldest first so the most recent builds end up at the LRU's fresh end
+    with _lock:
+        for r in reversed(rows):
+            _store(_key(r.provider, r.name, r.external_id), _fingerprint(r.status, r.duration_seconds, r.started_at, r.finished_at))
+
+def clear():
+    """Forget every fingerprint, e.g. after builds were deleted and may be ingested again."""
+    with _lock:
+        _cache.clear()
+
+def stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "size": len(_cache),
+        "capacity": CACHE_SIZE,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else None,
+    }
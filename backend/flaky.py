@@ -0,0 +1,191 @@
+"""
+Flaky pipeline detection from bounded per-pipeline outcome history.
+
+Each pipeline keeps a ring of its last FLAKY_HISTORY completed builds as two
+fixed-size arrays: a status code (db.STATUS_CODES) and a 32-bit commit hash.
+Rings are loaded from the DB at startup, appended to on ingest, and reloaded
+for a pipeline only when another worker has written to it (its data version
+moved past the ring's). Scores and sparklines are computed from memory.
+
+A flaky pipeline flips between success and failure often, and above all gives
+different results for the same commit; a broken one fails consistently.
+"""
+
+import os
+import zlib
+import threading
+from array import array
+
+from sqlalchemy import select, func
+from db import SessionLocal, Build, STATUS_CODES, status_code
+from collectors.base import ACTIVE_STATUSES, FAILED_STATUSES
+import data_version
+import pipeline_cache
+
+HISTORY = int(os.getenv("FLAKY_HISTORY", "50"))
+MIN_BUILDS = int(os.getenv("FLAKY_MIN_BUILDS", "10"))
+
+SUCCESS = STATUS_CODES["success"]
+FAILED_CODES = {STATUS_CODES[s] for s in FAILED_STATUSES if s in STATUS_CODES}
+
+def sha_key(sha: str | None) -> int:
+    """32-bit key for a commit; 0 means unknown"""
+    if not sha:
+        return 0
+    try:
+        return int(sha[:8], 16) or 1
+    except ValueError:
+        return zlib.crc32(sha.encode()) or 1
+
+class Ring:
+    __slots__ = ("codes", "shas", "head", "count", "version")
+
+    def __init__(self, size: int = HISTORY, version: int | None = None):
+        self.codes = array("B", bytes(size))
+        self.shas = array("I", [0]) * size
+        self.head = 0
+        self.count = 0
+        self.version = version
+
+    def push(self, code: int, sha: int):
+        self.codes[self.head] = code
+        self.shas[self.head] = sha
+        self.head = (self.head + 1) % len(self.codes)
+        self.count = min(self.count + 1, len(self.codes))
+
+    def last(self, n: int | None = None) -> list[tuple[int, int]]:
+        """(code, sha key) pairs, oldest first"""
+        size = len(self.codes)
+        n = self.count if n is None else min(n, self.count)
+        start = (self.head - n) % size
+        return [(self.codes[(start + i) % size], self.shas[(start + i) % size]) for i in range(n)]
+
+_rings: dict[int, Ring] = {}
+_lock = threading.Lock()
+_warm = False
+
+def _load(pipeline_ids=None) -> dict[int, Ring]:
+    """Rings for `pipeline_ids` (all pipelines when None) from their last HISTORY completed builds"""
+    finished = func.coalesce(Build.finished_at, Build.started_at)
+    ranked = select(
+        Build.pipeline_id, Build.status, Build.commit_sha, finished.label("finished"),
+        func.row_number().over(partition_by=Build.pipeline_id, order_by=(finished.desc(), Build.id.desc())).label("rn"),
+    ).where(Build.status.not_in(ACTIVE_STATUSES))
+    if pipeline_ids is not None:
+        ranked = ranked.where(Build.pipeline_id.in_(pipeline_ids))
+    ranked = ranked.subquery()
+    stmt = select(ranked).where(ranked.c.rn <= HISTORY).order_by(ranked.c.pipeline_id, ranked.c.rn.desc())
+    rings: dict[int, Ring] = {pid: Ring() for pid in pipeline_ids or ()}
+    with SessionLocal() as session:
+        for r in session.execute(stmt):
+            ring = rings.get(r.pipeline_id)
+            if ring is None:
+                ring = rings[r.pipeline_id] = Ring()
+            ring.push(status_code(r.status), sha_key(r.commit_sha))
+    return rings
+
+def _scope(pipeline_id: int) -> str | None:
+    info = pipeline_cache.get(pipeline_id)
+    return data_version.pipeline_scope(info.provider, info.name) if info else None
+
+def _version(pipeline_id: int) -> int | None:
+    scope = _scope(pipeline_id)
+    return data_version.current(scope, fallback=False) if scope else None
+
+def warm():
+    """(Re)build every ring from the DB"""
+    global _rings, _warm
+    rings = _load()
+    for pid, ring in rings.items():
+        ring.version = _version(pid)
+    with _lock:
+        _rings = rings
+        _warm = True
+
+def _ensure_fresh():
+    """Reload rings of pipelines another worker has written to since they were loaded"""
+    if not _warm:
+        warm()
+        return
+    stale = {}
+    for pid in pipeline_cache.ids_matching():
+        version = _version(pid)
+        ring = _rings.get(pid)
+        if ring is None or (version is not None and (ring.version is None or version > ring.version)):
+            stale[pid] = version
+    if not stale:
+        return
+    rings = _load(list(stale))
+    with _lock:
+        for pid, ring in rings.items():
+            ring.version = stale[pid]
+            _rings[pid] = ring
+
+def on_commit(changes):
+    """Ingest hook: append newly completed builds to their pipeline's ring"""
+    if not _warm:
+        return
+    with _lock:
+        for c in changes:
+            r = c.result
+            if r.status in ACTIVE_STATUSES or (c.status_old is not None and c.status_old not in ACTIVE_STATUSES):
+                continue
+            ring = _rings.get(c.pipeline_id)
+            if ring is None:
+                ring = _rings[c.pipeline_id] = Ring()
+            ring.push(status_code(r.status), sha_key(r.commit_sha))
+            # this worker's own write is already reflected; another worker's is picked up by version
+            ring.version = _version(c.pipeline_id)
+
+def score(ring: Ring) -> dict:
+    """Flakiness of one ring: flip rate over pass/fail outcomes plus same-commit disagreement"""
+    outcomes = [(code == SUCCESS, sha) for code, sha in ring.last() if code == SUCCESS or code in FAILED_CODES]
+    n = len(outcomes)
+    failures = sum(1 for ok, _ in outcomes if not ok)
+    flips = sum(1 for a, b in zip(outcomes, outcomes[1:]) if a[0] != b[0])
+    flip_rate = flips / (n - 1) if n > 1 else 0.0
+    by_commit: dict[int, list] = {}
+    for ok, sha in outcomes:
+        if sha:
+            by_commit.setdefault(sha, []).append(ok)
+    rerun_commits = [results for results in by_commit.values() if len(results) > 1]
+    mixed = sum(1 for results in rerun_commits if len(set(results)) == 2)
+    same_commit_rate = mixed / len(rerun_commits) if rerun_commits else None
+    value = flip_rate if same_commit_rate is None else (flip_rate + same_commit_rate) / 2
+    failure_rate = failures / n if n else 0.0
+    recent = outcomes[-5:]
+    if n >= MIN_BUILDS and value >= 0.3:
+        classification = "flaky"
+    elif recent and all(not ok for ok, _ in recent):
+        classification = "broken"
+    else:
+        classification = "healthy"
+    return {
+        "score": round(value, 3),
+        "flip_rate": round(flip_rate, 3),
+        "same_commit_flip_rate": round(same_commit_rate, 3) if same_commit_rate is not None else None,
+        "rerun_commits": len(rerun_commits),
+        "builds": n,
+        "failure_rate": round(failure_rate, 3),
+        "classification": classification,
+    }
+
+def ranking(provider: str | None = None, min_builds: int = MIN_BUILDS) -> list[tuple[int, dict]]:
+    """(pipeline_id, score) for pipelines with enough history, flakiest first"""
+    _ensure_fresh()
+    ids = set(pipeline_cache.ids_matching(provider)) if provider else None
+    with _lock:
+        scored = [(pid, score(ring)) for pid, ring in _rings.items() if ids is None or pid in ids]
+    scored = [(pid, s) for pid, s in scored if s["builds"] >= min_builds]
+    scored.sort(key=lambda x: (-x[1]["score"], -x[1]["failure_rate"]))
+    return scored
+
+def sparklines(n: int, provider: str | None = None) -> dict[int, list[int]]:
+    """{pipeline_id: last n status codes, oldest first}"""
+    _ensure_fresh()
+    ids = set(pipeline_cache.ids_matching(provider)) if provider else None
+    with _lock:
+        return {pid: [code for code, _ in ring.last(n)] for pid, ring in _rings.items() if ids is None or pid in ids}
+
+def stats() -> dict:
+    return {"pipelines": len(_rings), "history": HISTORY, "warm": _warm}
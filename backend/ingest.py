@@ -0,0 +1,105 @@
+import os
+import asyncio
+
+from collectors.base import CollectorResult, ACTIVE_STATUSES, write_builds
+from db import BUILD_STATUS
+from collectors import ratelimit
+import fingerprints
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+INGEST_BATCH_MS = int(os.getenv("INGEST_BATCH_MS", "250"))
+
+_DONE = object()
+# one cycle at a time: collectors stage their watermarks until the cycle commits
+_cycle = asyncio.Lock()
+
+def normalize(r: CollectorResult) -> CollectorResult | None:
+    """Drop results that cannot be keyed and tidy identifiers before they are compared."""
+    if not r.external_id or r.external_id == "None" or not r.pipeline_name:
+        return None
+    r.pipeline_name = r.pipeline_name.strip()
+    r.status = BUILD_STATUS.stored(str(r.status)) if r.status is not None else "unknown"
+    return r
+
+async def _fetch(collector, queue: asyncio.Queue):
+    # pipeline names only, so a cycle's results are not held beyond their batch
+    active, finished = set(), set()
+    try:
+        async for r in collector.iter_recent_builds():
+            (active if r.status in ACTIVE_STATUSES else finished).add(r.pipeline_name)
+            await queue.put(r)
+    except ratelimit.RateLimited as e:
+        print(f"{collector.provider} collector paused:", e)
+    except Exception as e:
+        # one failing provider must not stop the others from being ingested
+        print(f"{collector.provider} collector error:", e)
+    finally:
+        ratelimit.note_cycle(collector.provider, active, finished)
+    # not in the finally: a cancelled producer must not wait on a queue nobody reads
+    await queue.put(_DONE)
+
+async def run(collectors, notify) -> dict:
+    """Stream every collector through fetch -> normalize -> dedupe -> batched upsert -> notify.
+
+    A batch is written once it holds INGEST_BATCH_SIZE results or its oldest
+    result has waited INGEST_BATCH_MS, so the first transitions are published
+    while slower providers are still paging. `notify` is awaited with the
+    transitions of each committed batch. Once every batch is written the
+    collectors' commit() advances their watermarks.
+    """
+    async with _cycle:
+        summary = await _run(collectors, notify)
+        for c in collectors:
+            c.commit()
+    return summary
+
+async def _run(collectors, notify) -> dict:
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=INGEST_BATCH_SIZE * 4)
+    producers = [asyncio.create_task(_fetch(c, queue)) for c in collectors]
+    summary = {"results": 0, "written": 0, "transitions": 0, "batches": 0}
+    pending = len(producers)
+    batch: list[CollectorResult] = []
+    deadline = None
+
+    async def flush():
+        nonlocal batch
+        changed = fingerprints.filter_changed(batch)
+        batch = []
+        if not changed:
+            return
+        transitions = await asyncio.to_thread(write_builds, changed)
+        summary["written"] += len(changed)
+        summary["transitions"] += len(transitions)
+        summary["batches"] += 1
+        if transitions:
+            await notify(transitions)
+
+    try:
+        while pending:
+            timeout = max(0.0, deadline - loop.time()) if batch else None
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await flush()
+                continue
+            if item is _DONE:
+                pending -= 1
+                continue
+            r = normalize(item)
+            if r is None:
+                continue
+            summary["results"] += 1
+            if not batch:
+                deadline = loop.time() + INGEST_BATCH_MS / 1000
+            batch.append(r)
+            if len(batch) >= INGEST_BATCH_SIZE or loop.time() >= deadline:
+                await flush()
+        if batch:
+            await flush()
+    finally:
+        # a failed flush leaves producers blocked on the full queue
+        for task in producers:
+            task.cancel()
+        await asyncio.gather(*producers, return_exceptions=True)
+    return summary
@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+from db import engine, read_engine, analytics_engine
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+
+class QueryStats:
+    """Statement count and DB time accumulated for one request (or one ingest cycle)."""
+    __slots__ = ("count", "total_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+
+_current_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+_explaining: ContextVar[bool] = ContextVar("explaining", default=False)
+
+totals = QueryStats()
+slow_queries: deque = deque(maxlen=50)
+_gauges: dict = {}
+
+def register_gauge(name: str, fn):
+    """Publish a callable whose return value is included in `snapshot()`."""
+    _gauges[name] = fn
+
+def snapshot() -> dict:
+    out = {
+        "db": {"statements": totals.count, "total_ms": round(totals.total_ms, 2), "slow_queries": len(slow_queries)},
+        "slow_queries": list(slow_queries),
+    }
+    for name, fn in _gauges.items():
+        try:
+            out[name] = fn()
+        except Exception as e:
+            out[name] = {"error": str(e)}
+    return out
+
+def track_queries() -> QueryStats:
+    """Start counting statements issued from the current context."""
+    stats = QueryStats()
+    _current_stats.set(stats)
+    return stats
+
+# read endpoints go to the replica or DuckDB when configured; their statements count the same
+ENGINES = {"primary": engine, "replica": read_engine, "duckdb": analytics_engine}
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+    if _explaining.get():
+        return
+    totals.count += 1
+    totals.total_ms += elapsed_ms
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.total_ms += elapsed_ms
+    if elapsed_ms >= SLOW_QUERY_MS:
+        _log_slow_query(conn, statement, parameters, executemany, elapsed_ms)
+
+def _engine_label(conn) -> str:
+    return next((label for label, e in ENGINES.items() if e is conn.engine), conn.dialect.name)
+
+for _engine in ENGINES.values():
+    if _engine is not None:
+        event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+def _log_slow_query(conn, statement, parameters, executemany, elapsed_ms):
+    plan = None
+    # Only plain reads are re-planned; EXPLAIN of writes is not worth the risk inside a live transaction.
+    if SLOW_QUERY_EXPLAIN and not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        plan = _explain(conn, statement, parameters)
+    label = _engine_label(conn)
+    print(f"Slow query on {label} ({elapsed_ms:.1f} ms): {' '.join(statement.split())}")
+    if plan:
+        print("  plan:\n    " + "\n    ".join(plan))
+    slow_queries.append({
+        "at": time.time(),
+        "ms": round(elapsed_ms, 2),
+        "engine": label,
+        "statement": " ".join(statement.split()),
+        "plan": plan,
+    })
+
+def _explain(conn, statement, parameters):
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    token = _explaining.set(True)
+    try:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        return [" | ".join(str(c) for c in row) for row in rows]
+    except Exception as e:
+        return [f"EXPLAIN failed: {e}"]
+    finally:
+        _explaining.reset(token)
+
+class SamplingProfiler:
+    """Samples the Python stacks of every other thread at a fixed interval.
+
+    cProfile only sees the thread it is enabled on, while sync routes run in
+    the threadpool, so stacks are sampled through `sys._current_frames()`.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.samples: Counter = Counter()
+        self.total = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self._started
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me or _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+                self.total += 1
+
+    def report(self, top: int = 40) -> str:
+        lines = [f"{self.total} samples over {self.elapsed * 1000:.1f} ms (interval {self.interval * 1000:.1f} ms)", ""]
+        leaves = Counter()
+        for stack, n in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += n
+        lines.append("Top frames (self):")
+        for frame, n in leaves.most_common(top):
+            lines.append(f"  {n:6d}  {100 * n / max(self.total, 1):5.1f}%  {frame}")
+        lines.append("")
+        lines.append("Collapsed stacks:")
+        for stack, n in self.samples.most_common(top):
+            lines.append(f"{stack} {n}")
+        return "\n".join(lines) + "\n"
+
+_IDLE_LEAVES = {"wait", "select", "poll", "epoll", "_worker", "get", "accept", "sleep"}
+
+def _is_idle(frame) -> bool:
+    name = os.path.basename(frame.f_code.co_filename)
+    return frame.f_code.co_name in _IDLE_LEAVES and name in ("threading.py", "queue.py", "selectors.py", "thread.py", "_base.py")
+
+def _profile_requested(request: Request) -> bool:
+    return PROFILING_ENABLED and (
+        request.query_params.get("profile") in ("1", "true") or request.headers.get("x-profile") in ("1", "true")
+    )
+
+async def instrumentation_middleware(request: Request, call_next):
+    stats = track_queries()
+    profiler = None
+    if _profile_requested(request):
+        profiler = SamplingProfiler()
+        profiler.start()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if profiler:
+        profiler.stop()
+        report = f"{request.method} {request.url.path} -> {response.status_code}\n"
+        report += f"DB: {stats.count} statements, {stats.total_ms:.1f} ms of {elapsed_ms:.1f} ms\n\n"
+        response = PlainTextResponse(report + profiler.report(), headers={"X-Profiled-Status": str(response.status_code)})
+    response.headers["X-DB-Query-Count"] = str(stats.count)
+    response.headers["X-DB-Time-Ms"] = f"{stats.total_ms:.2f}"
+    response.headers["Server-Timing"] = f"db;dur={stats.total_ms:.2f}, app;dur={elapsed_ms:.2f}"
+    return response
@@ -0,0 +1,255 @@
+"""
+Versioned schema migrations that are safe to run against a live database.
+
+Every migration has a version, runs at most once and is recorded in
+schema_migrations. Its steps go through `Migrator`:
+- DDL takes its locks under a short lock_timeout and is retried, so an ALTER
+  never sits in the lock queue holding up dashboard reads behind it
+- indexes are built with CREATE INDEX CONCURRENTLY; an invalid index left by
+  an interrupted build is dropped and rebuilt
+- data changes run as id-range batches, one transaction each, with a pause
+  between batches and progress reported as they go
+Migrations marked background (index builds, backfills) run after the API is up.
+With dry_run every statement is printed instead of executed.
+"""
+
+import os
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from sqlalchemy import text, inspect, select
+from sqlalchemy.exc import OperationalError
+from db import engine, SessionLocal, SchemaMigration, leader_lock
+
+BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "10000"))
+THROTTLE_SECONDS = float(os.getenv("MIGRATION_THROTTLE_MS", "50")) / 1000
+LOCK_TIMEOUT_MS = int(os.getenv("MIGRATION_LOCK_TIMEOUT_MS", "2000"))
+LOCK_RETRIES = 5
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    fn: object
+    background: bool
+
+MIGRATIONS: list[Migration] = []
+
+def migration(version: int, name: str, background: bool = False):
+    def register(fn):
+        MIGRATIONS.append(Migration(version, name, fn, background))
+        return fn
+    return register
+
+_state = {"running": None, "progress": None, "applied": 0}
+
+def _lock_timeout(e: OperationalError) -> bool:
+    return getattr(e.orig, "pgcode", None) == "55P03"  # lock_not_available
+
+class Migrator:
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.postgres = engine.dialect.name == "postgresql"
+
+    def _show(self, sql: str, params=None):
+        print(f"  [dry-run] {sql}" + (f"  {params}" if params else ""))
+
+    def has_column(self, table: str, column: str) -> bool:
+        inspector = inspect(engine)
+        return inspector.has_table(table) and column in {c["name"] for c in inspector.get_columns(table)}
+
+    def execute(self, sql: str | list[str], params=None) -> int:
+        """Run a statement, or a list of them, in one transaction; return the last rowcount"""
+        statements = [sql] if isinstance(sql, str) else sql
+        if self.dry_run:
+            for statement in statements:
+                self._show(statement, params)
+            return 0
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                with engine.begin() as conn:
+                    if self.postgres:
+                        conn.execute(text(f"SET LOCAL lock_timeout = {LOCK_TIMEOUT_MS}"))
+                    for statement in statements:
+                        rowcount = conn.execute(text(statement), params or {}).rowcount
+                    return rowcount
+            except OperationalError as e:
+                if not _lock_timeout(e) or attempt == LOCK_RETRIES:
+                    raise
+                print(f"  lock not granted within {LOCK_TIMEOUT_MS} ms, retrying ({attempt}/{LOCK_RETRIES})")
+                time.sleep(attempt)
+
+    def add_column(self, table: str, column: str, ddl: str):
+        """Add a column unless present; keep `ddl` to a constant default so Postgres does not rewrite the table"""
+        if self.has_column(table, column):
+            return
+        print(f"Adding {table}.{column}...")
+        self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+    def create_index(self, name: str, table: str, columns: str, unique: bool = False):
+        """Build an index without blocking writes (CONCURRENTLY on Postgres)"""
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        if not self.postgres:
+            self.execute(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({columns})")
+            return
+        sql = f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"
+        if self.dry_run:
+            self._show(sql)
+            return
+        # concurrent builds cannot run inside a transaction block
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            valid = conn.execute(text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:n)"), {"n": name}).scalar()
+            if valid is True:
+                return
+            if valid is False:
+                print(f"Dropping invalid index {name} left by an interrupted build...")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            print(f"Building index {name} concurrently...")
+            started = time.monotonic()
+            conn.execute(text(sql))
+            print(f"✅ Index {name} built in {time.monotonic() - started:.1f}s")
+
+    def backfill(self, table: str, set_sql: str, where_sql: str, params=None,
+                 batch_size: int = BATCH_SIZE, throttle: float = THROTTLE_SECONDS) -> int:
+        """UPDATE {table} SET {set_sql} WHERE {where_sql}, in id-range batches of one transaction each.
+
+        `where_sql` should exclude rows already done so an interrupted backfill resumes cheaply.
+        """
+        sql = f"UPDATE {table} SET {set_sql} WHERE id >= :lo AND id < :hi AND ({where_sql})"
+        with engine.connect() as conn:
+            lo, hi = conn.execute(text(f"SELECT min(id), max(id) FROM {table}")).one()
+        if lo is None:
+            return 0
+        if self.dry_run:
+            self._show(sql, {**(params or {}), "lo": lo, "hi": f"... step {batch_size} to {hi}"})
+            return 0
+        total = hi - lo + 1
+        updated = 0
+        started = time.monotonic()
+        for start in range(lo, hi + 1, batch_size):
+            updated += self.execute(sql, {**(params or {}), "lo": start, "hi": start + batch_size})
+            done = min(start + batch_size - lo, total)
+            _state["progress"] = {"table": table, "percent": round(100 * done / total, 1), "updated": updated}
+            elapsed = time.monotonic() - started
+            print(f"  {table}: {done * 100 // total}% of id range, {updated} rows updated ({done / max(elapsed, 1e-6):.0f} ids/s)")
+            if throttle:
+                time.sleep(throttle)
+        _state["progress"] = None
+        return updated
+
+# Migrations. Append only: never renumber or edit one that has shipped.
+
+@migration(1, "pipelines.is_active")
+def _pipelines_is_active(m: Migrator):
+    m.add_column("pipelines", "is_active", "BOOLEAN DEFAULT TRUE NOT NULL")
+
+@migration(2, "builds.provider_updated_at")
+def _builds_provider_updated_at(m: Migrator):
+    m.add_column("builds", "provider_updated_at", "TIMESTAMP WITH TIME ZONE")
+
+@migration(3, "builds.commit_sha")
+def _builds_commit_sha(m: Migrator):
+    m.add_column("builds", "commit_sha", "VARCHAR(64)")
+
+@migration(4, "pipelines.build_url_template")
+def _pipelines_build_url_template(m: Migrator):
+    m.add_column("pipelines", "build_url_template", "TEXT")
+
+@migration(5, "index builds (pipeline_id, external_id)", background=True)
+def _ix_builds_pipeline_external(m: Migrator):
+    # upsert_builds looks up every polled build by this pair
+    m.create_index("ix_builds_pipeline_external", "builds", "pipeline_id, external_id")
+
+@migration(6, "index builds (pipeline_id, started_at, id)", background=True)
+def _ix_builds_pipeline_started(m: Migrator):
+    # latest-N-per-pipeline windows (status matrix, flaky rings, pipeline details)
+    m.create_index("ix_builds_pipeline_started", "builds", "pipeline_id, started_at, id")
+
+@migration(7, "index builds (started_at)", background=True)
+def _ix_builds_started_at(m: Migrator):
+    # time-window metrics and the recent builds list
+    m.create_index("ix_builds_started_at", "builds", "started_at")
+
+@migration(8, "backfill build_rollups", background=True)
+def _backfill_build_rollups(m: Migrator):
+    # ingestion keeps rollups current from here on; this fills them for existing history
+    if m.dry_run:
+        m._show("rollups.rebuild()")
+        return
+    import rollups
+    rollups.rebuild()
+
+@migration(9, "build_rollups.resolution VARCHAR(64)")
+def _build_rollups_resolution_width(m: Migrator):
+    # room for local-zone resolutions such as "1d@America/Argentina/Buenos_Aires"
+    if m.postgres:
+        # widening a varchar only changes the catalog; no table rewrite
+        m.execute("ALTER TABLE build_rollups ALTER COLUMN resolution TYPE VARCHAR(64)")
+
+@migration(10, "builds.data_version")
+def _builds_data_version(m: Migrator):
+    # incremental export snapshots select builds written after the previous snapshot's version
+    m.add_column("builds", "data_version", "BIGINT")
+
+def applied() -> dict[int, SchemaMigration]:
+    if not inspect(engine).has_table("schema_migrations"):
+        return {}
+    with SessionLocal() as session:
+        return {m.version: m for m in session.execute(select(SchemaMigration)).scalars()}
+
+def pending(background: bool | None = None) -> list[Migration]:
+    """Unapplied migrations in version order; only foreground or background ones unless `background` is None"""
+    done = applied()
+    return [
+        m for m in sorted(MIGRATIONS, key=lambda m: m.version)
+        if m.version not in done and (background is None or m.background == background)
+    ]
+
+def run(dry_run: bool = False, background: bool | None = None) -> list[Migration]:
+    """Apply pending migrations (see `pending`) in one process at a time"""
+    todo = pending(background)
+    if dry_run:
+        for m in todo:
+            print(f"Would apply {m.version}: {m.name}" + (" (background)" if m.background else ""))
+            m.fn(Migrator(dry_run=True))
+        return todo
+    if not todo:
+        return []
+    with leader_lock("cicd-dashboard-migrations") as leader:
+        if not leader:
+            return []
+        todo = pending(background)  # another process may have applied some while we waited
+        for m in todo:
+            print(f"Applying migration {m.version}: {m.name}")
+            _state["running"] = m.name
+            started = time.monotonic()
+            try:
+                m.fn(Migrator())
+            finally:
+                _state["running"] = None
+            with SessionLocal() as session:
+                session.add(SchemaMigration(
+                    version=m.version, name=m.name, applied_at=datetime.now(timezone.utc),
+                    duration_ms=int((time.monotonic() - started) * 1000),
+                ))
+                session.commit()
+            _state["applied"] += 1
+    return todo
+
+def run_background():
+    """Apply pending background migrations; called once the API is serving"""
+    try:
+        run(background=True)
+    except Exception as e:
+        print("Background migration failed, will retry on next startup:", e)
+
+def version() -> int:
+    return max(applied(), default=0)
+
+def stats() -> dict:
+    return {
+        "latest": max((m.version for m in MIGRATIONS), default=0),
+        "running": _state["running"],
+        "progress": _state["progress"],
+        "applied_by_this_process": _state["applied"],
+    }
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Backend parity check.
+Loads the same deterministic builds through the ingestion path into a scratch
+database for every storage configuration (SQLite, SQLite with DuckDB analytics,
+compact layouts, and PostgreSQL when one is reachable), then compares what each
+serves: JSON endpoints, the Arrow stream and a Parquet snapshot. Within a
+configuration the three formats must describe the same builds; across
+configurations every response must be identical. Exits 1 on any difference, and
+when a configuration named with --configs cannot run; without --configs those
+are skipped and listed as not checked. tests/test_parity.py runs the same
+comparison under pytest.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+# Add the current directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+ANCHOR = datetime(2026, 1, 5, tzinfo=timezone.utc)  # a Monday, so daily and weekly buckets line up
+DAYS = 10
+PROVIDERS = ("github", "gitlab", "jenkins")
+STATUSES = ("success", "success", "success", "failed", "cancelled", "success", "failed", "running")
+
+# name -> environment of the child process; postgres ones run only when a server is reachable
+CONFIGS = {
+    "sqlite": {"DB_BACKEND": "sqlite"},
+    "sqlite-compact": {"DB_BACKEND": "sqlite", "COMPACT_SCHEMA": "true"},
+    "sqlite-duckdb": {"DB_BACKEND": "sqlite", "DUCKDB_ANALYTICS": "true"},
+    "postgres": {"DB_BACKEND": "postgres"},
+    "postgres-compact": {"DB_BACKEND": "postgres", "COMPACT_SCHEMA": "true"},
+}
+
+def results():
+    """The builds every configuration ingests: same ids, times and outcomes on every run"""
+    from collectors.base import CollectorResult
+    out = []
+    for p, provider in enumerate(PROVIDERS):
+        for n in range(4):
+            pipeline = f"parity/{provider}-{n}"
+            for i in range(DAYS * 6):
+                started = ANCHOR + timedelta(hours=i * 4, minutes=7 * n + p)
+                status = STATUSES[(i * 7 + n * 3 + p) % len(STATUSES)]
+                duration = None if status == "running" else 60 + (i * 37 + n * 11) % 900
+                external_id = str(1000 * (p * 4 + n) + i)
+                out.append(CollectorResult(
+                    provider=provider,
+                    pipeline_name=pipeline,
+                    external_id=external_id,
+                    status=status,
+                    started_at=started,
+                    finished_at=started + timedelta(seconds=duration) if duration is not None else None,
+                    duration_seconds=duration,
+                    # every fifth build has a URL off the pipeline's template, so both storage paths are read
+                    web_url=f"https://ci.example/{pipeline}/runs/{external_id}" if i % 5 else f"https://ci.example/rerun/{external_id}",
+                    updated_at=started + timedelta(seconds=duration or 1),
+                    commit_sha=f"{i:040x}",
+                ))
+    return out
+
+_FROM, _TO = ANCHOR.strftime("%Y-%m-%dT%H:%M:%SZ"), (ANCHOR + timedelta(days=DAYS)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+REQUESTS = (
+    "/api/builds?limit=500",
+    "/api/builds?provider=gitlab&status=failed&limit=500",
+    "/api/builds?q=github-1&limit=500",
+    "/api/metrics/pipeline-performance?limit=50",
+    f"/api/metrics/timeseries?from={_FROM}&to={_TO}&step=1h&max_points=2000",
+    f"/api/metrics/timeseries?from={_FROM}&to={_TO}&step=1d",
+    f"/api/metrics/reliability?until={(ANCHOR + timedelta(days=DAYS)).date()}&days={DAYS + 1}",
+    f"/api/metrics/duration-percentiles?until={(ANCHOR + timedelta(days=DAYS)).date()}&days={DAYS + 1}",
+    "/api/metrics/status-matrix?n=20",
+)
+
+def _utc(value):
+    """ISO timestamps in one spelling: naive ones are UTC, offsets normalized to +00:00"""
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, str) and len(value) >= 19 and value[4] == "-" and value[10] in "T ":
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    else:
+        return value
+    return (dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)).isoformat()
+
+def canonical(value):
+    if isinstance(value, dict):
+        return {k: canonical(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [canonical(v) for v in value]
+    if isinstance(value, float):
+        return round(value, 6)
+    return _utc(value)
+
+def _rows(table) -> list[dict]:
+    rows = [{k: v for k, v in row.items() if k not in ("created_at", "snapshot_id")} for row in table.to_pylist()]
+    return canonical(sorted(rows, key=lambda r: r["id"]))
+
+def child(name: str, out: str):
+    """Runs in a fresh process configured by CONFIGS[name]: load, query, write the responses to `out`"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from fastapi.testclient import TestClient
+    import db
+    db.init_db(background_migrations=False)
+    with db.SessionLocal() as session:
+        if session.query(db.Pipeline).count():
+            raise SystemExit(f"{name}: the scratch database is not empty")
+    db.detect_compact_layout()
+    import data_version, pipeline_cache, replica, export
+    from collectors.base import upsert_builds
+    from app import app
+    data_version.refresh()
+    pipeline_cache.warm()
+    batch = results()
+    for i in range(0, len(batch), 50):
+        upsert_builds(batch[i:i + 50])
+
+    client = TestClient(app)
+    responses = {}
+    for path in REQUESTS:
+        r = client.get(path)
+        responses[path] = {"status": r.status_code, "body": canonical(r.json())}
+    r = client.get("/api/export/builds.arrow")
+    arrow = _rows(pa.ipc.open_stream(r.content).read_all())
+    files = export.snapshot(full=True)["files"]
+    parquet = _rows(pa.concat_tables(pq.read_table(os.path.join(export.EXPORT_DIR, "builds", f)) for f in files))
+    with open(out, "w") as f:
+        json.dump({
+            "responses": responses, "arrow": arrow, "parquet": parquet,
+            "duckdb": replica.stats()["duckdb"], "duckdb_error": replica.stats()["duckdb_error"],
+        }, f)
+
+def _postgres_scratch(database: str) -> str | None:
+    """Create the scratch database if needed; None when no server is reachable"""
+    from sqlalchemy import create_engine, text
+    user, password = os.getenv("POSTGRES_USER", "cicd_user"), os.getenv("POSTGRES_PASSWORD", "supersecret")
+    host, port = os.getenv("POSTGRES_HOST", "postgres"), os.getenv("POSTGRES_PORT", "5432")
+    engine = create_engine(f"postgresql+psycopg2://{user}:{password}@{host}:{port}/postgres", connect_args={"connect_timeout": 3})
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if not conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :d"), {"d": database}).scalar():
+                conn.execute(text(f'CREATE DATABASE "{database}"'))
+    except Exception as e:
+        return f"{type(e).__name__}: {str(e).strip().splitlines()[0]}"
+    finally:
+        engine.dispose()
+    return None
+
+def _drop_postgres_tables(env: dict):
+    subprocess.run(
+        [sys.executable, "-c", "import db; db.Base.metadata.drop_all(db.engine)"],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)), check=False,
+    )
+
+def run(name: str, workdir: str, args) -> tuple[dict | None, str | None]:
+    """(document, None) from one configuration's child process, or (None, reason it was skipped)"""
+    env = {**os.environ, **CONFIGS[name], "EXPORT_DIR": os.path.join(workdir, name, "exports"), "SEED_SAMPLE_DATA": "false"}
+    env.pop("POSTGRES_READ_HOST", None)
+    os.makedirs(os.path.join(workdir, name))
+    if env["DB_BACKEND"] == "sqlite":
+        env["SQLITE_PATH"] = os.path.join(workdir, name, "parity.db")
+    else:
+        if args.postgres_db == os.getenv("POSTGRES_DB", "cicd_health"):
+            return None, f"--postgres-db must not be the application database ({args.postgres_db})"
+        error = _postgres_scratch(args.postgres_db)
+        if error:
+            return None, f"no PostgreSQL server reachable ({error})"
+        env["POSTGRES_DB"] = args.postgres_db
+        _drop_postgres_tables(env)
+    out = os.path.join(workdir, name, "result.json")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", name, "--out", out],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=not args.verbose, text=True,
+    )
+    try:
+        if proc.returncode != 0:
+            raise SystemExit(f"{name}: child failed with code {proc.returncode}\n{proc.stderr or ''}")
+        with open(out) as f:
+            document = json.load(f)
+    finally:
+        if env["DB_BACKEND"] == "postgres" and not args.keep:
+            _drop_postgres_tables(env)
+    if CONFIGS[name].get("DUCKDB_ANALYTICS") and not document["duckdb"]:
+        return None, f"DuckDB could not attach the SQLite file ({str(document['duckdb_error']).splitlines()[0]})"
+    return document, None
+
+def differences(a, b, path="") -> list[str]:
+    if isinstance(a, dict) and isinstance(b, dict):
+        out = []
+        for key in sorted(set(a) | set(b), key=str):
+            if key not in a or key not in b:
+                out.append(f"{path}.{key}: only in {'first' if key in a else 'second'}")
+            else:
+                out += differences(a[key], b[key], f"{path}.{key}")
+        return out
+    if isinstance(a, list) and isinstance(b, list):
+        if len(a) != len(b):
+            return [f"{path}: {len(a)} items vs {len(b)}"]
+        return [d for i, (x, y) in enumerate(zip(a, b)) for d in differences(x, y, f"{path}[{i}]")]
+    return [] if a == b else [f"{path}: {a!r} vs {b!r}"]
+
+def backend_differences(a: dict, b: dict) -> list[str]:
+    """What two configurations serve differently, leaving out which analytics engine each used"""
+    return [d for d in differences(a, b) if not d.startswith((".duckdb", ".duckdb_error"))]
+
+def format_errors(name: str, document: dict) -> list[str]:
+    """JSON builds, Arrow rows and Parquet rows of one configuration must agree"""
+    errors = [f"{name}: {d}" for d in differences(document["arrow"], document["parquet"], "arrow~parquet")]
+    by_id = {row["id"]: row for row in document["arrow"]}
+    listed = document["responses"]["/api/builds?limit=500"]["body"]
+    if len(listed) != min(500, len(by_id)):
+        errors.append(f"{name}: /api/builds listed {len(listed)} of {len(by_id)} builds")
+    for row in listed:
+        exported = by_id.get(row["id"])
+        if exported is None:
+            errors.append(f"{name}: build {row['id']} is listed but not exported")
+            continue
+        for key in ("provider", "pipeline", "status", "duration_seconds", "started_at", "web_url"):
+            if row[key] != exported[key]:
+                errors.append(f"{name}: build {row['id']} {key}: JSON {row[key]!r} vs Arrow {exported[key]!r}")
+    for path, r in document["responses"].items():
+        if r["status"] != 200:
+            errors.append(f"{name}: GET {path} returned {r['status']}: {r['body']}")
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare JSON, Arrow and Parquet output across storage backends')
+    parser.add_argument('--configs', help=f'Configurations that must run (default: those of {",".join(CONFIGS)} that can)')
+    parser.add_argument('--postgres-db', default='cicd_parity', help='Scratch PostgreSQL database, created if missing (default: cicd_parity)')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch databases and exports')
+    parser.add_argument('--verbose', action='store_true', help='Show the child processes\' output')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.out)
+        return
+
+    names = [n.strip() for n in (args.configs or ",".join(CONFIGS)).split(",") if n.strip()]
+    unknown = set(names) - set(CONFIGS)
+    if unknown:
+        parser.error(f"unknown configurations: {', '.join(sorted(unknown))}")
+    workdir = tempfile.mkdtemp(prefix="cicd-parity-")
+    documents, errors, skipped = {}, [], {}
+    try:
+        for name in names:
+            document, reason = run(name, workdir, args)
+            if reason:
+                print(f"  {name}: skipped, {reason}")
+                skipped[name] = reason
+                if args.configs:
+                    errors.append(f"{name}: requested but could not run: {reason}")
+                continue
+            documents[name] = document
+            errors += format_errors(name, document)
+            print(f"  {name}: {len(document['arrow'])} builds, {len(document['responses'])} responses")
+    finally:
+        if args.keep:
+            print(f"Scratch files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if not documents:
+        raise SystemExit("No configuration could run")
+    reference, *others = documents
+    for name in others:
+        errors += [f"{reference} vs {name}: {d}" for d in backend_differences(documents[reference], documents[name])]
+    if errors:
+        print(f"\n❌ {len(errors)} differences:")
+        for e in errors[:30]:
+            print("  -", e)
+        sys.exit(1)
+    if skipped:
+        print(f"⚠️  {', '.join(documents)} serve identical JSON, Arrow and Parquet; not checked: {', '.join(skipped)}")
+        return
+    print(f"✅ {', '.join(documents)} serve identical JSON, Arrow and Parquet")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import threading
+from typing import NamedTuple
+
+from sqlalchemy import select
+
+from db import SessionLocal, Pipeline
+import data_version
+
+class PipelineInfo(NamedTuple):
+    id: int
+    provider: str
+    name: str
+    url: str | None
+    url_template: str | None = None
+
+# Process-wide registry of pipeline identities. Pipelines are never renamed,
+# so entries only go stale when rows are deleted; deleting code bumps the
+# "pipelines" data version and every worker reloads on its next access.
+# The dicts are copy-on-write: writers build new ones under _write_lock and swap
+# them in, so request threads can iterate whichever they picked up without locking.
+_COLUMNS = select(Pipeline.id, Pipeline.provider, Pipeline.name, Pipeline.url, Pipeline.build_url_template)
+
+_by_key: dict[tuple[str, str], int] = {}
+_by_id: dict[int, PipelineInfo] = {}
+_loaded_version: int | None = None
+_warm = False
+_write_lock = threading.Lock()
+
+def warm():
+    """(Re)load every pipeline into the registry."""
+    global _by_key, _by_id, _loaded_version, _warm
+    version = data_version.current(data_version.PIPELINES, fallback=False)
+    with SessionLocal() as session:
+        rows = session.execute(_COLUMNS).all()
+    by_id = {r.id: PipelineInfo(*r) for r in rows}
+    with _write_lock:
+        _by_key = {(p.provider, p.name): p.id for p in by_id.values()}
+        _by_id = by_id
+        _loaded_version = version
+        _warm = True
+
+def is_warm() -> bool:
+    _ensure_fresh()
+    return _warm
+
+def _ensure_fresh():
+    if _warm and data_version.current(data_version.PIPELINES, fallback=False) != _loaded_version:
+        warm()
+
+def _merge(infos: list[PipelineInfo]):
+    global _by_key, _by_id
+    if not infos:
+        return
+    with _write_lock:
+        by_id, by_key = dict(_by_id), dict(_by_key)
+        for p in infos:
+            by_id[p.id] = p
+            by_key[(p.provider, p.name)] = p.id
+        _by_id, _by_key = by_id, by_key
+
+def add(pipeline_id: int, provider: str, name: str, url: str | None = None, url_template: str | None = None):
+    _merge([PipelineInfo(pipeline_id, provider, name, url, url_template)])
+
+def lookup(provider: str, name: str) -> int | None:
+    _ensure_fresh()
+    return _by_key.get((provider, name))
+
+def get(pipeline_id: int) -> PipelineInfo | None:
+    return _by_id.get(pipeline_id)
+
+def resolve(session, pipeline_ids) -> dict[int, PipelineInfo]:
+    """Metadata for `pipeline_ids`, loading any created by another worker since the last refresh."""
+    _ensure_fresh()
+    missing = [pid for pid in set(pipeline_ids) if pid not in _by_id]
+    if missing:
+        _merge([PipelineInfo(*r) for r in session.execute(_COLUMNS.where(Pipeline.id.in_(missing)))])
+    by_id = _by_id
+    return {pid: by_id[pid] for pid in pipeline_ids if pid in by_id}
+
+def ids_matching(provider: str | None = None, name_contains: str | None = None) -> list[int]:
+    """Pipeline ids filtered in memory, mirroring `provider ==` and `name ILIKE %q%`."""
+    _ensure_fresh()
+    needle = name_contains.lower() if name_contains else None
+    return [
+        p.id for p in _by_id.values()
+        if (provider is None or p.provider == provider) and (needle is None or needle in p.name.lower())
+    ]
+
+def stats() -> dict:
+    return {"pipelines": len(_by_id), "warm": _warm, "version": _loaded_version}
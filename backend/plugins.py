@@ -0,0 +1,68 @@
+import os
+from functools import lru_cache
+from importlib import import_module
+
+from sqlalchemy import select, union
+from db import SessionLocal, Pipeline
+
+# provider -> (module, class); modules are only imported when the provider is enabled
+COLLECTORS = {
+    "github": ("collectors.github", "GitHubCollector"),
+    "gitlab": ("collectors.gitlab", "GitLabCollector"),
+    "jenkins": ("collectors.jenkins", "JenkinsCollector"),
+}
+
+# alerter -> (module, class, env var that must be set for it to be loaded)
+ALERTERS = {
+    "slack": ("alerts.slack", "SlackAlerter", "SLACK_WEBHOOK_URL"),
+    "email": ("alerts.emailer", "EmailAlerter", "SMTP_HOST"),
+}
+
+# Modules that maintain derived data from ingested builds. Each may define
+# on_transaction(session, changes), run inside the upsert transaction, and/or
+# on_commit(changes), run after it commits; `changes` is a list of BuildChange.
+# A module that stores derived tables defines rebuild() to recompute them; they
+# run in this order, so later modules can replay the build_events log.
+INGEST_HOOKS = ("build_events", "sketches", "reliability", "rollups", "anomalies", "flaky")
+# Per-pipeline derived tables are rebuilt this many pipelines per transaction,
+# each under the ingest writers' lock (data_version.lock), so ingestion pauses
+# only for one chunk at a time and never interleaves with a rebuild's reads
+REBUILD_CHUNK = int(os.getenv("REBUILD_CHUNK_PIPELINES", "200"))
+
+def enabled_providers() -> list[str]:
+    return [p.strip() for p in os.getenv("PROVIDERS", "github,gitlab,jenkins").split(",") if p.strip()]
+
+def _load(module: str, cls: str):
+    return getattr(import_module(module), cls)()
+
+@lru_cache(maxsize=None)
+def load_collectors() -> tuple:
+    """Instantiate the collectors listed in PROVIDERS, importing only those modules."""
+    return tuple(_load(*COLLECTORS[p]) for p in enabled_providers() if p in COLLECTORS)
+
+@lru_cache(maxsize=None)
+def load_alerters() -> tuple:
+    """Instantiate the alerters whose configuration is present in the environment."""
+    return tuple(_load(module, cls) for module, cls, env in ALERTERS.values() if os.getenv(env))
+
+@lru_cache(maxsize=None)
+def load_ingest_hooks() -> tuple:
+    """Return (transaction hooks, commit hooks) from the INGEST_HOOKS modules."""
+    modules = [import_module(m) for m in INGEST_HOOKS]
+    return (
+        tuple(m.on_transaction for m in modules if hasattr(m, "on_transaction")),
+        tuple(m.on_commit for m in modules if hasattr(m, "on_commit")),
+    )
+
+def pipeline_chunks(model) -> list[list[int]]:
+    """Ids of every pipeline, plus any still referenced by `model`'s rows, in REBUILD_CHUNK groups"""
+    with SessionLocal() as session:
+        ids = sorted(session.scalars(union(select(Pipeline.id), select(model.pipeline_id))))
+    return [ids[i:i + REBUILD_CHUNK] for i in range(0, len(ids), REBUILD_CHUNK)]
+
+def rebuild_derived():
+    """Recompute every INGEST_HOOKS module's derived tables from the builds table."""
+    for m in INGEST_HOOKS:
+        module = import_module(m)
+        if hasattr(module, "rebuild"):
+            module.rebuild()
@@ -0,0 +1,200 @@
+"""
+Reliability metrics (MTTR, failure-onset rate, failure streaks), maintained incrementally.
+
+Each completed build advances its pipeline's streak state (current run of
+successes/failures, when it started failing) and adds to that day's counters:
+builds, failures, failure onsets (green -> red), recoveries and the time they
+took. Any window is answered by summing O(days) daily rows; `rebuild()`
+recomputes them from builds with one window-function pass per chunk of
+pipelines, each under the ingest writers' lock.
+
+Both paths count the same builds, counted statuses with a duration, at the
+same time, coalesce(finished_at, started_at), so a rebuild reproduces what
+ingestion maintained.
+"""
+
+from datetime import date, datetime, timezone
+
+from sqlalchemy import select, func, case, tuple_
+from db import SessionLocal, Build, ReliabilityState, ReliabilityDaily
+from collectors.base import FAILED_STATUSES
+from plugins import pipeline_chunks
+import data_version
+
+COUNTED_STATUSES = FAILED_STATUSES | {"success"}  # cancelled/skipped runs neither break nor fix a pipeline
+
+def _aware(dt):
+    return dt.replace(tzinfo=timezone.utc) if dt is not None and dt.tzinfo is None else dt
+
+def _day(ts: datetime) -> date:
+    return ts.astimezone(timezone.utc).date()
+
+def _new_daily(pipeline_id, day) -> ReliabilityDaily:
+    return ReliabilityDaily(
+        pipeline_id=pipeline_id, day=day, builds=0, failures=0, failure_onsets=0,
+        recoveries=0, recovery_seconds=0, max_failure_streak=0,
+    )
+
+def advance(state: ReliabilityState, daily: ReliabilityDaily, failed: bool, finished: datetime):
+    """Apply one completed build, finishing at `finished`, to the pipeline state and its day"""
+    daily.builds += 1
+    daily.failures += int(failed)
+    last = _aware(state.last_finished_at)
+    if last is not None and finished < last:
+        return  # arrived out of order: counted, but streaks and recoveries follow finish order
+    status = "failed" if failed else "success"
+    if failed and state.failing_since is None:
+        state.failing_since = finished
+        daily.failure_onsets += 1
+    elif not failed and state.failing_since is not None:
+        daily.recoveries += 1
+        daily.recovery_seconds += int((finished - _aware(state.failing_since)).total_seconds())
+        state.failing_since = None
+    state.streak_length = state.streak_length + 1 if state.streak_status == status else 1
+    state.streak_status = status
+    if failed:
+        daily.max_failure_streak = max(daily.max_failure_streak, state.streak_length)
+        state.longest_failure_streak = max(state.longest_failure_streak, state.streak_length)
+    state.last_finished_at = finished
+
+def on_transaction(session, changes):
+    """Ingest hook: advance the state of pipelines whose builds just completed"""
+    completed = []
+    for c in changes:
+        r = c.result
+        finished = _aware(r.finished_at or r.started_at)
+        if c.is_completion() and r.status in COUNTED_STATUSES and finished is not None:
+            completed.append((c.pipeline_id, r.status in FAILED_STATUSES, finished))
+    if not completed:
+        return
+    completed.sort(key=lambda x: x[2])
+    pipeline_ids = {pid for pid, _, _ in completed}
+    day_keys = list({(pid, _day(finished)) for pid, _, finished in completed})
+    states = {
+        s.pipeline_id: s for s in session.execute(
+            select(ReliabilityState).where(ReliabilityState.pipeline_id.in_(pipeline_ids)).with_for_update()
+        ).scalars()
+    }
+    days = {
+        (d.pipeline_id, d.day): d for d in session.execute(
+            select(ReliabilityDaily)
+            .where(tuple_(ReliabilityDaily.pipeline_id, ReliabilityDaily.day).in_(day_keys))
+            .with_for_update()
+        ).scalars()
+    }
+    for pid, failed, finished in completed:
+        state = states.get(pid)
+        if state is None:
+            state = states[pid] = ReliabilityState(pipeline_id=pid, streak_length=0, longest_failure_streak=0)
+            session.add(state)
+        key = (pid, _day(finished))
+        daily = days.get(key)
+        if daily is None:
+            daily = days[key] = _new_daily(*key)
+            session.add(daily)
+        advance(state, daily, failed, finished)
+
+def rebuild():
+    """Recompute states and daily counters from builds, a chunk of pipelines per transaction"""
+    counts = [_rebuild(chunk) for chunk in pipeline_chunks(ReliabilityState)]
+    print(f"Rebuilt reliability metrics for {sum(c[0] for c in counts)} pipelines from {sum(c[1] for c in counts)} builds")
+
+def _rebuild(pipeline_ids) -> tuple[int, int]:
+    """Rebuild `pipeline_ids` in one transaction; returns (pipelines with state, builds read)"""
+    finished = func.coalesce(Build.finished_at, Build.started_at)
+    base = select(
+        Build.pipeline_id,
+        finished.label("finished"),
+        case((Build.status.in_(FAILED_STATUSES), 1), else_=0).label("failed"),
+    ).where(
+        Build.pipeline_id.in_(pipeline_ids), Build.status.in_(COUNTED_STATUSES),
+        Build.duration_seconds.is_not(None), finished.is_not(None),
+    ).subquery()
+    by_pipeline = {"partition_by": base.c.pipeline_id, "order_by": (base.c.finished, base.c.failed)}
+    lagged = select(base, func.lag(base.c.failed).over(**by_pipeline).label("prev_failed")).subquery()
+    # run = number of status changes so far, so consecutive equal results share a run id
+    changed = case((lagged.c.failed != func.coalesce(lagged.c.prev_failed, -1), 1), else_=0)
+    runs = select(
+        lagged,
+        func.sum(changed).over(
+            partition_by=lagged.c.pipeline_id, order_by=(lagged.c.finished, lagged.c.failed), rows=(None, 0)
+        ).label("run"),
+    ).subquery()
+    streaks = select(
+        runs,
+        func.row_number().over(partition_by=(runs.c.pipeline_id, runs.c.run), order_by=runs.c.finished).label("streak"),
+        func.min(runs.c.finished).over(partition_by=(runs.c.pipeline_id, runs.c.run)).label("run_started"),
+    ).subquery()
+    rows = select(
+        streaks,
+        func.lag(streaks.c.run_started, type_=streaks.c.run_started.type).over(
+            partition_by=streaks.c.pipeline_id, order_by=(streaks.c.finished, streaks.c.failed)
+        ).label("prev_run_started"),
+    ).subquery()
+    stmt = select(rows).order_by(rows.c.pipeline_id, rows.c.finished, rows.c.failed)
+
+    states: dict = {}
+    days: dict = {}
+    total = 0
+    with SessionLocal() as session:
+        # under the writers' lock: builds ingested meanwhile wait and then advance the rebuilt state
+        data_version.lock(session)
+        for r in session.execute(stmt.execution_options(yield_per=5000)):
+            total += 1
+            finished_at = _aware(r.finished)
+            failed = bool(r.failed)
+            key = (r.pipeline_id, _day(finished_at))
+            daily = days.get(key)
+            if daily is None:
+                daily = days[key] = _new_daily(*key)
+            daily.builds += 1
+            if failed:
+                daily.failures += 1
+                daily.max_failure_streak = max(daily.max_failure_streak, r.streak)
+                if r.streak == 1:
+                    daily.failure_onsets += 1
+            elif r.prev_failed == 1:
+                daily.recoveries += 1
+                daily.recovery_seconds += int((finished_at - _aware(r.prev_run_started)).total_seconds())
+            state = states.get(r.pipeline_id)
+            if state is None:
+                state = states[r.pipeline_id] = ReliabilityState(pipeline_id=r.pipeline_id, longest_failure_streak=0)
+            state.last_finished_at = finished_at
+            state.streak_status = "failed" if failed else "success"
+            state.streak_length = r.streak
+            state.failing_since = _aware(r.run_started) if failed else None
+            if failed:
+                state.longest_failure_streak = max(state.longest_failure_streak, r.streak)
+        session.query(ReliabilityDaily).where(ReliabilityDaily.pipeline_id.in_(pipeline_ids)).delete(synchronize_session=False)
+        session.query(ReliabilityState).where(ReliabilityState.pipeline_id.in_(pipeline_ids)).delete(synchronize_session=False)
+        session.add_all(states.values())
+        session.add_all(days.values())
+        versions = data_version.bump(session, [], data_version.scopes_of_ids(session, pipeline_ids))
+        session.commit()
+    data_version.publish(versions)
+    return len(states), total
+
+def window(session, since: date, until: date, pipeline_ids=None) -> dict:
+    """{pipeline_id: summed counters} over the days in [since, until]"""
+    stmt = select(
+        ReliabilityDaily.pipeline_id,
+        func.sum(ReliabilityDaily.builds).label("builds"),
+        func.sum(ReliabilityDaily.failures).label("failures"),
+        func.sum(ReliabilityDaily.failure_onsets).label("failure_onsets"),
+        func.sum(ReliabilityDaily.recoveries).label("recoveries"),
+        func.sum(ReliabilityDaily.recovery_seconds).label("recovery_seconds"),
+        func.max(ReliabilityDaily.max_failure_streak).label("longest_failure_streak"),
+    ).where(ReliabilityDaily.day >= since, ReliabilityDaily.day <= until).group_by(ReliabilityDaily.pipeline_id)
+    if pipeline_ids is not None:
+        stmt = stmt.where(ReliabilityDaily.pipeline_id.in_(pipeline_ids))
+    return {r.pipeline_id: r._asdict() for r in session.execute(stmt)}
+
+def current(session, pipeline_ids) -> dict:
+    """{pipeline_id: ReliabilityState}"""
+    if not pipeline_ids:
+        return {}
+    return {
+        s.pipeline_id: s for s in session.execute(
+            select(ReliabilityState).where(ReliabilityState.pipeline_id.in_(pipeline_ids))
+        ).scalars()
+    }
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Replay harness for build ingestion.
+Generates GitHub workflow run lifecycles, emits them as a shuffled stream of
+poll results and webhook deliveries with duplicates and retries, replays the
+stream through the poll ingestion path and the real webhook routes (single
+deliveries and NDJSON batches, several requests in flight at once) and checks
+that every build ends in its final state without regressions or duplicate
+transitions.
+"""
+
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+
+# Add the current directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import select
+from db import SessionLocal, Pipeline, Build
+from collectors.base import upsert_builds, ACTIVE_STATUSES
+from collectors.github import parse_workflow_run
+from routes import webhooks
+import data_version
+import rollups
+
+def iso(t):
+    return t.isoformat().replace("+00:00", "Z")
+
+def lifecycle(run_id, start, rng):
+    """queued -> in_progress -> completed workflow_run objects, each with a later update time"""
+    conclusion = rng.choice(["success", "success", "success", "failure", "cancelled"])
+    duration = rng.randint(30, 3600)
+    steps = [("queued", None, 0), ("in_progress", None, 5), ("completed", conclusion, duration)]
+    return [
+        {
+            "id": run_id,
+            "status": status,
+            "conclusion": conclusion,
+            "run_started_at": iso(start),
+            "updated_at": iso(start + timedelta(seconds=offset)),
+            "html_url": None,
+        }
+        for status, conclusion, offset in steps
+    ]
+
+def build_stream(args, pipeline, rng):
+    lifecycles = {}
+    stream = []
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    for i in range(args.builds):
+        runs = lifecycle(i + 1, start + timedelta(seconds=i), rng)
+        lifecycles[str(i + 1)] = [parse_workflow_run(run, pipeline) for run in runs]
+        for n, run in enumerate(runs):
+            # every state is seen by both a poll and a webhook delivery
+            stream.append(("poll", None, run))
+            payload = {"action": run["status"], "workflow_run": run, "repository": {"full_name": pipeline}}
+            delivery = f"{pipeline}-{i}-{n}"
+            for _ in range(1 + rng.randint(0, args.duplicates)):
+                stream.append(("webhook", delivery, payload))
+    rng.shuffle(stream)
+    return lifecycles, stream
+
+async def replay(args, stream, pipeline, rng):
+    """Feed the stream in windows of --batch events, each window's requests sent concurrently"""
+    transitions = []
+    webhooks.send_alerts = transitions.extend  # record what the routes would alert on
+    app = FastAPI()
+    app.include_router(webhooks.router)
+    suppressed = 0
+
+    async def single(client, delivery, payload):
+        r = await client.post("/api/webhooks/github", json=payload, headers={"X-GitHub-Delivery": delivery})
+        r.raise_for_status()
+        return int(bool(r.json().get("duplicate")))
+
+    async def batch(client, events):
+        body = "\n".join(json.dumps({"delivery_id": delivery, "payload": payload}) for delivery, payload in events)
+        r = await client.post("/api/webhooks/github/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+        r.raise_for_status()
+        return sum(item["status"] == "duplicate" for item in r.json()["items"])
+
+    async def poll(runs):
+        transitions.extend(await asyncio.to_thread(upsert_builds, [parse_workflow_run(run, pipeline) for run in runs]))
+        return 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+        for offset in range(0, len(stream), args.batch):
+            window = stream[offset:offset + args.batch]
+            events = [(delivery, payload) for kind, delivery, payload in window if kind == "webhook"]
+            requests = [poll([run for kind, _, run in window if kind == "poll"])]
+            for n in range(args.concurrency):
+                group = events[n::args.concurrency]
+                if not group:
+                    continue
+                if rng.random() < 0.5:
+                    requests.append(batch(client, group))
+                else:
+                    requests += [single(client, delivery, payload) for delivery, payload in group]
+            suppressed += sum(await asyncio.gather(*requests))
+    return transitions, suppressed
+
+def verify(lifecycles, transitions, pipeline):
+    errors = []
+    with SessionLocal() as session:
+        rows = session.execute(
+            select(Build).join(Pipeline, Build.pipeline_id==Pipeline.id).where(Pipeline.name==pipeline)
+        ).scalars().all()
+        stored = {b.external_id: b for b in rows}
+        if len(rows) != len(lifecycles):
+            errors.append(f"expected {len(lifecycles)} builds, found {len(rows)}")
+        for external_id, steps in lifecycles.items():
+            b = stored.get(external_id)
+            final = steps[-1]
+            if b is None:
+                errors.append(f"{external_id}: missing")
+            elif b.status != final.status or b.duration_seconds != final.duration_seconds:
+                errors.append(f"{external_id}: ended as {b.status}/{b.duration_seconds}, expected {final.status}/{final.duration_seconds}")
+    per_build = {}
+    for t in transitions:
+        per_build.setdefault(t["external_id"], []).append(t)
+    for external_id, ts in per_build.items():
+        if len(ts) > len(lifecycles[external_id]):
+            errors.append(f"{external_id}: {len(ts)} transitions for {len(lifecycles[external_id])} states")
+        for t in ts:
+            if t["status_old"] and t["status_old"] not in ACTIVE_STATUSES and t["status_new"] in ACTIVE_STATUSES:
+                errors.append(f"{external_id}: regressed {t['status_old']} -> {t['status_new']}")
+    return errors
+
+def cleanup(pipeline):
+    """Delete a harness pipeline and its builds, with their rollup counts and cached versions"""
+    with SessionLocal() as session:
+        data_version.lock(session)
+        pipelines = session.execute(select(Pipeline.id, Pipeline.provider, Pipeline.name).where(Pipeline.name==pipeline)).all()
+        ids = [p.id for p in pipelines]
+        rollups.forget(session, ids)
+        session.query(Build).filter(Build.pipeline_id.in_(ids)).delete(synchronize_session=False)
+        session.query(Pipeline).filter(Pipeline.id.in_(ids)).delete(synchronize_session=False)
+        scopes = data_version.scopes_of((p.provider, p.name) for p in pipelines)
+        versions = data_version.bump(session, [], scopes | {data_version.PIPELINES, data_version.PURGE})
+        session.commit()
+    data_version.publish(versions)
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay shuffled, duplicated build events through ingestion')
+    parser.add_argument('--builds', type=int, default=200, help='Number of build lifecycles (default: 200)')
+    parser.add_argument('--duplicates', type=int, default=3, help='Max extra retries per webhook delivery (default: 3)')
+    parser.add_argument('--batch', type=int, default=25, help='Stream events replayed concurrently per window (default: 25)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Webhook request groups in flight per window (default: 4)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed (default: random)')
+    parser.add_argument('--keep', action='store_true', help='Keep the replayed builds in the database')
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    rng = random.Random(seed)
+    pipeline = f"replay-harness/{seed}"
+    lifecycles, stream = build_stream(args, pipeline, rng)
+    print(f"Replaying {len(stream)} events for {len(lifecycles)} builds (seed {seed})...")
+    try:
+        transitions, suppressed = asyncio.run(replay(args, stream, pipeline, rng))
+        errors = verify(lifecycles, transitions, pipeline)
+    finally:
+        if not args.keep:
+            cleanup(pipeline)
+    print(f"{len(transitions)} transitions, {suppressed} duplicate deliveries suppressed")
+    if errors:
+        print(f"\n❌ {len(errors)} problems:")
+        for e in errors[:20]:
+            print("  -", e)
+        sys.exit(1)
+    print("✅ Final states match, no regressions or duplicate transitions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Routing of read-only endpoints to a streaming replica (POSTGRES_READ_HOST).
+
+A request reads from the replica only when the replica has replayed at least
+the data version this worker is serving, so responses always match their ETag
+and the per-version caches; ingestion and webhooks always write to the primary.
+Tables outside the data versions are covered by a replay-lag bound
+(REPLICA_MAX_LAG_SECONDS). Replica state is sampled at most every
+REPLICA_CHECK_SECONDS; when it is behind, unreachable or not configured,
+requests fall back to the primary.
+
+With the SQLite backend and DUCKDB_ANALYTICS=true, the aggregate endpoints
+instead run on DuckDB attached read-only to the same database file; it reads
+live data, so there is no staleness to bound. If DuckDB cannot attach the file
+(e.g. its sqlite extension is not installed) those endpoints stay on SQLite.
+"""
+
+import os
+import time
+import threading
+
+from sqlalchemy import select, text
+from db import SessionLocal, ReadSessionLocal, read_engine, AnalyticsSessionLocal, analytics_engine, DataVersion
+import data_version
+
+MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "1"))
+
+# streaming standby: nothing received is left to replay -> caught up, however old the last commit
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+_status = {"version": None, "lag_seconds": None, "checked": 0.0, "error": None}
+_counts = {"replica": 0, "primary": 0, "duckdb": 0}
+_analytics = {"ok": None, "error": None}
+_check_lock = threading.Lock()
+
+def _check():
+    try:
+        with read_engine.connect() as conn:
+            version = conn.execute(select(DataVersion.version).where(DataVersion.scope == data_version.GLOBAL)).scalar()
+            lag = float(conn.execute(text(LAG_SQL)).scalar()) if read_engine.dialect.name == "postgresql" else 0.0
+        _status.update(version=version, lag_seconds=lag, error=None)
+    except Exception as e:
+        _status.update(version=None, lag_seconds=None, error=str(e))
+    _status["checked"] = time.monotonic()
+
+def usable() -> bool:
+    """Whether the replica is fresh enough to answer for this worker's current data version"""
+    if read_engine is None:
+        return False
+    if time.monotonic() - _status["checked"] >= CHECK_SECONDS and _check_lock.acquire(blocking=False):
+        try:
+            _check()
+        finally:
+            _check_lock.release()
+    version, lag = _status["version"], _status["lag_seconds"]
+    if version is None or lag is None or lag > MAX_LAG_SECONDS:
+        return False
+    serving = data_version.current()
+    return serving is None or version >= serving
+
+def get_read_session():
+    """Dependency for read-only endpoints: a replica session when it is fresh, else a primary one"""
+    route = "replica" if usable() else "primary"
+    _counts[route] += 1
+    db = ReadSessionLocal() if route == "replica" else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def analytics_usable() -> bool:
+    """Whether DuckDB is configured and could attach the database, probed on first use"""
+    if analytics_engine is None:
+        return False
+    if _analytics["ok"] is None:
+        try:
+            with analytics_engine.connect() as conn:
+                conn.execute(select(DataVersion.version).limit(1)).all()
+            _analytics["ok"] = True
+        except Exception as e:
+            print("DuckDB analytics unavailable, aggregating in SQLite:", e)
+            _analytics.update(ok=False, error=str(e))
+    return _analytics["ok"]
+
+def get_analytics_session():
+    """Dependency for aggregate endpoints: DuckDB when available, else as get_read_session"""
+    if not analytics_usable():
+        yield from get_read_session()
+        return
+    _counts["duckdb"] += 1
+    db = AnalyticsSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def stats() -> dict:
+    return {
+        "configured": read_engine is not None,
+        "replica_version": _status["version"],
+        "lag_seconds": _status["lag_seconds"],
+        "error": _status["error"],
+        "duckdb": _analytics["ok"] if analytics_engine is not None else None,
+        "duckdb_error": _analytics["error"],
+        "routed": dict(_counts),
+    }
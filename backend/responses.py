@@ -0,0 +1,55 @@
+import os
+import gzip
+
+import orjson
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # optional: br is only offered when the Brotli package is installed
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+# OPT_UTC_Z keeps timestamps byte-identical to what Pydantic emits for the response models
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+def rows_as_dicts(result) -> list[dict]:
+    """Turn a Core result straight into JSON-ready dicts, skipping model construction."""
+    return [dict(row) for row in result.mappings()]
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+def compress(request: Request, body: bytes) -> tuple[bytes, str | None]:
+    """Compress `body` with the best encoding the client accepts, if it is worth it."""
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=4), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
+
+def json_response(request: Request, content, status_code: int = 200, headers: dict | None = None) -> Response:
+    """orjson-encoded response that bypasses `response_model` re-validation."""
+    return encoded_response(request, dumps(content), "application/json", status_code, headers)
+
+def encoded_response(request: Request, body: bytes, media_type: str, status_code: int = 200, headers: dict | None = None) -> Response:
+    """Response for an already-serialized body, compressed when the client allows it."""
+    body, encoding = compress(request, body)
+    response = Response(body, status_code=status_code, media_type=media_type, headers=headers)
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
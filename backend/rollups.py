@@ -0,0 +1,393 @@
+"""
+Multi-resolution build rollups behind /api/metrics/timeseries.
+
+Every write adjusts per-provider bucket counters at 5-minute, hourly, daily and
+weekly resolution (UTC buckets by build start; weeks start on Monday), plus
+local days and weeks ("1d@<zone>", "1w@<zone>") for each zone in rollup_zones:
+a build counts once under its current status, and its duration once it has
+finished. A query for any range is answered from the coarsest resolution whose
+buckets nest exactly inside the requested steps in the requested time zone, so
+a year of daily steps in UTC or a backfilled zone reads ~365 rows per provider.
+
+Zones come from ROLLUP_TIMEZONES, and the first day or week query in any other
+zone registers it (up to ROLLUP_MAX_REQUESTED_TIMEZONES of them) and backfills
+it in the background. Until then, or past the cap, such queries are summed from
+hourly rows (~8760 a year), or from 5-minute rows when the zone's offset is not
+a whole hour (Asia/Kolkata, Asia/Kathmandu, Australia/Adelaide,
+America/St_Johns); the response's local_rollups says which. Steps are widened
+until the series fits in max_points, and empty steps are returned as zeros.
+"""
+
+import os
+import re
+import threading
+from bisect import bisect_right
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select, func, tuple_, union
+from db import SessionLocal, Build, Pipeline, BuildRollup, RollupZone, DataVersion, leader_lock
+from collectors.base import ACTIVE_STATUSES, FAILED_STATUSES
+import data_version
+
+WEEK_ORIGIN = 4 * 86400  # 1970-01-05, the first Monday after the epoch
+# (name, seconds, origin), coarsest first
+RESOLUTIONS = (("1w", 7 * 86400, WEEK_ORIGIN), ("1d", 86400, 0), ("1h", 3600, 0), ("5m", 300, 0))
+# zones that always get local-day and local-week rollups, e.g. those of most dashboard users
+ZONES = {z.strip(): ZoneInfo(z.strip()) for z in os.getenv("ROLLUP_TIMEZONES", "").split(",") if z.strip()}
+# further zones registered by queries; each adds two rollup rows per written build bucket
+MAX_REQUESTED_ZONES = int(os.getenv("ROLLUP_MAX_REQUESTED_TIMEZONES", "8"))
+UNIT_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+NICE_STEPS = ("5m", "10m", "15m", "30m", "1h", "2h", "3h", "6h", "12h", "1d", "2d", "1w", "2w", "4w")
+MAX_POINTS = 200
+FIELDS = ("builds", "success", "failed", "running", "duration_sum", "duration_count")
+
+# this process's copy of rollup_zones: every zone writes go to, and the backfilled ones queries read
+_zones = {"version": None, "all": {}, "ready": frozenset()}
+
+def _aware(dt):
+    return dt.replace(tzinfo=timezone.utc) if dt is not None and dt.tzinfo is None else dt
+
+def bucket(ts: datetime, seconds: int, origin: int = 0) -> datetime:
+    epoch = int(_aware(ts).timestamp())
+    return datetime.fromtimestamp((epoch - origin) // seconds * seconds + origin, timezone.utc)
+
+def _contribution(status: str, duration) -> Counter:
+    c = Counter(builds=1)
+    if status == "success":
+        c["success"] = 1
+    elif status in FAILED_STATUSES:
+        c["failed"] = 1
+    elif status in ACTIVE_STATUSES:
+        c["running"] = 1
+    if duration is not None and status not in ACTIVE_STATUSES:
+        c["duration_sum"] = duration
+        c["duration_count"] = 1
+    return c
+
+def local_midnight(day: date, tz: ZoneInfo) -> datetime:
+    """UTC instant at which `day` starts in `tz`, as boundaries() computes it"""
+    return datetime.combine(day, time()).replace(tzinfo=tz).astimezone(timezone.utc)
+
+def _zone_resolutions(zones) -> list[str]:
+    return [f"{r}@{name}" for name in zones for r in ("1d", "1w")]
+
+def _zone_buckets(started, zones) -> list[tuple[str, datetime]]:
+    out = []
+    for name, tz in zones.items():
+        day = _aware(started).astimezone(tz).date()
+        out.append((f"1d@{name}", local_midnight(day, tz)))
+        out.append((f"1w@{name}", local_midnight(day - timedelta(days=day.weekday()), tz)))
+    return out
+
+def _buckets(started) -> list[tuple[str, datetime]]:
+    """(resolution, bucket start) of every rollup a build started at `started` counts in"""
+    if started is None:
+        return []  # builds without a start time have no bucket, as in the other time-series views
+    return [(name, bucket(started, seconds, origin)) for name, seconds, origin in RESOLUTIONS] + _zone_buckets(started, _zones["all"])
+
+def _load(session, version):
+    rows = session.execute(select(RollupZone.name, RollupZone.ready_at)).all()
+    _zones.update(
+        all={r.name: ZoneInfo(r.name) for r in rows},
+        ready=frozenset(r.name for r in rows if r.ready_at is not None),
+        version=version,
+    )
+
+def _zones_version(session):
+    return session.scalar(select(DataVersion.version).where(DataVersion.scope == data_version.ROLLUP_ZONES))
+
+def sync(session):
+    """Adopt zones registered since this process last looked; call under data_version.lock() before writing rollups.
+
+    Zones are registered under the same lock, so every write committed after a
+    registration adds its local buckets, and the backfill recomputes the rest.
+    """
+    version = _zones_version(session)
+    if version != _zones["version"]:
+        _load(session, version)
+
+def reload():
+    """Re-read rollup_zones, e.g. when another worker registered or backfilled one"""
+    with SessionLocal() as session:
+        _load(session, _zones_version(session))
+
+def _add(deltas: dict, provider: str, buckets, contribution: Counter, sign: int):
+    for name, start in buckets:
+        key = (name, provider, start)
+        counter = deltas.setdefault(key, Counter())
+        for field, value in contribution.items():
+            counter[field] += sign * value
+
+def on_transaction(session, changes):
+    """Ingest hook: move each written build's contribution from its old bucket/status to the new one"""
+    sync(session)
+    deltas: dict = {}
+    for c in changes:
+        r = c.result
+        if c.status_old is not None:
+            _add(deltas, r.provider, _buckets(c.started_old), _contribution(c.status_old, c.duration_old), -1)
+        _add(deltas, r.provider, _buckets(r.started_at), _contribution(r.status, r.duration_seconds), 1)
+    _apply(session, deltas)
+
+def forget(session, pipeline_ids):
+    """Subtract the builds of `pipeline_ids`, about to be deleted outside ingestion, from the rollups.
+
+    Call under data_version.lock(); rollup rows have no foreign key to cascade from.
+    """
+    sync(session)
+    deltas: dict = {}
+    for r in session.execute(
+        select(Pipeline.provider, Build.started_at, Build.status, Build.duration_seconds)
+        .join(Pipeline, Pipeline.id == Build.pipeline_id)
+        .where(Build.pipeline_id.in_(pipeline_ids), Build.started_at.is_not(None))
+    ):
+        _add(deltas, r.provider, _buckets(r.started_at), _contribution(r.status, r.duration_seconds), -1)
+    _apply(session, deltas)
+
+def _apply(session, deltas: dict):
+    """Add {(resolution, provider, bucket_start): Counter} to the stored rollups"""
+    deltas = {k: v for k, v in deltas.items() if any(v.values())}
+    if not deltas:
+        return
+    stored = {
+        (row.resolution, row.provider, _aware(row.bucket_start)): row
+        for row in session.execute(
+            select(BuildRollup)
+            .where(tuple_(BuildRollup.resolution, BuildRollup.provider, BuildRollup.bucket_start).in_(list(deltas)))
+            .with_for_update()
+        ).scalars()
+    }
+    for key, delta in deltas.items():
+        row = stored.get(key)
+        if row is None:
+            row = BuildRollup(resolution=key[0], provider=key[1], bucket_start=key[2], **dict.fromkeys(FIELDS, 0))
+            session.add(row)
+        for field, value in delta.items():
+            setattr(row, field, getattr(row, field) + value)
+
+def rebuild(zones: dict | None = None):
+    """Recompute every rollup, or only the local ones of `zones`, from the builds table, one provider per transaction.
+
+    Rollup rows are shared by a provider's pipelines, so each provider is
+    recomputed whole under the ingest writers' lock; its builds ingested
+    meanwhile wait and then add on top of the rebuilt counts.
+    """
+    with SessionLocal() as session:
+        providers = sorted(session.scalars(union(select(Pipeline.provider), select(BuildRollup.provider))))
+    rows = total = 0
+    for provider in providers:
+        deltas: dict = {}
+        stmt = select(Build.started_at, Build.status, Build.duration_seconds).join(
+            Pipeline, Pipeline.id == Build.pipeline_id
+        ).where(Pipeline.provider == provider, Build.started_at.is_not(None))
+        stale = [BuildRollup.provider == provider]
+        if zones is not None:
+            stale.append(BuildRollup.resolution.in_(_zone_resolutions(zones)))
+        with SessionLocal() as session:
+            data_version.lock(session)
+            sync(session)
+            for r in session.execute(stmt.execution_options(yield_per=10000)):
+                buckets = _buckets(r.started_at) if zones is None else _zone_buckets(r.started_at, zones)
+                _add(deltas, provider, buckets, _contribution(r.status, r.duration_seconds), 1)
+                total += 1
+            session.query(BuildRollup).where(*stale).delete(synchronize_session=False)
+            session.add_all(
+                BuildRollup(resolution=name, provider=provider, bucket_start=start, **{f: counts[f] for f in FIELDS})
+                for (name, _, start), counts in deltas.items()
+            )
+            versions = data_version.bump(session, [], [data_version.provider_scope(provider)])
+            session.commit()
+        data_version.publish(versions)
+        rows += len(deltas)
+    print(f"Rebuilt {rows} build rollups from {total} builds")
+
+def sync_zones():
+    """Register ROLLUP_TIMEZONES, drop the rollups of zones taken out of it and backfill every pending zone"""
+    with leader_lock("cicd-dashboard-rollup-zones") as leader:
+        if not leader:
+            return
+        with SessionLocal() as session:
+            data_version.lock(session)
+            stored = {z.name: z for z in session.scalars(select(RollupZone))}
+            changed = False
+            for name in ZONES.keys() - stored.keys():
+                session.add(RollupZone(name=name, configured=True))
+                changed = True
+            for name, zone in list(stored.items()):
+                if name in ZONES:
+                    zone.configured = True
+                elif zone.configured:
+                    session.delete(zone)
+                    del stored[name]
+                    changed = True
+            session.flush()
+            removed = session.query(BuildRollup).where(
+                BuildRollup.resolution.like("%@%"),
+                BuildRollup.resolution.not_in(_zone_resolutions(stored.keys() | ZONES.keys())),
+            ).delete(synchronize_session=False)
+            versions = data_version.bump(session, [], [data_version.ROLLUP_ZONES]) if changed else {}
+            session.commit()
+        data_version.publish(versions)
+        if removed:
+            print(f"Dropped {removed} rollups of time zones no longer in ROLLUP_TIMEZONES")
+        # zones registered by queries meanwhile are picked up by the next pass
+        while True:
+            with SessionLocal() as session:
+                pending = list(session.scalars(select(RollupZone.name).where(RollupZone.ready_at.is_(None))))
+            if not pending:
+                break
+            print(f"Backfilling local rollups for {', '.join(pending)}...")
+            rebuild({name: ZoneInfo(name) for name in pending})
+            with SessionLocal() as session:
+                data_version.lock(session)
+                session.query(RollupZone).where(RollupZone.name.in_(pending)).update(
+                    {RollupZone.ready_at: datetime.now(timezone.utc)}, synchronize_session=False,
+                )
+                versions = data_version.bump(session, [], [data_version.ROLLUP_ZONES])
+                session.commit()
+            data_version.publish(versions)
+    reload()
+
+def _register(tz_name: str) -> bool:
+    """Add `tz_name` to rollup_zones unless MAX_REQUESTED_ZONES are already there; True once it is registered"""
+    with SessionLocal() as session:
+        data_version.lock(session)
+        sync(session)
+        if tz_name in _zones["all"]:
+            return True
+        requested = session.scalar(select(func.count()).select_from(RollupZone).where(RollupZone.configured.is_(False)))
+        if requested >= MAX_REQUESTED_ZONES:
+            return False
+        session.add(RollupZone(name=tz_name, configured=False))
+        versions = data_version.bump(session, [], [data_version.ROLLUP_ZONES])
+        session.commit()
+    data_version.publish(versions)
+    reload()
+    return True
+
+def _backfill(tz_name: str):
+    # a non-leader returns once the leader's pass ends, which may have missed this zone
+    for _ in range(3):
+        try:
+            sync_zones()
+        except Exception as e:
+            print(f"Local rollup backfill for {tz_name} failed, will retry on next startup:", e)
+            return
+        if tz_name in _zones["ready"]:
+            return
+
+def local_rollups(tz_name: str) -> str:
+    """Whether day and week steps in `tz_name` can read its local rollups: ready, backfilling or unavailable.
+
+    A zone seen for the first time is registered and backfilled in the background.
+    """
+    if tz_name in _zones["ready"]:
+        return "ready"
+    if tz_name not in _zones["all"]:
+        if not _register(tz_name):
+            return "unavailable"
+        threading.Thread(target=_backfill, args=(tz_name,), name=f"rollups-{tz_name}", daemon=True).start()
+    return "backfilling"
+
+def parse_step(step: str) -> tuple[int, str]:
+    m = re.fullmatch(r"(\d+)([mhdw])", step.strip())
+    if not m or int(m.group(1)) == 0:
+        raise ValueError(f"invalid step {step!r}; use e.g. 5m, 1h, 1d, 1w")
+    n, unit = int(m.group(1)), m.group(2)
+    if unit == "m" and n % 5:
+        raise ValueError("minute steps must be a multiple of 5m")
+    return n, unit
+
+def _seconds(step: str) -> int:
+    n, unit = parse_step(step)
+    return n * UNIT_SECONDS[unit]
+
+def choose_step(start: datetime, end: datetime, step: str | None, max_points: int) -> str:
+    """`step`, or the finest NICE_STEPS one when None, widened until the range fits in max_points"""
+    span = (end - start).total_seconds()
+    floor = _seconds(step) if step else 0
+    if step and span / floor <= max_points:
+        return step
+    for candidate in NICE_STEPS:
+        if _seconds(candidate) >= floor and span / _seconds(candidate) <= max_points:
+            return candidate
+    return NICE_STEPS[-1]
+
+def boundaries(start: datetime, end: datetime, tz: ZoneInfo, step: str) -> list[datetime]:
+    """UTC instants delimiting the steps covering [start, end): wall-clock aligned in `tz`"""
+    n, unit = parse_step(step)
+    local = start.astimezone(tz).replace(tzinfo=None)
+    if unit in ("d", "w"):
+        days = n * (7 if unit == "w" else 1)
+        origin = date(1970, 1, 5).toordinal() if unit == "w" else date(1970, 1, 1).toordinal()
+        ordinal = origin + (local.date().toordinal() - origin) // days * days
+        cur, delta = datetime.combine(date.fromordinal(ordinal), time()), timedelta(days=days)
+    else:
+        minutes = n * (60 if unit == "h" else 1)
+        since_midnight = local.hour * 60 + local.minute
+        cur = datetime.combine(local.date(), time()) + timedelta(minutes=since_midnight // minutes * minutes)
+        delta = timedelta(minutes=minutes)
+    out: list[datetime] = []
+    while True:
+        b = cur.replace(tzinfo=tz).astimezone(timezone.utc)
+        if not out or b > out[-1]:  # DST can make two wall-clock steps one instant
+            out.append(b)
+        if b >= end:
+            return out
+        cur += delta
+
+def choose_resolution(bounds: list[datetime], tz_name: str = "UTC") -> str:
+    """Coarsest rollup whose buckets nest exactly inside every step"""
+    tz = _zones["all"].get(tz_name) if tz_name in _zones["ready"] else None
+    if tz is not None:
+        local = [b.astimezone(tz).date() for b in bounds]
+        if all(b == local_midnight(day, tz) for b, day in zip(bounds, local)):
+            return f"1w@{tz_name}" if all(day.weekday() == 0 for day in local) else f"1d@{tz_name}"
+    shortest = min((b - a).total_seconds() for a, b in zip(bounds, bounds[1:]))
+    for name, seconds, origin in RESOLUTIONS:
+        if seconds <= shortest and all((int(b.timestamp()) - origin) % seconds == 0 for b in bounds):
+            return name
+    return RESOLUTIONS[-1][0]
+
+def series(session, start: datetime, end: datetime, tz_name: str = "UTC", step: str | None = None,
+           max_points: int = MAX_POINTS, provider: str | None = None) -> dict:
+    start, end = _aware(start), _aware(end)
+    if end <= start:
+        raise ValueError("'to' must be after 'from'")
+    try:
+        tz = ZoneInfo(tz_name)
+    except Exception:
+        raise ValueError(f"unknown time zone {tz_name!r}")
+    step = choose_step(start, end, step, max_points)
+    bounds = boundaries(start, end, tz, step)
+    resolution = choose_resolution(bounds, tz_name)
+    local = "ready" if "@" in resolution else None
+    if local is None and step[-1] in "dw" and resolution not in ("1d", "1w"):
+        # day steps that do not nest UTC days: this zone wants its own rollups
+        local = local_rollups(tz_name)
+    stmt = select(
+        BuildRollup.bucket_start, *(func.sum(getattr(BuildRollup, f)).label(f) for f in FIELDS)
+    ).where(
+        BuildRollup.resolution == resolution,
+        BuildRollup.bucket_start >= bounds[0], BuildRollup.bucket_start < bounds[-1],
+    ).group_by(BuildRollup.bucket_start)
+    if provider:
+        stmt = stmt.where(BuildRollup.provider == provider)
+    totals = [Counter() for _ in bounds[:-1]]
+    rows = 0
+    for r in session.execute(stmt):
+        rows += 1
+        i = bisect_right(bounds, _aware(r.bucket_start)) - 1
+        for f in FIELDS:
+            totals[i][f] += getattr(r, f) or 0
+    points = [{
+        "time": b.astimezone(tz).isoformat(),
+        "builds": t["builds"], "success": t["success"], "failed": t["failed"], "running": t["running"],
+        "avg_duration": round(t["duration_sum"] / t["duration_count"], 1) if t["duration_count"] else None,
+    } for b, t in zip(bounds, totals)]
+    return {
+        "from": bounds[0].astimezone(tz).isoformat(), "to": bounds[-1].astimezone(tz).isoformat(),
+        "tz": tz_name, "step": step, "resolution": resolution, "local_rollups": local, "rollup_rows": rows, "points": points,
+    }
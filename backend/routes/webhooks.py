@@ -1,71 +1,94 @@
 
 import os
+import json
+import asyncio
+import threading
+from collections import OrderedDict
 from fastapi import APIRouter, Request, Header, HTTPException
-from datetime import datetime
+from datetime import datetime, timezone
 from collectors.base import CollectorResult, upsert_builds
-from alerts.slack import SlackAlerter
-from alerts.emailer import EmailAlerter
+from collectors.github import parse_workflow_run
+from plugins import load_alerters
 
 router = APIRouter(prefix="/api/webhooks", tags=["webhooks"])
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_DEDUPE_SIZE = int(os.getenv("WEBHOOK_DEDUPE_SIZE", "10000"))
+WEBHOOK_BATCH_MAX_ITEMS = int(os.getenv("WEBHOOK_BATCH_MAX_ITEMS", "5000"))
 
-def verify_secret(header_value: str):
-    # Basic equality check against configured secret (operator must set WEBHOOK_SECRET)
-    if not WEBHOOK_SECRET:
-        return True
-    return header_value == WEBHOOK_SECRET
+class SeenDeliveries:
+    """Bounded set of recently processed delivery ids; providers reuse the id when retrying.
 
-@router.post("/github")
-async def github_webhook(request: Request, x_hub_signature_256: str | None = Header(None), x_github_event: str | None = Header(None)):
-    # GitHub sends workflow_run events for Actions; we expect the workflow_run object.
-    # Validate secret using X-Hub-Signature-256 if provided; otherwise rely on WEBHOOK_SECRET with header fallback.
-    if WEBHOOK_SECRET and x_hub_signature_256 is None:
-        # try fallback header
-        pass  # operator may configure signature verification externally
+    A delivery is claimed before it is written, so a retry arriving while the
+    first attempt is still in flight is answered as a duplicate; a failed
+    attempt gives its claim back so the provider's next retry is processed.
+    """
 
-    payload = await request.json()
-    # Only handle workflow_run events
-    if "workflow_run" not in payload:
-        return {"ok": False, "reason": "unsupported_event"}
+    def __init__(self, size: int):
+        self.size = size
+        self._ids: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()  # sync routes run in the threadpool
 
-    run = payload["workflow_run"]
-    status = run.get("conclusion") or run.get("status")
-    started = run.get("run_started_at")
-    finished = run.get("updated_at")
-    started_at = datetime.fromisoformat(started.replace("Z","+00:00")) if started else None
-    finished_at = datetime.fromisoformat(finished.replace("Z","+00:00")) if finished else None
-    duration = None
-    if started_at and finished_at:
-        duration = int((finished_at - started_at).total_seconds())
-    cr = CollectorResult(
-        provider="github",
-        pipeline_name=payload.get("repository", {}).get("full_name") or run.get("name"),
-        external_id=str(run.get("id")),
-        status=status,
-        started_at=started_at,
-        finished_at=finished_at,
-        duration_seconds=duration,
-        web_url=run.get("html_url"),
-    )
-    transitions = upsert_builds([cr])
-    # send alerts
-    alerters = [SlackAlerter(), EmailAlerter()]
+    def __contains__(self, delivery_id) -> bool:
+        return delivery_id in self._ids
+
+    def claim(self, delivery_id) -> bool:
+        """Mark `delivery_id` seen; False if it already was"""
+        with self._lock:
+            if delivery_id in self._ids:
+                return False
+            self._ids[delivery_id] = None
+            while len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+            return True
+
+    def discard(self, delivery_id):
+        with self._lock:
+            self._ids.pop(delivery_id, None)
+
+seen_deliveries = SeenDeliveries(WEBHOOK_DEDUPE_SIZE)
+
+def send_alerts(transitions: list[dict]):
+    alerters = load_alerters()
     for t in transitions:
         for a in alerters:
             try:
                 a.notify(t)
             except Exception:
                 pass
+
+def ingest_delivery(provider: str, delivery_id: str | None, results: list[CollectorResult]) -> dict:
+    """Upsert webhook results once per delivery id and alert on the resulting transitions"""
+    key = (provider, delivery_id) if delivery_id else None
+    if key and not seen_deliveries.claim(key):
+        return {"ok": True, "duplicate": True, "updated": 0}
+    try:
+        transitions = upsert_builds(results)
+    except Exception:
+        if key:
+            seen_deliveries.discard(key)
+        raise
+    send_alerts(transitions)
     return {"ok": True, "updated": len(transitions)}
 
-@router.post("/gitlab")
-async def gitlab_webhook(request: Request, x_gitlab_token: str | None = Header(None)):
-    if WEBHOOK_SECRET and x_gitlab_token != WEBHOOK_SECRET:
-        raise HTTPException(status_code=403, detail="invalid token")
-    payload = await request.json()
+def verify_secret(header_value: str):
+    # Basic equality check against configured secret (operator must set WEBHOOK_SECRET)
+    if not WEBHOOK_SECRET:
+        return True
+    return header_value == WEBHOOK_SECRET
+
+# Payload parsers: return a CollectorResult, or None for events we don't handle
+
+def parse_github(payload: dict) -> CollectorResult | None:
+    # GitHub sends workflow_run events for Actions; we expect the workflow_run object.
+    if "workflow_run" not in payload:
+        return None
+    run = payload["workflow_run"]
+    return parse_workflow_run(run, payload.get("repository", {}).get("full_name") or run.get("name"), source="webhook")
+
+def parse_gitlab(payload: dict) -> CollectorResult | None:
     # Pipelines webhook
     if payload.get("object_kind") not in ("pipeline","job"):
-        return {"ok": False, "reason": "unsupported_event"}
+        return None
     # Normalize pipeline info
     pipeline = payload.get("object_attributes") or payload.get("pipeline") or {}
     status = pipeline.get("status")
@@ -77,7 +100,7 @@ async def gitlab_webhook(request: Request, x_gitlab_token: str | None = Header(N
     if started_at and finished_at:
         duration = int((finished_at - started_at).total_seconds())
     project = payload.get("project", {})
-    cr = CollectorResult(
+    return CollectorResult(
         provider="gitlab",
         pipeline_name=str(project.get("path_with_namespace") or project.get("name")),
         external_id=str(pipeline.get("id") or pipeline.get("job_id") or ""),
@@ -86,22 +109,12 @@ async def gitlab_webhook(request: Request, x_gitlab_token: str | None = Header(N
         finished_at=finished_at,
         duration_seconds=duration,
         web_url=project.get("web_url") or pipeline.get("url"),
+        source="webhook",
+        updated_at=datetime.fromisoformat(pipeline["finished_at"].replace("Z","+00:00")) if pipeline.get("finished_at") else None,
+        commit_sha=pipeline.get("sha"),
     )
-    transitions = upsert_builds([cr])
-    alerters = [SlackAlerter(), EmailAlerter()]
-    for t in transitions:
-        for a in alerters:
-            try:
-                a.notify(t)
-            except Exception:
-                pass
-    return {"ok": True, "updated": len(transitions)}
 
-@router.post("/jenkins")
-async def jenkins_webhook(request: Request, x_jenkins_token: str | None = Header(None)):
-    if WEBHOOK_SECRET and x_jenkins_token != WEBHOOK_SECRET:
-        raise HTTPException(status_code=403, detail="invalid token")
-    payload = await request.json()
+def parse_jenkins(payload: dict) -> CollectorResult | None:
     # Jenkins can send many forms; try to read common fields
     name = payload.get("name") or payload.get("job_name") or payload.get("project")
     number = payload.get("build", {}).get("number") or payload.get("build", {}).get("id")
@@ -113,29 +126,132 @@ async def jenkins_webhook(request: Request, x_jenkins_token: str | None = Header
     finished_at = None
     if timestamp:
         try:
-            from datetime import datetime, timezone
             started_at = datetime.fromtimestamp(int(timestamp)/1000, tz=timezone.utc)
             if duration_ms:
                 finished_at = datetime.fromtimestamp((int(timestamp)+int(duration_ms))/1000, tz=timezone.utc)
         except Exception:
             pass
     duration = int(duration_ms/1000) if duration_ms else None
-    cr = CollectorResult(
+    return CollectorResult(
         provider="jenkins",
         pipeline_name=name or "jenkins-job",
         external_id=str(number or ""),
-        status=("running" if result in (None, "") else ("success" if str(result).upper()=="SUCCESS" else "failed" if str(result).upper()=="FAILURE" else str(result))),
+        status=("running" if result in (None, "") else ("success" if str(result).upper()=="SUCCESS" else "failed" if str(result).upper()=="FAILURE" else str(result).lower())),
         started_at=started_at,
         finished_at=finished_at,
         duration_seconds=duration,
         web_url=url,
+        source="webhook",
+        updated_at=finished_at,
+        commit_sha=(payload.get("build", {}).get("scm") or {}).get("commit"),
     )
-    transitions = upsert_builds([cr])
-    alerters = [SlackAlerter(), EmailAlerter()]
-    for t in transitions:
-        for a in alerters:
-            try:
-                a.notify(t)
-            except Exception:
-                pass
-    return {"ok": True, "updated": len(transitions)}
+
+PARSERS = {"github": parse_github, "gitlab": parse_gitlab, "jenkins": parse_jenkins}
+
+@router.post("/github")
+async def github_webhook(request: Request, x_hub_signature_256: str | None = Header(None), x_github_event: str | None = Header(None), x_github_delivery: str | None = Header(None)):
+    # Validate secret using X-Hub-Signature-256 if provided; otherwise rely on WEBHOOK_SECRET with header fallback.
+    if WEBHOOK_SECRET and x_hub_signature_256 is None:
+        # try fallback header
+        pass  # operator may configure signature verification externally
+
+    cr = parse_github(await request.json())
+    if cr is None:
+        return {"ok": False, "reason": "unsupported_event"}
+    return await asyncio.to_thread(ingest_delivery, "github", x_github_delivery, [cr])
+
+@router.post("/gitlab")
+async def gitlab_webhook(request: Request, x_gitlab_token: str | None = Header(None), x_gitlab_event_uuid: str | None = Header(None), x_delivery_id: str | None = Header(None)):
+    if WEBHOOK_SECRET and x_gitlab_token != WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="invalid token")
+    cr = parse_gitlab(await request.json())
+    if cr is None:
+        return {"ok": False, "reason": "unsupported_event"}
+    return await asyncio.to_thread(ingest_delivery, "gitlab", x_gitlab_event_uuid or x_delivery_id, [cr])
+
+@router.post("/jenkins")
+async def jenkins_webhook(request: Request, x_jenkins_token: str | None = Header(None), x_delivery_id: str | None = Header(None)):
+    if WEBHOOK_SECRET and x_jenkins_token != WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="invalid token")
+    cr = parse_jenkins(await request.json())
+    return await asyncio.to_thread(ingest_delivery, "jenkins", x_delivery_id, [cr])
+
+# Batch endpoints: a JSON array or NDJSON stream of provider payloads. An item may
+# also be an envelope {"delivery_id": "...", "payload": {...}} to keep per-delivery dedupe.
+
+async def read_batch(request: Request) -> list:
+    body = await request.body()
+    if "ndjson" in request.headers.get("content-type", "") or not body.lstrip().startswith(b"["):
+        try:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"invalid NDJSON: {e}")
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"invalid JSON: {e}")
+    if len(items) > WEBHOOK_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"batch exceeds {WEBHOOK_BATCH_MAX_ITEMS} items")
+    return items
+
+async def ingest_batch(provider: str, items: list) -> dict:
+    """Normalize every item, commit them in one bulk upsert and report per-item results"""
+    parse = PARSERS[provider]
+    results = []
+    accepted = []  # (index, delivery key, CollectorResult)
+    claimed = []  # delivery keys this request must give back if the upsert fails
+    for i, item in enumerate(items):
+        delivery_id, payload = None, item
+        if isinstance(item, dict) and isinstance(item.get("payload"), dict):
+            delivery_id, payload = item.get("delivery_id"), item["payload"]
+        key = (provider, str(delivery_id)) if delivery_id else None
+        # claimed before the await below, so a concurrent batch carrying the same delivery skips it
+        if key and not seen_deliveries.claim(key):
+            results.append({"index": i, "status": "duplicate"})
+            continue
+        try:
+            cr = parse(payload) if isinstance(payload, dict) else None
+        except Exception as e:
+            cr, error = None, {"index": i, "status": "invalid", "error": str(e)}
+        else:
+            error = {"index": i, "status": "unsupported_event"}
+        if cr is None:
+            if key:
+                seen_deliveries.discard(key)
+            results.append(error)
+            continue
+        if key:
+            claimed.append(key)
+        accepted.append((i, key, cr))
+        results.append(None)  # filled in after the upsert
+
+    try:
+        transitions = await asyncio.to_thread(upsert_builds, [cr for _, _, cr in accepted]) if accepted else []
+    except Exception:
+        for key in claimed:
+            seen_deliveries.discard(key)
+        raise
+    changed = {(t["pipeline"], t["external_id"]): t["status_new"] for t in transitions}
+    for i, key, cr in accepted:
+        status_new = changed.get((cr.pipeline_name, cr.external_id))
+        results[i] = {"index": i, "status": "updated" if status_new else "unchanged", "external_id": cr.external_id}
+    if transitions:
+        await asyncio.to_thread(send_alerts, transitions)
+    return {"ok": True, "received": len(items), "accepted": len(accepted), "updated": len(transitions), "items": results}
+
+@router.post("/github/batch")
+async def github_webhook_batch(request: Request):
+    return await ingest_batch("github", await read_batch(request))
+
+@router.post("/gitlab/batch")
+async def gitlab_webhook_batch(request: Request, x_gitlab_token: str | None = Header(None)):
+    if WEBHOOK_SECRET and x_gitlab_token != WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="invalid token")
+    return await ingest_batch("gitlab", await read_batch(request))
+
+@router.post("/jenkins/batch")
+async def jenkins_webhook_batch(request: Request, x_jenkins_token: str | None = Header(None)):
+    if WEBHOOK_SECRET and x_jenkins_token != WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="invalid token")
+    return await ingest_batch("jenkins", await read_batch(request))
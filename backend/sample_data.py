@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 import random
 from db import get_session, Pipeline, Build
+import data_version
+from plugins import rebuild_derived
 from random_data_generator import generate_random_pipeline_name, generate_random_build_status, generate_random_build_duration, generate_random_error_log
 
 # Sample pipeline data with more variety
@@ -123,11 +125,16 @@ def seed_sample_data():
         
         # Generate and create builds
         builds_data = generate_sample_builds()
-        for build_data in builds_data:
-            build = Build(**build_data)
-            session.add(build)
+        builds = [Build(**build_data) for build_data in builds_data]
+        session.add_all(builds)
         
+        seeded = data_version.scopes_of((p["provider"], p["name"]) for p in SAMPLE_PIPELINES)
+        versions = data_version.bump(session, [], seeded | {data_version.PIPELINES})
+        for build in builds:
+            build.data_version = versions[data_version.GLOBAL]
         session.commit()
+        data_version.publish(versions)
+        rebuild_derived()
         print(f"Created {len(SAMPLE_PIPELINES)} pipelines and {len(builds_data)} builds")
         print("Sample data includes:")
         print(f"- {len([p for p in SAMPLE_PIPELINES if p['provider'] == 'github'])} GitHub Actions pipelines")
@@ -141,6 +148,9 @@ def clear_sample_data():
     with next(get_session()) as session:
         print("Clearing sample data...")
         
+        # every provider and pipeline scope must move, or filtered requests keep matching old ETags
+        deleted = data_version.scopes_of(session.query(Pipeline.provider, Pipeline.name).all())
+        
         # Delete builds first (due to foreign key constraint)
         build_count = session.query(Build).count()
         session.query(Build).delete()
@@ -148,8 +158,11 @@ def clear_sample_data():
         # Delete pipelines
         pipeline_count = session.query(Pipeline).count()
         session.query(Pipeline).delete()
+        versions = data_version.bump(session, [], deleted | {data_version.PIPELINES, data_version.PURGE})
         
         session.commit()
+        data_version.publish(versions)
+        rebuild_derived()
         print(f"Cleared {build_count} builds and {pipeline_count} pipelines")
 
 def reset_sample_data():
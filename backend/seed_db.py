@@ -13,14 +13,17 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from sample_data import seed_sample_data, clear_sample_data, reset_sample_data
 from db import init_db
+from plugins import rebuild_derived
 
 def main():
     """Main function to seed the database"""
     parser = argparse.ArgumentParser(description='CI/CD Dashboard Database Management Tool')
-    parser.add_argument('--action', choices=['seed', 'clear', 'reset', 'init'], 
+    parser.add_argument('--action', choices=['seed', 'clear', 'reset', 'init', 'backfill', 'compact', 'migrate'], 
                        default='seed', help='Action to perform (default: seed)')
     parser.add_argument('--force', action='store_true', 
                        help='Force action even if data exists')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='With --action migrate: print pending migrations and their SQL without applying them')
     
     args = parser.parse_args()
     
@@ -28,6 +31,13 @@ def main():
     print("=" * 50)
     
     try:
+        if args.action == 'migrate' and args.dry_run:
+            import migrations
+            print(f"Schema version: {migrations.version()}")
+            if not migrations.run(dry_run=True):
+                print("✅ Schema is up to date")
+            return
+        
         # Initialize database tables and run migrations
         print("Initializing database...")
         init_db()
@@ -37,6 +47,25 @@ def main():
             print("Database initialization completed.")
             return
         
+        if args.action == 'migrate':
+            import migrations
+            import rollups
+            rollups.sync_zones()
+            print(f"✅ Schema version {migrations.version()}")
+            return
+        
+        if args.action == 'backfill':
+            print("Rebuilding derived analytics from builds...")
+            rebuild_derived()
+            print("✅ Backfill completed!")
+            return
+        
+        if args.action == 'compact':
+            from compact_schema import migrate
+            print("Converting to the compact schema (online)...")
+            migrate()
+            return
+        
         if args.action == 'clear':
             print("Clearing sample data...")
             clear_sample_data()
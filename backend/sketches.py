@@ -0,0 +1,139 @@
+"""
+Mergeable duration sketches: one log-bucketed histogram per pipeline per UTC day.
+
+Bucket i counts durations in (GAMMA**(i-1), GAMMA**i], so every quantile read back
+is within SKETCH_ACCURACY relative error no matter how many builds went in, and
+sketches for different days (or pipelines) merge by adding bucket counts. A
+percentile over any window is therefore a merge of O(days) small rows instead of
+a sort over every build in it.
+"""
+
+import os
+import json
+import math
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import select, tuple_
+from db import SessionLocal, DurationSketch
+from collectors.base import ACTIVE_STATUSES
+import build_events
+import data_version
+from plugins import pipeline_chunks
+
+ACCURACY = float(os.getenv("SKETCH_ACCURACY", "0.01"))
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+MIN_SECONDS = 0.5  # durations below this share the lowest bucket
+
+def bucket(seconds: float) -> int:
+    return math.ceil(math.log(max(seconds, MIN_SECONDS)) / _LOG_GAMMA)
+
+def bucket_value(index: int) -> float:
+    # midpoint estimate that keeps the relative error within ACCURACY on both sides
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+class Sketch:
+    def __init__(self, buckets=None, count: int = 0):
+        self.buckets = Counter(buckets or {})
+        self.count = count
+
+    @classmethod
+    def from_row(cls, row: DurationSketch) -> "Sketch":
+        return cls({int(k): v for k, v in json.loads(row.buckets).items()}, row.count)
+
+    def to_json(self) -> str:
+        return json.dumps({str(k): v for k, v in sorted(self.buckets.items())}, separators=(",", ":"))
+
+    def add(self, seconds: float, n: int = 1):
+        self.buckets[bucket(seconds)] += n
+        self.count += n
+
+    def merge(self, other: "Sketch") -> "Sketch":
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return bucket_value(index)
+        return bucket_value(max(self.buckets))
+
+def _day(r) -> date:
+    return _day_of(r.finished_at or r.started_at or datetime.now(timezone.utc))
+
+def _day_of(ts: datetime) -> date:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts.date()
+
+def merge_into(session, pending: dict):
+    """Add {(pipeline_id, day): Sketch} to the stored daily sketches"""
+    keys = list(pending)
+    stored = {
+        (row.pipeline_id, row.day): row
+        for row in session.execute(
+            select(DurationSketch)
+            .where(tuple_(DurationSketch.pipeline_id, DurationSketch.day).in_(keys))
+            .with_for_update()
+        ).scalars()
+    } if keys else {}
+    for key, sketch in pending.items():
+        row = stored.get(key)
+        if row is None:
+            session.add(DurationSketch(pipeline_id=key[0], day=key[1], count=sketch.count, buckets=sketch.to_json()))
+        else:
+            merged = Sketch.from_row(row).merge(sketch)
+            row.count = merged.count
+            row.buckets = merged.to_json()
+
+def on_transaction(session, changes):
+    """Ingest hook: fold newly finished builds into their pipeline's daily sketch"""
+    pending: dict = {}
+    for change in changes:
+        if change.is_completion():
+            key = (change.pipeline_id, _day(change.result))
+            pending.setdefault(key, Sketch()).add(change.result.duration_seconds)
+    if pending:
+        merge_into(session, pending)
+
+def load(session, since: date, until: date, pipeline_ids=None) -> dict:
+    """Merge the daily sketches in [since, until] into one Sketch per pipeline id"""
+    stmt = select(DurationSketch).where(DurationSketch.day >= since, DurationSketch.day <= until)
+    if pipeline_ids is not None:
+        stmt = stmt.where(DurationSketch.pipeline_id.in_(pipeline_ids))
+    merged: dict = {}
+    for row in session.execute(stmt).scalars():
+        merged.setdefault(row.pipeline_id, Sketch()).merge(Sketch.from_row(row))
+    return merged
+
+def rebuild():
+    """Recompute every daily sketch by replaying the build event log, a chunk of pipelines per transaction"""
+    sketches = total = 0
+    for chunk in pipeline_chunks(DurationSketch):
+        with SessionLocal() as session:
+            # under the writers' lock: builds ingested meanwhile wait and then add on top
+            data_version.lock(session)
+            session.query(DurationSketch).where(DurationSketch.pipeline_id.in_(chunk)).delete(synchronize_session=False)
+            pending: dict = {}
+            for e in build_events.replay(session, pipeline_ids=chunk):
+                if e.duration_seconds is None or e.status_new in ACTIVE_STATUSES:
+                    continue
+                if e.status_old is not None and e.status_old not in ACTIVE_STATUSES:
+                    continue
+                finished = e.started_at + timedelta(seconds=e.duration_seconds) if e.started_at else e.occurred_at
+                pending.setdefault((e.pipeline_id, _day_of(finished)), Sketch()).add(e.duration_seconds)
+                total += 1
+            for (pipeline_id, day), sketch in pending.items():
+                session.add(DurationSketch(pipeline_id=pipeline_id, day=day, count=sketch.count, buckets=sketch.to_json()))
+            versions = data_version.bump(session, [], data_version.scopes_of_ids(session, chunk))
+            session.commit()
+        data_version.publish(versions)
+        sketches += len(pending)
+    print(f"Rebuilt {sketches} duration sketches from {total} completed builds")
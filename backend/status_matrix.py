@@ -0,0 +1,101 @@
+"""
+Pipelines x last N builds status matrix for wall dashboards.
+
+The whole matrix comes from one windowed query (row_number() over each
+pipeline's builds, newest first) and is kept per data version, so every wall
+polling the same view between two ingests shares one computation. Rows are
+left-padded to N, oldest build first, with code NO_BUILD / duration NO_DURATION
+where a pipeline has fewer builds.
+
+Binary encoding (little-endian):
+    b"CIMX" | u8 format version | u32 header length | header JSON
+    | rows*N u8 status codes | rows*N u32 durations in seconds
+where the header carries n, rows, the pipelines and the status code table.
+"""
+
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+from sqlalchemy import select, func
+from db import Build, STATUSES, status_code
+from responses import dumps
+import data_version
+
+NO_BUILD = 255
+NO_DURATION = 0xFFFFFFFF
+MAGIC = b"CIMX"
+FORMAT_VERSION = 1
+CACHE_SIZE = 32
+
+_cache: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+
+class Matrix:
+    __slots__ = ("n", "pipeline_ids", "codes", "durations")
+
+    def __init__(self, n: int, pipeline_ids: list[int], codes: array, durations: array):
+        self.n = n
+        self.pipeline_ids = pipeline_ids
+        self.codes = codes
+        self.durations = durations
+
+    def row(self, i: int) -> tuple[list, list]:
+        lo, hi = i * self.n, (i + 1) * self.n
+        return list(self.codes[lo:hi]), list(self.durations[lo:hi])
+
+def compute(session, n: int, pipeline_ids=None) -> Matrix:
+    ranked = select(
+        Build.pipeline_id, Build.status, Build.duration_seconds,
+        func.row_number().over(
+            partition_by=Build.pipeline_id, order_by=(Build.started_at.desc(), Build.id.desc())
+        ).label("rn"),
+    )
+    if pipeline_ids is not None:
+        ranked = ranked.where(Build.pipeline_id.in_(pipeline_ids))
+    ranked = ranked.subquery()
+    rows = session.execute(
+        select(ranked.c.pipeline_id, ranked.c.status, ranked.c.duration_seconds, ranked.c.rn)
+        .where(ranked.c.rn <= n)
+        .order_by(ranked.c.pipeline_id)
+    )
+    index: dict[int, int] = {}
+    ids: list[int] = []
+    codes = array("B")
+    durations = array("I")
+    for r in rows:
+        i = index.get(r.pipeline_id)
+        if i is None:
+            i = index[r.pipeline_id] = len(ids)
+            ids.append(r.pipeline_id)
+            codes.extend([NO_BUILD] * n)
+            durations.extend([NO_DURATION] * n)
+        slot = i * n + (n - r.rn)  # rn 1 (newest) lands in the last column
+        codes[slot] = status_code(r.status)
+        durations[slot] = r.duration_seconds if r.duration_seconds is not None and r.duration_seconds >= 0 else NO_DURATION
+    return Matrix(n, ids, codes, durations)
+
+def get(session, n: int, pipeline_ids=None, key=None) -> Matrix:
+    """Matrix for the current data version, computed at most once per version and `key`"""
+    cache_key = (key, n, data_version.current())
+    with _lock:
+        hit = _cache.get(cache_key)
+        if hit is not None:
+            _cache.move_to_end(cache_key)
+            return hit
+    matrix = compute(session, n, pipeline_ids)
+    with _lock:
+        _cache[cache_key] = matrix
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return matrix
+
+def encode_binary(matrix: Matrix, pipelines: list[dict]) -> bytes:
+    header = dumps({"n": matrix.n, "rows": len(pipelines), "statuses": STATUSES, "no_build": NO_BUILD,
+                    "no_duration": NO_DURATION, "pipelines": pipelines})
+    durations = array("I", matrix.durations)
+    if sys.byteorder == "big":
+        durations.byteswap()
+    return MAGIC + struct.pack("<BI", FORMAT_VERSION, len(header)) + header + matrix.codes.tobytes() + durations.tobytes()
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# modules read their configuration on import: run the suite on an embedded
+# SQLite database of its own unless the environment says otherwise
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="cicd-health-tests-"), "test.db"))
@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta, timezone
+
+import db
+import anomalies
+from collectors.base import CollectorResult, upsert_builds
+
+def test_events_are_stored_for_every_worker():
+    db.init_db(background_migrations=False)
+    start = datetime(2026, 3, 2, tzinfo=timezone.utc)
+    statuses = ["success"] * anomalies.MIN_BUILDS + ["failed"] * 5
+    upsert_builds([
+        CollectorResult("gitlab", "anomalies/spike", str(i), status, start + timedelta(hours=i), start + timedelta(hours=i, minutes=5), 300, None, updated_at=start + timedelta(hours=i))
+        for i, status in enumerate(statuses)
+    ])
+    raised = anomalies.drain()
+    assert [e["kind"] for e in raised] == ["failure_spike"]
+    # another worker has none of this process's memory, only the database
+    with db.SessionLocal() as session:
+        stored = anomalies.recent(session, 10)
+    assert stored[0] == raised[0]
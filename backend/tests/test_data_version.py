@@ -0,0 +1,24 @@
+from starlette.requests import Request
+
+import data_version
+
+def request(path: str, query: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": []})
+
+def test_substring_pipeline_filter_is_tagged_with_provider_scope(monkeypatch):
+    monkeypatch.setattr(data_version, "_versions", {
+        data_version.GLOBAL: 1, "provider:github": 1, "pipeline:github/foo": 1, "pipeline:github/foo-bar": 1,
+    })
+    query = request("/api/metrics/reliability", "provider=github&pipeline=foo&to=2026-01-01")
+    before = data_version._etag(query)
+    # a write to github/foo-bar changes what ?pipeline=foo matches
+    data_version.publish({data_version.GLOBAL: 2, "provider:github": 2, "pipeline:github/foo-bar": 2})
+    assert data_version._etag(query) != before
+
+def test_exact_pipeline_endpoint_is_tagged_with_pipeline_scope(monkeypatch):
+    monkeypatch.setattr(data_version, "_versions", {data_version.GLOBAL: 1, "provider:github": 1, "pipeline:github/foo": 1})
+    monkeypatch.setattr(data_version, "EXACT_PIPELINE_PATHS", ("/api/metrics/pipeline",))
+    query = request("/api/metrics/pipeline", "provider=github&pipeline=foo&to=2026-01-01")
+    before = data_version._etag(query)
+    data_version.publish({data_version.GLOBAL: 2, "provider:github": 2, "pipeline:github/foo-bar": 2})
+    assert data_version._etag(query) == before
@@ -0,0 +1,52 @@
+import os
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import db
+import export
+from collectors.base import CollectorResult, upsert_builds
+
+pytestmark = pytest.mark.skipif(not export.available(), reason="pyarrow is not installed")
+
+NOW = datetime.now(timezone.utc)
+
+def build(pipeline: str, external_id: str, status: str, age_days: int = 1) -> CollectorResult:
+    at = NOW - timedelta(days=age_days)
+    return CollectorResult("github", pipeline, external_id, status, at, at + timedelta(minutes=5), 300, None, updated_at=NOW)
+
+@pytest.fixture(autouse=True)
+def export_dir(tmp_path, monkeypatch):
+    db.init_db(background_migrations=False)
+    monkeypatch.setattr(export, "EXPORT_DIR", str(tmp_path))
+
+def exported_ids(entry) -> list[str]:
+    return sorted(
+        external_id for f in entry["files"]
+        for external_id in export.pq.read_table(os.path.join(export.EXPORT_DIR, "builds", f)).column("external_id").to_pylist()
+    )
+
+def test_incremental_snapshot_continues_from_recorded_version():
+    upsert_builds([build("export/a", f"a-{i}", "success", age_days=i) for i in range(1, 6)])
+    first = export.snapshot(full=True)
+    assert first["since_version"] is None and first["rows"] >= 5
+
+    upsert_builds([build("export/a", "a-1", "failed"), build("export/a", "a-6", "running", age_days=0)])
+    second = export.snapshot()
+    assert second["since_version"] == first["data_version"]
+    assert second["data_version"] > first["data_version"]
+    assert exported_ids(second) == ["a-1", "a-6"]
+
+    assert export.snapshot()["rows"] == 0
+
+def test_manifest_without_data_version_takes_a_full_snapshot():
+    upsert_builds([build("export/b", "b-1", "success")])
+    legacy = {"id": 1, "taken_at": NOW.isoformat(), "since": None, "rows": 0, "files": []}
+    manifest = export._manifest_path()
+    os.makedirs(os.path.dirname(manifest))
+    with open(manifest, "w") as f:
+        json.dump([legacy], f)
+    entry = export.snapshot()
+    assert entry["id"] == 2 and entry["since_version"] is None
+    assert "b-1" in exported_ids(entry)
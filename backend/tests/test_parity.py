@@ -0,0 +1,61 @@
+"""
+parity_check.py under pytest: the same builds loaded into one scratch database per
+storage configuration must be served identically as JSON, Arrow and Parquet.
+
+PARITY_CONFIGS names the configurations that must run, e.g. "sqlite,sqlite-duckdb"
+in a CI job that provides DuckDB: one that cannot run fails. Without it every
+configuration is tried and those unavailable here are reported as skipped.
+"""
+
+import os
+import shutil
+import argparse
+import tempfile
+
+import pytest
+
+import export
+import parity_check
+
+REQUIRED = [n.strip() for n in os.getenv("PARITY_CONFIGS", "").split(",") if n.strip()]
+NAMES = REQUIRED or list(parity_check.CONFIGS)
+REFERENCE = "sqlite"
+
+pytestmark = pytest.mark.skipif(not export.available(), reason="pyarrow is not installed")
+
+@pytest.fixture(scope="module")
+def documents() -> dict:
+    """name -> (document, reason it was skipped, error it failed with)"""
+    unknown = set(NAMES) - set(parity_check.CONFIGS)
+    if unknown:
+        pytest.fail(f"unknown PARITY_CONFIGS: {', '.join(sorted(unknown))}")
+    workdir = tempfile.mkdtemp(prefix="cicd-parity-")
+    args = argparse.Namespace(postgres_db=os.getenv("PARITY_POSTGRES_DB", "cicd_parity"), keep=False, verbose=False)
+    out = {}
+    try:
+        for name in dict.fromkeys([REFERENCE, *NAMES]):
+            try:
+                out[name] = (*parity_check.run(name, workdir, args), None)
+            except SystemExit as e:  # the child process failed
+                out[name] = (None, None, str(e))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return out
+
+def document(documents: dict, name: str) -> dict:
+    doc, skipped, error = documents[name]
+    if error:
+        pytest.fail(error)
+    if skipped:
+        if name in REQUIRED:
+            pytest.fail(f"{name} is required by PARITY_CONFIGS but could not run: {skipped}")
+        pytest.skip(f"{name}: {skipped}")
+    return doc
+
+@pytest.mark.parametrize("name", NAMES)
+def test_formats_describe_the_same_builds(documents, name):
+    assert parity_check.format_errors(name, document(documents, name)) == []
+
+@pytest.mark.parametrize("name", [n for n in NAMES if n != REFERENCE])
+def test_serves_the_same_as_sqlite(documents, name):
+    assert parity_check.backend_differences(document(documents, REFERENCE), document(documents, name)) == []
@@ -0,0 +1,103 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from collectors import ratelimit
+from collectors.ratelimit import Limiter, CircuitOpen
+
+def half_open() -> Limiter:
+    """A limiter whose circuit has tripped and whose backoff is over: the next request is the probe"""
+    limiter = Limiter("test")
+    limiter.failures = ratelimit.BREAKER_THRESHOLD
+    limiter.open_until = time.time() - 1
+    assert limiter.state() == "half-open"
+    return limiter
+
+def client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+def ok(request):
+    return httpx.Response(200)
+
+async def _request(limiter: Limiter, handler) -> httpx.Response:
+    async with client(handler) as c:
+        return await limiter.request(c, "GET", "https://ci.example/api")
+
+def test_probe_success_closes_circuit():
+    limiter = half_open()
+    assert asyncio.run(_request(limiter, ok)).status_code == 200
+    assert limiter.state() == "closed" and not limiter.probing
+
+def test_second_request_rejected_while_probing():
+    limiter = half_open()
+
+    async def main():
+        started = asyncio.Event()
+
+        async def slow(request):
+            started.set()
+            await asyncio.sleep(10)
+            return httpx.Response(200)
+
+        probe = asyncio.create_task(_request(limiter, slow))
+        await started.wait()
+        with pytest.raises(CircuitOpen):
+            await _request(limiter, ok)
+        probe.cancel()
+
+    asyncio.run(main())
+
+def test_cancelled_probe_request_releases_circuit():
+    limiter = half_open()
+
+    async def main():
+        started = asyncio.Event()
+
+        async def hang(request):
+            started.set()
+            await asyncio.sleep(10)
+            return httpx.Response(200)
+
+        probe = asyncio.create_task(_request(limiter, hang))
+        await started.wait()
+        probe.cancel()  # e.g. ingest cancelling producers after a failed flush
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not limiter.probing
+        return await _request(limiter, ok)
+
+    assert asyncio.run(main()).status_code == 200
+    assert limiter.state() == "closed"
+
+def test_cancelled_paced_probe_releases_circuit():
+    limiter = half_open()
+    limiter.blocked_until = time.time() + 5  # the probe first waits in acquire()
+
+    async def main():
+        probe = asyncio.create_task(_request(limiter, ok))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not limiter.probing
+        limiter.blocked_until = 0
+        return await _request(limiter, ok)
+
+    assert asyncio.run(main()).status_code == 200
+
+def test_unexpected_probe_error_releases_circuit():
+    limiter = half_open()
+
+    def redirect_loop(request):
+        return httpx.Response(302, headers={"Location": str(request.url)})
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(redirect_loop), follow_redirects=True) as c:
+            with pytest.raises(httpx.TooManyRedirects):
+                await limiter.request(c, "GET", "https://ci.example/api")
+        assert not limiter.probing
+        return await _request(limiter, ok)
+
+    assert asyncio.run(main()).status_code == 200
@@ -0,0 +1,60 @@
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import db
+import rollups
+from collectors.base import CollectorResult, upsert_builds
+from db import SessionLocal
+
+BERLIN = ZoneInfo("Europe/Berlin")
+TODAY = datetime.now(BERLIN).date()
+START = rollups.local_midnight(TODAY - timedelta(days=30), BERLIN)
+END = rollups.local_midnight(TODAY + timedelta(days=1), BERLIN)
+
+@pytest.fixture(autouse=True, scope="module")
+def builds():
+    db.init_db(background_migrations=False)
+    now = datetime.now(timezone.utc)
+    # through each day, including around local midnight where Berlin and UTC days disagree
+    upsert_builds([
+        CollectorResult("jenkins", "rollups/zones", f"{day}-{hour}", "success", START + timedelta(days=day, hours=hour, minutes=30), None, 60, None, updated_at=now)
+        for day in range(30) for hour in (0, 6, 12, 23)
+    ])
+
+def series(tz: str = "Europe/Berlin") -> dict:
+    with SessionLocal() as session:
+        return rollups.series(session, START, END, tz, "1d", provider="jenkins")
+
+def wait_ready(tz: str):
+    deadline = time.monotonic() + 30
+    while tz not in rollups._zones["ready"]:
+        assert time.monotonic() < deadline, f"{tz} was not backfilled"
+        time.sleep(0.05)
+
+def test_first_query_in_a_zone_registers_and_backfills_it():
+    first = series()
+    assert first["resolution"] == "1h" and first["local_rollups"] == "backfilling"
+    wait_ready("Europe/Berlin")
+    second = series()
+    assert second["resolution"] == "1d@Europe/Berlin" and second["local_rollups"] == "ready"
+    assert second["points"] == first["points"]
+    assert second["rollup_rows"] <= 31 < 120 <= first["rollup_rows"]
+
+def test_writes_after_backfill_reach_local_rollups():
+    wait_ready("Europe/Berlin")
+    before = series()["points"][-2]["builds"]
+    yesterday = rollups.local_midnight(TODAY - timedelta(days=1), BERLIN) + timedelta(minutes=10)
+    upsert_builds([CollectorResult("jenkins", "rollups/zones", "late", "failed", yesterday, None, 5, None, updated_at=yesterday)])
+    assert series()["points"][-2]["builds"] == before + 1
+
+def test_requested_zones_are_capped(monkeypatch):
+    monkeypatch.setattr(rollups, "MAX_REQUESTED_ZONES", 0)
+    body = series("Asia/Tokyo")
+    assert body["resolution"] == "1h" and body["local_rollups"] == "unavailable"
+    assert "Asia/Tokyo" not in rollups._zones["all"]
+
+def test_utc_days_need_no_local_rollups():
+    assert series("UTC")["local_rollups"] is None
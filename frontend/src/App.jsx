@@ -77,6 +77,8 @@ export default function App(){
               <option value={7}>7 days</option>
               <option value={14}>14 days</option>
               <option value={30}>30 days</option>
+              <option value={90}>90 days</option>
+              <option value={365}>1 year</option>
             </select>
           </label>
           <label>
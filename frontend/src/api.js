@@ -50,6 +50,22 @@ export async function fetchBuildTrends(days = 14) {
   }
 }
 
+export async function fetchTimeseries({ from, to, step, tz, maxPoints, provider } = {}) {
+  try {
+    const params = new URLSearchParams()
+    Object.entries({ from, to, step, tz, max_points: maxPoints, provider }).forEach(([key, value]) => {
+      if (value) params.append(key, value)
+    })
+
+    const response = await fetch(`${API_BASE}/api/metrics/timeseries?${params}`)
+    if (!response.ok) throw new Error('Failed to fetch timeseries')
+    return await response.json()
+  } catch (error) {
+    console.error('Error fetching timeseries:', error)
+    return null
+  }
+}
+
 export async function fetchPipelinePerformance(limit = 10) {
   try {
     const response = await fetch(`${API_BASE}/api/metrics/pipeline-performance?limit=${limit}`)
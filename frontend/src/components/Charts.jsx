@@ -1,7 +1,25 @@
 
 import React, { useState, useEffect } from 'react'
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, BarChart, Bar, AreaChart, Area, PieChart, Pie, Cell } from 'recharts'
-import { fetchChartData, fetchBuildTrends, fetchPipelinePerformance } from '../api'
+import { fetchTimeseries, fetchPipelinePerformance } from '../api'
+
+const TIMEZONE = Intl.DateTimeFormat().resolvedOptions().timeZone
+
+// Server-side downsampled series for the last `days`, labelled for the step the server chose
+async function loadSeries(days, maxPoints) {
+  const to = new Date()
+  const from = new Date(to.getTime() - days * 24 * 3600 * 1000)
+  const series = await fetchTimeseries({ from: from.toISOString(), to: to.toISOString(), tz: TIMEZONE, maxPoints })
+  if (!series) return []
+  const intraday = /[mh]$/.test(series.step)
+  return series.points.map(point => {
+    const time = new Date(point.time)
+    const label = intraday
+      ? time.toLocaleString([], { month: 'short', day: 'numeric', hour: '2-digit', minute: '2-digit' })
+      : time.toLocaleDateString([], { month: 'short', day: 'numeric', year: days > 180 ? '2-digit' : undefined })
+    return { ...point, time: label }
+  })
+}
 
 export function SuccessFailureChart({ data, days = 7 }){
   const [chartData, setChartData] = useState([])
@@ -11,7 +29,7 @@ export function SuccessFailureChart({ data, days = 7 }){
     async function loadChartData() {
       setLoading(true)
       try {
-        const apiData = await fetchChartData(days)
+        const apiData = await loadSeries(days, 60)
         if (apiData && apiData.length > 0) {
           setChartData(apiData)
         } else {
@@ -99,7 +117,7 @@ export function AvgBuildTimeChart({ data, days = 7 }){
     async function loadChartData() {
       setLoading(true)
       try {
-        const apiData = await fetchChartData(days)
+        const apiData = await loadSeries(days, 60)
         if (apiData && apiData.length > 0) {
           setChartData(apiData)
         } else {
@@ -162,6 +180,7 @@ export function AvgBuildTimeChart({ data, days = 7 }){
               fill="#8884d8" 
               fillOpacity={0.3}
               strokeWidth={2} 
+              connectNulls
             />
           </AreaChart>
         </ResponsiveContainer>
@@ -189,7 +208,7 @@ export function BuildTrendsChart({ days = 14 }){
     async function loadTrendData() {
       setLoading(true)
       try {
-        const apiData = await fetchBuildTrends(days)
+        const apiData = await loadSeries(days, 120)
         setChartData(apiData)
       } catch (error) {
         console.error('Error loading trend data:', error)
@@ -227,19 +246,19 @@ export function BuildTrendsChart({ days = 14 }){
         <ResponsiveContainer width="100%" height="180">
           <LineChart data={chartData}>
             <CartesianGrid strokeDasharray="3 3" />
-            <XAxis dataKey="date" />
+            <XAxis dataKey="time" />
             <YAxis />
             <Tooltip 
               formatter={(value, name) => [
-                name === 'total_builds' ? value : name === 'avg_duration' ? `${Math.round(value)}s` : value,
-                name === 'total_builds' ? 'Total Builds' : name === 'success_count' ? 'Success' : name === 'failure_count' ? 'Failed' : 'Avg Duration'
+                name === 'builds' ? value : name === 'avg_duration' ? `${Math.round(value)}s` : value,
+                name === 'builds' ? 'Total Builds' : name === 'success' ? 'Success' : name === 'failed' ? 'Failed' : 'Avg Duration'
               ]}
               labelStyle={{ color: 'var(--text)' }}
             />
             <Legend />
-            <Line type="monotone" dataKey="total_builds" stroke="#8884d8" strokeWidth={2} name="Total Builds" />
-            <Line type="monotone" dataKey="success_count" stroke="#1bc47d" strokeWidth={2} name="Success" />
-            <Line type="monotone" dataKey="failure_count" stroke="#ef476f" strokeWidth={2} name="Failed" />
+            <Line type="monotone" dataKey="builds" stroke="#8884d8" strokeWidth={2} name="Total Builds" />
+            <Line type="monotone" dataKey="success" stroke="#1bc47d" strokeWidth={2} name="Success" />
+            <Line type="monotone" dataKey="failed" stroke="#ef476f" strokeWidth={2} name="Failed" />
           </LineChart>
         </ResponsiveContainer>
       ) : (
@@ -0,0 +1,4 @@
+#!/bin/sh
+# Runs once when the primary's data volume is initialised (docker-compose.replica.yml):
+# let the replica stream WAL with the application credentials
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
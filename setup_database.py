@@ -139,7 +139,7 @@ def main():
     parser = argparse.ArgumentParser(description='CI/CD Dashboard Database Setup Tool')
     parser.add_argument('--skip-docker', action='store_true', 
                        help='Skip Docker checks and PostgreSQL startup')
-    parser.add_argument('--action', choices=['setup', 'init', 'seed', 'reset', 'clear'], 
+    parser.add_argument('--action', choices=['setup', 'init', 'seed', 'reset', 'clear', 'backfill', 'compact', 'migrate'], 
                        default='setup', help='Action to perform')
     
     args = parser.parse_args()